@@ -1,22 +1,35 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from app.config import Config
+from app.database import engine_options, install_sqlite_pragmas
+from app.instrumentation import instrument_engine
 
 db = SQLAlchemy()
 
 
-def create_app():
+def create_app(config=None):
+    """Build the app without touching the database.
+
+    Schema creation and seeding are explicit steps (``flask db init``,
+    ``flask seed``), so booting a worker costs imports only.
+    """
     app = Flask(__name__)
-    app.config["SECRET_KEY"] = "dev-key-change-in-production"
-    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///tracker.db"
-    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config.from_object(Config)
+    if config:
+        app.config.update(config)
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(app.config))
 
     db.init_app(app)
+    with app.app_context():
+        install_sqlite_pragmas(db.engine, app.config)
+        instrument_engine(db.engine)
 
     from app.routes import main
+    from app.assets import assets
     app.register_blueprint(main)
+    app.register_blueprint(assets)
 
-    with app.app_context():
-        from app import models  # noqa: F401
-        db.create_all()
+    from app.cli import register_commands
+    register_commands(app)
 
     return app
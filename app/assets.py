@@ -0,0 +1,217 @@
+"""Fingerprinted static assets and response compression.
+
+Templates link static files with ``asset_url("css/style.css")``, which
+returns ``/assets/css/style.<hash>.css``: the name carries the first 12 hex
+digits of the file's SHA-256, so a changed file gets a new URL and every URL
+can be cached for a year with ``Cache-Control: immutable``. Third-party
+scripts are vendored under ``static/vendor`` (Chart.js 4.4.0, MIT) so pages
+work without internet access.
+
+Each asset is read once per process and held in memory together with its
+compressed variants: ``<file>.br`` and ``<file>.gz`` written by ``flask
+assets build`` (run it at deploy; brotli needs the optional ``brotli``
+package), or, failing those, gzip compressed on first use. A request for an
+out-of-date hash (a page rendered before a deploy) gets the current file,
+uncached.
+
+``compress_responses(blueprint)`` gzips (or brotli-compresses) the
+blueprint's HTML, JSON and text responses for clients that accept it.
+Responses with a strong ETag (the cached pages) get a weak ETag instead. The
+compressed body is kept by ETag, so a cached page is compressed once, not
+on every hit.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from collections import namedtuple
+from functools import cache
+from flask import Blueprint, abort, current_app, request, url_for
+from werkzeug.security import safe_join
+from app.cache import LRUBackend
+
+DIGEST_LENGTH = 12
+COMPRESSIBLE = {"text/html", "application/json", "text/plain", "text/css",
+                "text/javascript", "application/javascript", "image/svg+xml"}
+_FINGERPRINTED = re.compile(rf"^(?P<stem>.+)\.(?P<digest>[0-9a-f]{{{DIGEST_LENGTH}}})"
+                            rf"(?P<ext>\.[^./]+)$")
+
+Asset = namedtuple("Asset", "digest mimetype mtime_ns size bodies")  # bodies: {encoding: bytes}
+
+assets = Blueprint("assets", __name__)
+_assets = {}  # static-relative filename -> Asset
+_lock = threading.Lock()
+_compressed = LRUBackend(max_entries=256)  # (etag, encoding) -> compressed response body
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+@cache
+def encoders():
+    """Return {encoding: compress(data, fast)} for the encodings this process can produce."""
+    found = {"gzip": lambda data, fast: gzip.compress(data, 6 if fast else 9, mtime=0)}
+    brotli = _brotli()
+    if brotli is not None:
+        found["br"] = lambda data, fast: brotli.compress(data, quality=4 if fast else 11)
+    return found
+
+
+def _negotiate(available):
+    """Pick the client's preferred encoding from ``available`` (None for identity)."""
+    accepted = request.accept_encodings
+    best = max(available, key=lambda enc: (accepted[enc], enc == "br"), default=None)
+    return best if best is not None and accepted[best] > 0 else None
+
+
+# ---------------------------------------------------------------------------
+# Fingerprinting
+# ---------------------------------------------------------------------------
+def load_asset(filename):
+    """Return the Asset for a static-relative ``filename`` (None if missing).
+
+    Reloaded whenever the file's mtime or size changes.
+    """
+    path = safe_join(current_app.static_folder, filename)
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    asset = _assets.get(filename)
+    if asset is not None and (asset.mtime_ns, asset.size) == (stat.st_mtime_ns, stat.st_size):
+        return asset
+
+    with _lock:
+        with open(path, "rb") as fh:
+            body = fh.read()
+        bodies = {None: body}
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        if mimetype in COMPRESSIBLE:
+            for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+                try:
+                    if os.stat(path + suffix).st_mtime_ns >= stat.st_mtime_ns:
+                        with open(path + suffix, "rb") as fh:
+                            bodies[encoding] = fh.read()
+                except OSError:
+                    pass
+            if "gzip" not in bodies:
+                bodies["gzip"] = encoders()["gzip"](body, False)
+        asset = Asset(hashlib.sha256(body).hexdigest()[:DIGEST_LENGTH], mimetype,
+                      stat.st_mtime_ns, stat.st_size, bodies)
+        _assets[filename] = asset
+    return asset
+
+
+def fingerprinted_name(filename, digest):
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}.{digest}{ext}"
+
+
+def asset_url(filename):
+    """Template global: the content-hashed URL for a file under ``static/``."""
+    asset = load_asset(filename)
+    if asset is None:
+        return url_for("static", filename=filename)
+    return url_for("assets.asset", filename=fingerprinted_name(filename, asset.digest))
+
+
+assets.add_app_template_global(asset_url)
+
+
+# ---------------------------------------------------------------------------
+# Serving
+# ---------------------------------------------------------------------------
+@assets.route("/assets/<path:filename>")
+def asset(filename):
+    match = _FINGERPRINTED.match(filename)
+    if not match:
+        abort(404)
+    source = match["stem"] + match["ext"]
+    found = load_asset(source)
+    if found is None:
+        abort(404)
+
+    encoding = _negotiate([enc for enc in found.bodies if enc is not None])
+    response = current_app.response_class(found.bodies[encoding], mimetype=found.mimetype)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    if len(found.bodies) > 1:
+        response.vary.add("Accept-Encoding")
+    response.set_etag(found.digest + (f"-{encoding}" if encoding else ""))
+    if match["digest"] == found.digest:
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config["ASSET_MAX_AGE"]
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True  # an old URL: don't pin today's file to it
+    return response.make_conditional(request)
+
+
+def build_assets():
+    """Write ``.gz`` (and ``.br``) beside every compressible static file; returns [(path, sizes)]."""
+    static = current_app.static_folder
+    encoding_suffix = {"gzip": ".gz", "br": ".br"}
+    built = []
+    for directory, _, files in os.walk(static):
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            if name.endswith((".gz", ".br")) or mimetypes.guess_type(name)[0] not in COMPRESSIBLE:
+                continue
+            with open(path, "rb") as fh:
+                body = fh.read()
+            sizes = {None: len(body)}
+            for encoding, compress in encoders().items():
+                data = compress(body, False)
+                with open(path + encoding_suffix[encoding], "wb") as fh:
+                    fh.write(data)
+                sizes[encoding] = len(data)
+            built.append((os.path.relpath(path, static), sizes))
+    _assets.clear()
+    return built
+
+
+# ---------------------------------------------------------------------------
+# Response compression
+# ---------------------------------------------------------------------------
+def compress_response(response):
+    """Compress a buffered 200 response for a client that accepts gzip or br."""
+    config = current_app.config
+    if (not config["COMPRESS_RESPONSES"] or response.status_code != 200
+            or response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers or response.mimetype not in COMPRESSIBLE):
+        return response
+    response.vary.add("Accept-Encoding")
+    available = encoders()
+    encoding = _negotiate(available)
+    data = response.get_data()
+    if encoding is None or len(data) < config["COMPRESS_MIN_BYTES"]:
+        return response
+
+    etag, weak = response.get_etag()
+    key = (etag, encoding) if etag and not weak else None
+    body = _compressed.get(key) if key else None
+    if body is None:
+        body = available[encoding](data, True)
+        if key:
+            _compressed.set(key, body, config["CACHE_TIMEOUT"])
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    if etag:
+        # Same entity, different bytes: a strong ETag no longer fits
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def compress_responses(blueprint):
+    """Compress ``blueprint``'s responses (see compress_response())."""
+    blueprint.after_request(compress_response)
@@ -0,0 +1,195 @@
+"""Incrementally maintained aggregates of ``price_records`` prices.
+
+A ``PriceBuckets`` describes one derived table that keeps, per key, the
+count and sum of the sale prices (optionally their min and max) plus a
+t-digest of them — ``price_rollups`` keys by (variant, condition, month),
+``price_sketches`` by (variant, condition). It owns the shared maintenance:
+
+* inserted PriceRecords (ORM flushes and bulk inserts) are folded into their
+  bucket with one read and one executemany each for updates and inserts;
+* an edited or deleted record makes its old and new buckets be re-derived
+  from ``price_records``;
+* ``rebuild()`` recomputes the whole table in one pass.
+"""
+
+from sqlalchemy import and_, bindparam, event, inspect, or_, select, tuple_
+from app import db
+from app.models import PriceRecord
+from app.sketch import TDigest
+from app.stats import old_values
+
+
+def condition_match(condition):
+    """Filter for the records of one bucket condition ("" covers unrecorded ones)."""
+    if not condition:
+        return or_(PriceRecord.condition.is_(None), PriceRecord.condition == "")
+    return PriceRecord.condition == condition
+
+
+class PriceBuckets:
+    """One table of per-key price aggregates kept current from ``price_records``.
+
+    ``key(values)`` maps a record's ``key_fields`` to the tuple of the table's
+    ``key_columns``; ``records_where(key)`` selects the records of one bucket.
+    """
+
+    def __init__(self, model, key_columns, key_fields, key, records_where, compression,
+                 extremes=False):
+        self.table = model.__table__
+        self.key_columns = key_columns
+        self.key_fields = key_fields
+        self.tracked = key_fields + ("price_gbp",)
+        self.key = key
+        self.records_where = records_where
+        self.compression = compression
+        self.extremes = extremes
+        self.info_key = f"{self.table.name}_recompute"
+
+    # -----------------------------------------------------------------------
+    # Maintenance
+    # -----------------------------------------------------------------------
+    def add_records(self, connection, rows):
+        """Fold price rows (dicts of ``key_fields`` and price_gbp) into their buckets."""
+        grouped = {}
+        for values in rows:
+            grouped.setdefault(self.key(values), []).append(values["price_gbp"])
+        if not grouped:
+            return
+        table = self.table
+        columns = [table.c[name] for name in self.key_columns]
+        existing = {
+            tuple(row._mapping[name] for name in self.key_columns): row
+            for row in connection.execute(
+                select(table).where(tuple_(*columns).in_(list(grouped))).with_for_update()
+            )
+        }
+
+        inserts, updates = [], []
+        for key, prices in grouped.items():
+            row = existing.get(key)
+            if row is None:
+                inserts.append(self.bucket_values(key, prices))
+                continue
+            digest = TDigest.from_bytes(row.sketch, self.compression).update(prices)
+            values = {f"k_{name}": part for name, part in zip(self.key_columns, key)}
+            values.update(count=row.count + len(prices), total=row.total + sum(prices),
+                          sketch=digest.to_bytes())
+            if self.extremes:
+                values.update(min_price=min(row.min_price, min(prices)),
+                              max_price=max(row.max_price, max(prices)))
+            updates.append(values)
+        if updates:
+            connection.execute(
+                table.update().where(*[c == bindparam(f"k_{c.name}") for c in columns]),
+                updates,
+            )
+        if inserts:
+            connection.execute(table.insert(), inserts)
+
+    def recompute(self, connection, keys):
+        """Re-derive the given buckets from their ``price_records``."""
+        for key in keys:
+            prices = connection.execute(
+                select(PriceRecord.price_gbp).where(self.records_where(key))
+            ).scalars().all()
+            connection.execute(self.table.delete().where(self._where(key)))
+            if prices:
+                connection.execute(self.table.insert().values(self.bucket_values(key, prices)))
+
+    def rebuild(self, batch_size=1000):
+        """Recompute the whole table from ``price_records``; returns the bucket count."""
+        buckets = {}
+        rows = db.session.execute(
+            select(*[getattr(PriceRecord, f) for f in self.tracked])
+            .execution_options(yield_per=10000)
+        )
+        for row in rows:
+            values = row._asdict()
+            price = values["price_gbp"]
+            key = self.key(values)
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = [0, 0, price, price, TDigest(self.compression)]
+            bucket[0] += 1
+            bucket[1] += price
+            bucket[2] = min(bucket[2], price)
+            bucket[3] = max(bucket[3], price)
+            bucket[4].add(price)
+
+        db.session.execute(self.table.delete())
+        values = []
+        for key, (count, total, lo, hi, digest) in buckets.items():
+            row = dict(zip(self.key_columns, key), count=count, total=total,
+                       sketch=digest.to_bytes())
+            if self.extremes:
+                row.update(min_price=lo, max_price=hi)
+            values.append(row)
+        for i in range(0, len(values), batch_size):
+            db.session.execute(self.table.insert(), values[i:i + batch_size])
+        db.session.commit()
+        return len(values)
+
+    def missing(self):
+        """True when ``price_records`` has rows but this table has not been built yet."""
+        has_records = db.session.execute(select(PriceRecord.id).limit(1)).first() is not None
+        has_buckets = db.session.execute(select(self.table.c.variant_id).limit(1)).first()
+        return has_records and has_buckets is None
+
+    def record_bulk_insert(self, model, rows, connection=None):
+        """Fold rows inserted with a bulk statement that skipped the ORM events."""
+        if model is PriceRecord and rows:
+            self.add_records(connection if connection is not None else db.session.connection(),
+                             rows)
+
+    def bucket_values(self, key, prices):
+        values = dict(zip(self.key_columns, key))
+        values.update(count=len(prices), total=sum(prices),
+                      sketch=TDigest(self.compression).update(prices).to_bytes())
+        if self.extremes:
+            values.update(min_price=min(prices), max_price=max(prices))
+        return values
+
+    def _where(self, key):
+        return and_(*[self.table.c[name] == part for name, part in zip(self.key_columns, key)])
+
+    # -----------------------------------------------------------------------
+    # Session hooks
+    # -----------------------------------------------------------------------
+    def listen(self, session):
+        """Keep the table current from ORM flushes on ``session``."""
+        event.listen(session, "before_flush", self._capture_stale)
+        event.listen(session, "after_flush", self._apply_price_records)
+        event.listen(session, "after_rollback", self._discard_stale)
+
+    def _tracked_change(self, obj):
+        state = inspect(obj)
+        return any(state.attrs[key].history.has_changes() for key in self.tracked)
+
+    def _capture_stale(self, session, flush_context, instances):
+        stale = session.info.setdefault(self.info_key, set())
+        for obj in list(session.dirty) + list(session.deleted):
+            if not isinstance(obj, PriceRecord) or not inspect(obj).persistent:
+                continue
+            if obj in session.dirty and not self._tracked_change(obj):
+                continue
+            stale.add(self.key(old_values(session, obj, self.key_fields)))
+
+    def _apply_price_records(self, session, flush_context):
+        stale = session.info.pop(self.info_key, set())
+        added = []
+        for obj in session.new:
+            if isinstance(obj, PriceRecord):
+                added.append({key: getattr(obj, key) for key in self.tracked})
+        for obj in session.dirty:
+            if (isinstance(obj, PriceRecord) and obj not in session.deleted
+                    and self._tracked_change(obj)):
+                stale.add(self.key({key: getattr(obj, key) for key in self.key_fields}))
+        if not stale and not added:
+            return
+        connection = session.connection()
+        # A recomputed bucket already sees this flush's inserts
+        self.add_records(connection, [row for row in added if self.key(row) not in stale])
+        self.recompute(connection, stale)
+
+    def _discard_stale(self, session):
+        session.info.pop(self.info_key, None)
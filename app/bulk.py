@@ -0,0 +1,53 @@
+"""Bulk writes that bypass the ORM unit of work.
+
+``session.execute(insert(Model), rows)`` runs as one executemany but fires no
+flush events, so the derived-data hooks are notified here instead.
+"""
+
+from sqlalchemy import insert, update
+from app import db
+from app import cache, changelog, deals, dedup, quantiles, rollups, stats, tasks
+from app.models import Listing, PriceRecord
+
+
+def bulk_insert(model, rows):
+    """Insert ``rows`` (list of column dicts) in one executemany, in the current transaction.
+
+    Returns the ids of the rows it wrote (in no particular order).
+    """
+    if not rows:
+        return []
+    table = model.__table__
+    ids = db.session.scalars(insert(table).returning(table.c.id), rows).all()
+    changelog.record_bulk_insert(model, ids)
+    stats.record_bulk_insert(model, rows)
+    rollups.record_bulk_insert(model, rows)
+    quantiles.record_bulk_insert(model, rows)
+    if model is PriceRecord:
+        deals.mark_stale(db.session, {row["variant_id"] for row in rows})
+    dedup.index_bulk_insert(model, ids)
+    cache.record_bulk_write(model)
+    tasks.record_bulk_insert(model)
+    return ids
+
+
+def bulk_close_listings(rows, sold_at):
+    """Mark listings sold in one UPDATE, in the current transaction.
+
+    ``rows`` are column dicts (id, variant_id) of listings that are currently
+    unsold; ORM objects already loaded for them are not refreshed.
+    """
+    if not rows:
+        return
+    db.session.execute(
+        update(Listing.__table__)
+        .where(Listing.id.in_([row["id"] for row in rows]), Listing.is_sold == False)  # noqa: E712
+        .values(is_sold=True, sold_at=sold_at)
+    )
+    stats.record_bulk_update(
+        Listing,
+        [{"variant_id": row["variant_id"], "is_sold": False} for row in rows],
+        [{"variant_id": row["variant_id"], "is_sold": True} for row in rows],
+    )
+    changelog.record_bulk_update(Listing, rows)
+    cache.record_bulk_write(Listing)
@@ -0,0 +1,281 @@
+"""Write-invalidated response and template fragment cache.
+
+The read pages (dashboard, registry, listings, market) change only when
+someone writes to the tables they are built from, so their rendered HTML is
+cached under a key made of the endpoint, the query string and a *data
+version*: a counter in ``reference_versions`` that the session hooks below
+bump, in the writing transaction, whenever a flush or bulk write touches
+``listings``, ``price_records``, ``registry_cars``, ``model_variants`` or
+``valuation_models``.
+Nothing is ever deleted on write; entries for an old version simply stop
+being asked for and age out of the backend. Because the version lives in the
+database, every worker (and a shared file backend) moves on at the same
+commit.
+
+Cached pages carry a strong ETag (a hash of the body) and are answered with
+304 when the browser already has them; a request sent with ``Cache-Control:
+no-cache`` (a hard reload) renders afresh. Inside a template, expensive repeated
+markup can be cached per key with::
+
+    {% call cached_fragment("market-variant", a.variant.id, recent) %}...{% endcall %}
+
+Entries also expire after ``CACHE_TIMEOUT`` seconds, which bounds how long
+anything that depends on the date (the market page's "recent" window) can
+lag. Backends are picked by ``CACHE_BACKEND``: ``lru`` (in-process, the
+default), ``file`` (``CACHE_DIR``, shared by the workers on one host) or
+``none``. Run ``flask cache clear`` after changing anything that alters the
+pages without writing those tables, such as the dedup or deal settings.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, has_request_context, make_response, request, session
+from markupsafe import Markup
+from sqlalchemy import event
+from app import db
+from app.models import Listing, ModelVariant, PriceRecord, RegistryCar, ValuationModel
+from app.reference import bump_version, current_version
+
+DATA_VERSION = "pages"
+TRACKED_MODELS = (Listing, PriceRecord, RegistryCar, ModelVariant, ValuationModel)
+_VERSION_KEY = "tracker.data_version"  # per-request, in the WSGI environ
+
+
+# ---------------------------------------------------------------------------
+# Backends
+# ---------------------------------------------------------------------------
+class LRUBackend:
+    """In-process store holding the ``max_entries`` most recently used values."""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._entries[key] = (time.time() + timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FileBackend:
+    """One pickle per key under ``directory``, shared by every worker on the host.
+
+    Writes go through a temporary file and ``os.replace`` so readers never see
+    a partial entry. Every ``PRUNE_EVERY`` writes the oldest files beyond
+    ``max_entries`` are removed.
+    """
+
+    PRUNE_EVERY = 64
+
+    def __init__(self, directory, max_entries=2048):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + ".cache")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as fh:
+                stored_key, expires, value = pickle.load(fh)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if stored_key != key or expires < time.time():
+            return None
+        return value
+
+    def set(self, key, value, timeout):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                pickle.dump((key, time.time() + timeout, value), fh, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            return
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        """Drop the least recently written entries beyond ``max_entries``."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".cache"):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+        entries.sort(reverse=True)
+        for _, path in entries[self.max_entries:]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith((".cache", ".tmp")):
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+
+
+BACKENDS = {
+    "lru": lambda config: LRUBackend(config["CACHE_MAX_ENTRIES"]),
+    "file": lambda config: FileBackend(
+        config.get("CACHE_DIR") or os.path.join(current_app.instance_path, "cache"),
+        config["CACHE_MAX_ENTRIES"]),
+    "none": lambda config: None,
+}
+
+
+def cache_backend():
+    """Return the app's backend (built on first use), or None when caching is off."""
+    extensions = current_app.extensions
+    if "page_cache" not in extensions:
+        name = current_app.config["CACHE_BACKEND"]
+        if name not in BACKENDS:
+            raise ValueError(f"CACHE_BACKEND must be one of {', '.join(BACKENDS)}, not {name!r}")
+        extensions["page_cache"] = BACKENDS[name](current_app.config)
+    return extensions["page_cache"]
+
+
+# ---------------------------------------------------------------------------
+# Data version
+# ---------------------------------------------------------------------------
+def data_version():
+    """The current data version, read once per request."""
+    environ = request.environ if has_request_context() else {}
+    if _VERSION_KEY not in environ:
+        environ[_VERSION_KEY] = current_version(db.session.connection(), DATA_VERSION)
+    return environ[_VERSION_KEY]
+
+
+def bump_data_version(connection=None):
+    """Move every cached page and fragment to a new key, in the current transaction."""
+    bump_version(connection if connection is not None else db.session.connection(), DATA_VERSION)
+
+
+def record_bulk_write(model, connection=None):
+    """Invalidate for rows written with a bulk statement that skipped the ORM events."""
+    if model in TRACKED_MODELS:
+        session = db.session()
+        if not session.info.get("data_version_bumped"):
+            bump_data_version(connection)
+            session.info["data_version_bumped"] = True
+
+
+# ---------------------------------------------------------------------------
+# Responses and fragments
+# ---------------------------------------------------------------------------
+def _request_key():
+    args = "&".join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+    return f"page:{data_version()}:{request.endpoint}?{args}"
+
+
+def cached_response(view):
+    """Serve a GET view from the cache, with a strong ETag and 304 revalidation."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        backend = cache_backend()
+        # Pending flash messages are rendered into the page, so it can't be shared
+        if backend is None or request.method != "GET" or "_flashes" in session:
+            return view(*args, **kwargs)
+
+        key = _request_key()
+        # A hard reload (Cache-Control: no-cache) re-renders and refreshes the entry
+        entry = None if request.cache_control.no_cache else backend.get(key)
+        status = "hit"
+        if entry is None:
+            status = "miss"
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+            body = response.get_data()
+            entry = (body, response.mimetype, hashlib.sha256(body).hexdigest()[:32])
+            backend.set(key, entry, current_app.config["CACHE_TIMEOUT"])
+
+        body, mimetype, etag = entry
+        response = current_app.response_class(body, mimetype=mimetype)
+        response.set_etag(etag)
+        # Browsers may keep the page but must revalidate it (cheaply, via the ETag)
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Cache"] = status
+        return response.make_conditional(request)
+    return wrapper
+
+
+def cached_fragment(name, *key, caller):
+    """Template global: render the ``{% call %}`` body once per (name, key, data version)."""
+    backend = cache_backend()
+    if backend is None:
+        return caller()
+    cache_key = f"fragment:{data_version()}:{name}:" + ":".join(map(str, key))
+    html = backend.get(cache_key)
+    if html is None:
+        html = str(caller())
+        backend.set(cache_key, html, current_app.config["CACHE_TIMEOUT"])
+    return Markup(html)
+
+
+def clear_cache():
+    """Invalidate every worker's pages (new data version) and empty this app's backend."""
+    bump_data_version()
+    db.session.commit()
+    backend = cache_backend()
+    if backend is not None:
+        backend.clear()
+
+
+# ---------------------------------------------------------------------------
+# Session hooks
+# ---------------------------------------------------------------------------
+@event.listens_for(db.session, "after_flush")
+def _bump_for_tracked_writes(session, flush_context):
+    if session.info.get("data_version_bumped"):
+        return
+    touched = list(session.new) + list(session.deleted) + [
+        obj for obj in session.dirty if session.is_modified(obj, include_collections=False)]
+    if any(isinstance(obj, TRACKED_MODELS) for obj in touched):
+        bump_data_version(session.connection())
+        session.info["data_version_bumped"] = True
+
+
+@event.listens_for(db.session, "after_commit")
+def _reset_after_commit(session):
+    session.info.pop("data_version_bumped", None)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _reset_after_rollback(session):
+    session.info.pop("data_version_bumped", None)
@@ -0,0 +1,289 @@
+"""Append-only log of writes to the source tables.
+
+Every insert, update and delete of a RegistryCar, Listing, PriceRecord or
+ModelVariant appends a ``change_log`` row, in the writing transaction:
+table, row id, operation, the variant the row belongs to and a sequence
+number that only grows. Anything that keeps a derived number (an in-process
+cache, an external report) can remember the last sequence number it has seen
+and later ask for just what changed since, instead of recomputing everything.
+
+* ``read_changes(position)`` returns the changes after ``position`` and the
+  position to resume from; in-process consumers keep the position themselves.
+* ``consume(name, handler)`` does the same for a named consumer whose
+  position is stored in ``change_log_consumers``, committing it after each
+  batch.
+
+The operation is a hint, not a history: compaction keeps only the newest
+entry per (table, row, variant), so a consumer may see a "U" for a row whose
+"I" it never saw, and should re-read the row (or its variant's aggregate)
+rather than replay operations. Compaction also purges entries every named
+consumer has processed once they are older than ``CHANGE_LOG_RETENTION_HOURS``;
+a consumer whose position falls behind the purge gets ``ChangeLogGap`` and
+must rebuild from scratch. Run it with ``flask changelog compact``.
+
+Sequence numbers are assigned in commit order because SQLite runs one write
+transaction at a time. On a server database with concurrent writers a
+reader could see a later number commit before an earlier one.
+"""
+
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, insert, inspect, literal, select
+from app import db
+from app.models import (
+    ChangeLogConsumer, ChangeLogEntry, Listing, ModelVariant, PriceRecord, ReferenceVersion,
+    RegistryCar,
+)
+from app.reference import current_version
+from app.stats import old_values
+
+TRACKED_MODELS = (RegistryCar, Listing, PriceRecord, ModelVariant)
+DEFAULT_BATCH = 1000
+_ID_CHUNK = 500  # ids per IN (...) when logging a bulk insert
+# reference_versions row holding the highest sequence number purged so far
+PURGED = "change_log_purged"
+
+Change = namedtuple("Change", "seq table row_id op variant_id")
+
+
+class ChangeLogGap(Exception):
+    """The entries after a consumer's position have been purged; rebuild instead."""
+
+
+def _variant_of(obj):
+    return obj.id if isinstance(obj, ModelVariant) else obj.variant_id
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def poll_interval():
+    """Seconds an in-process consumer may go between reads of the log."""
+    if not has_app_context():
+        return 0.0
+    return current_app.config.get("CHANGE_LOG_POLL_SECONDS", 5.0)
+
+
+# ---------------------------------------------------------------------------
+# Reading
+# ---------------------------------------------------------------------------
+def latest_seq(connection=None):
+    """The newest sequence number, purged or not (0 for an empty log)."""
+    connection = connection if connection is not None else db.session.connection()
+    newest = connection.execute(select(func.max(ChangeLogEntry.seq))).scalar() or 0
+    return max(newest, current_version(connection, PURGED))
+
+
+def read_changes(position, tables=None, limit=DEFAULT_BATCH):
+    """Return (changes after ``position``, position to resume from).
+
+    With ``tables`` only those tables' changes are returned, but the resume
+    position still moves past the others, so they aren't scanned again.
+    """
+    connection = db.session.connection()
+    if position < current_version(connection, PURGED):
+        raise ChangeLogGap(f"change log purged past position {position}")
+    end = latest_seq(connection)
+    query = (
+        select(ChangeLogEntry.seq, ChangeLogEntry.table_name, ChangeLogEntry.row_id,
+               ChangeLogEntry.op, ChangeLogEntry.variant_id)
+        .where(ChangeLogEntry.seq > position, ChangeLogEntry.seq <= end)
+        .order_by(ChangeLogEntry.seq)
+        .limit(limit)
+    )
+    if tables is not None:
+        query = query.where(ChangeLogEntry.table_name.in_(tables))
+    changes = [Change(*row) for row in connection.execute(query)]
+    if len(changes) == limit:
+        end = changes[-1].seq
+    return changes, end
+
+
+def consumer_position(name):
+    """Return a named consumer's position, or None if it isn't registered."""
+    consumer = db.session.get(ChangeLogConsumer, name)
+    return consumer.position if consumer is not None else None
+
+
+def register_consumer(name, position=None):
+    """Start tracking ``name`` at ``position`` (default: the end of the log)."""
+    consumer = db.session.get(ChangeLogConsumer, name)
+    if consumer is None:
+        consumer = ChangeLogConsumer(name=name)
+        db.session.add(consumer)
+    consumer.position = latest_seq() if position is None else position
+    db.session.commit()
+    return consumer.position
+
+
+def drop_consumer(name):
+    """Stop tracking ``name``, so it no longer holds back compaction."""
+    consumer = db.session.get(ChangeLogConsumer, name)
+    if consumer is not None:
+        db.session.delete(consumer)
+        db.session.commit()
+    return consumer is not None
+
+
+def consume(name, handler, tables=None, batch_size=DEFAULT_BATCH):
+    """Feed ``name``'s unseen changes to ``handler`` in batches; returns how many.
+
+    ``handler(changes)`` runs inside the transaction that advances the
+    consumer's position, so any writes it makes commit together with it. An
+    unregistered consumer is registered at the end of the log.
+    """
+    consumer = db.session.get(ChangeLogConsumer, name)
+    if consumer is None:
+        register_consumer(name)
+        return 0
+    processed = 0
+    while True:
+        try:
+            changes, position = read_changes(consumer.position, tables, batch_size)
+            if changes:
+                handler(changes)
+                processed += len(changes)
+            if position != consumer.position:
+                consumer.position = position
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        if len(changes) < batch_size:
+            return processed
+
+
+# ---------------------------------------------------------------------------
+# Compaction
+# ---------------------------------------------------------------------------
+def compact(retain_hours=None):
+    """Drop superseded entries, then purge old ones every consumer has seen.
+
+    Returns (superseded, purged) entry counts.
+    """
+    if retain_hours is None:
+        retain_hours = current_app.config["CHANGE_LOG_RETENTION_HOURS"]
+    table = ChangeLogEntry.__table__
+    connection = db.session.connection()
+
+    newest = (select(func.max(table.c.seq))
+              .group_by(table.c.table_name, table.c.row_id, table.c.variant_id))
+    superseded = connection.execute(table.delete().where(table.c.seq.not_in(newest))).rowcount
+
+    horizon = db.session.query(func.min(ChangeLogConsumer.position)).scalar()
+    if horizon is None:
+        horizon = latest_seq(connection)
+    cutoff = _now() - timedelta(hours=retain_hours)
+    purge = (table.c.seq <= horizon) & (table.c.changed_at < cutoff)
+    purged_through = connection.execute(select(func.max(table.c.seq)).where(purge)).scalar()
+    purged = 0
+    if purged_through is not None:
+        purged = connection.execute(table.delete().where(table.c.seq <= purged_through)).rowcount
+        _set_purged_through(connection, purged_through)
+    db.session.commit()
+    return superseded, purged
+
+
+def _set_purged_through(connection, seq):
+    # Purges only ever move forward: everything up to the previous one is already gone
+    versions = ReferenceVersion.__table__
+    result = connection.execute(
+        versions.update().where(versions.c.name == PURGED).values(version=seq))
+    if result.rowcount == 0:
+        connection.execute(versions.insert().values(name=PURGED, version=seq))
+
+
+def log_status():
+    """Return a dict describing the log and each named consumer's lag."""
+    connection = db.session.connection()
+    latest = latest_seq(connection)
+    return {
+        "entries": connection.execute(select(func.count()).select_from(ChangeLogEntry)).scalar(),
+        "latest": latest,
+        "purged_through": current_version(connection, PURGED),
+        "consumers": [
+            {"name": c.name, "position": c.position, "lag": latest - c.position,
+             "updated_at": c.updated_at}
+            for c in ChangeLogConsumer.query.order_by(ChangeLogConsumer.name)
+        ],
+    }
+
+
+# ---------------------------------------------------------------------------
+# Writing
+# ---------------------------------------------------------------------------
+def record_bulk_insert(model, ids):
+    """After a bulk insert: log the rows it wrote, given their ids."""
+    if model not in TRACKED_MODELS or not ids:
+        return
+    variant = model.id if model is ModelVariant else model.variant_id
+    changed_at = literal(_now(), ChangeLogEntry.changed_at.type)
+    ids = sorted(ids)
+    for i in range(0, len(ids), _ID_CHUNK):
+        db.session.connection().execute(
+            insert(ChangeLogEntry).from_select(
+                ["table_name", "row_id", "op", "variant_id", "changed_at"],
+                select(literal(model.__tablename__), model.id, literal("I"), variant, changed_at)
+                .where(model.id.in_(ids[i:i + _ID_CHUNK]))
+                .order_by(model.id),
+            )
+        )
+
+
+def record_bulk_update(model, rows):
+    """Log rows (dicts with id and variant_id) changed by a bulk UPDATE."""
+    if model not in TRACKED_MODELS or not rows:
+        return
+    changed_at = _now()
+    db.session.connection().execute(insert(ChangeLogEntry), [
+        {"table_name": model.__tablename__, "row_id": row["id"], "op": "U",
+         "variant_id": row["variant_id"], "changed_at": changed_at}
+        for row in rows
+    ])
+
+
+@event.listens_for(db.session, "before_flush")
+def _capture_moved_rows(session, flush_context, instances):
+    # The old variant may have expired at the last commit, leaving no history to read after
+    moved = session.info.setdefault("changelog_moved", {})
+    for obj in session.dirty:
+        if (isinstance(obj, TRACKED_MODELS) and not isinstance(obj, ModelVariant)
+                and inspect(obj).attrs.variant_id.history.has_changes()):
+            moved.setdefault(obj, old_values(session, obj, ("variant_id",))["variant_id"])
+
+
+@event.listens_for(db.session, "after_flush")
+def _log_flushed_rows(session, flush_context):
+    moved = session.info.pop("changelog_moved", {})
+    changed_at = _now()
+    entries = []
+
+    def log(obj, op, variant_id):
+        entries.append({"table_name": obj.__tablename__, "row_id": obj.id, "op": op,
+                        "variant_id": variant_id, "changed_at": changed_at})
+
+    for obj in session.new:
+        if isinstance(obj, TRACKED_MODELS):
+            log(obj, "I", _variant_of(obj))
+    for obj in session.deleted:
+        if isinstance(obj, TRACKED_MODELS):
+            log(obj, "D", _variant_of(obj))
+    for obj in session.dirty:
+        if not isinstance(obj, TRACKED_MODELS) or obj in session.deleted:
+            continue
+        if not session.is_modified(obj, include_collections=False):
+            continue
+        log(obj, "U", _variant_of(obj))
+        # A row moved between variants changes the old variant too
+        old = moved.get(obj)
+        if old is not None and old != obj.variant_id:
+            log(obj, "U", old)
+    if entries:
+        session.connection().execute(insert(ChangeLogEntry), entries)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _discard_moved_rows(session):
+    session.info.pop("changelog_moved", None)
@@ -0,0 +1,129 @@
+"""Market chart payloads: per-variant downsampling and columnar encoding.
+
+Each variant's sales are reduced to at most ``max_points`` real data points,
+either with Largest-Triangle-Three-Buckets (``lttb``, keeps the visual shape)
+or by keeping the cheapest and dearest sale in each bucket (``minmax``, keeps
+the price envelope). ``none`` sends every sale, up to ``RAW_MAX_POINTS`` in
+all; a wider range falls back to ``lttb`` and the payload's ``mode`` says so.
+Series are encoded as parallel arrays:
+
+    {"epoch": "1970-01-01", "conditions": ["unknown", "concours", ...],
+     "series": [{"name": "2002", "total": 9,
+                 "day": [19797, ...], "price": [18000, ...], "cond": [3, ...]}]}
+
+``day`` counts days since ``epoch``; ``cond`` indexes into ``conditions``.
+"""
+
+from datetime import date
+from app.market import price_history
+from app.models import CONDITION_CHOICES
+
+EPOCH = date(1970, 1, 1)
+CONDITIONS = ["unknown"] + [value for value, _ in CONDITION_CHOICES if value]
+DOWNSAMPLE_MODES = ("lttb", "minmax", "none")
+DEFAULT_MAX_POINTS = 500
+RAW_MAX_POINTS = 5000
+
+
+def chart_payload(variant_id=None, start=None, end=None,
+                  mode="lttb", max_points=DEFAULT_MAX_POINTS):
+    """Return the columnar chart payload for the given filters."""
+    condition_codes = {name: code for code, name in enumerate(CONDITIONS)}
+    epoch = EPOCH.toordinal()
+
+    rows = None
+    if mode == "none":
+        # One row past the cap tells a too-wide range apart from a full one
+        rows = price_history(variant_id, start, end, limit=RAW_MAX_POINTS + 1)
+        if len(rows) > RAW_MAX_POINTS:
+            mode, rows = "lttb", None
+    if rows is None:
+        rows = price_history(variant_id, start, end)
+
+    series = {}
+    for vname, sold_date, price_gbp, condition in rows:
+        columns = series.setdefault(vname, ([], [], []))
+        columns[0].append(sold_date.toordinal() - epoch)
+        columns[1].append(price_gbp)
+        columns[2].append(condition_codes.get(condition or "unknown", 0))
+
+    encoded = []
+    for vname, (days, prices, conds) in series.items():
+        total = len(days)
+        keep = downsample(days, prices, mode, max_points)
+        if keep is not None:
+            days = [days[i] for i in keep]
+            prices = [prices[i] for i in keep]
+            conds = [conds[i] for i in keep]
+        encoded.append({
+            "name": vname,
+            "total": total,
+            "day": days,
+            "price": prices,
+            "cond": conds,
+        })
+
+    return {
+        "epoch": EPOCH.isoformat(),
+        "conditions": CONDITIONS,
+        "mode": mode,
+        "series": encoded,
+    }
+
+
+def downsample(xs, ys, mode, max_points):
+    """Return the sorted indices to keep, or None to keep every point."""
+    if mode == "none" or len(xs) <= max_points:
+        return None
+    if mode == "minmax":
+        return minmax_indices(ys, max(1, max_points // 2))
+    return lttb_indices(xs, ys, max_points)
+
+
+def lttb_indices(xs, ys, threshold):
+    """Largest-Triangle-Three-Buckets: pick ``threshold`` shape-preserving points.
+
+    ``xs`` must be sorted ascending. The first and last points are always kept.
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    every = (n - 2) / (threshold - 2)
+    keep = [0]
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle vertex
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        span = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / span
+        avg_y = sum(ys[next_start:next_end]) / span
+
+        ax, ay = xs[a], ys[a]
+        best, best_area = None, -1.0
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        keep.append(best)
+        a = best
+    keep.append(n - 1)
+    return keep
+
+
+def minmax_indices(ys, buckets):
+    """Keep the min and max point of each of ``buckets`` equal-count buckets."""
+    n = len(ys)
+    if buckets * 2 >= n:
+        return list(range(n))
+    keep = []
+    for b in range(buckets):
+        lo, hi = b * n // buckets, (b + 1) * n // buckets
+        if lo == hi:
+            continue
+        bucket = range(lo, hi)
+        i_min = min(bucket, key=ys.__getitem__)
+        i_max = max(bucket, key=ys.__getitem__)
+        keep.extend(sorted({i_min, i_max}))
+    return keep
@@ -0,0 +1,400 @@
+"""Flask CLI commands for maintenance tasks."""
+
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+
+db_cli = AppGroup("db", help="Database schema management.")
+stats_cli = AppGroup("stats", help="Dashboard aggregate maintenance.")
+search_cli = AppGroup("search", help="Full-text search index maintenance.")
+dedup_cli = AppGroup("dedup", help="Duplicate listing detection.")
+rollups_cli = AppGroup("rollups", help="Monthly price rollup maintenance.")
+quantiles_cli = AppGroup("quantiles", help="Price quantile sketch maintenance.")
+cache_cli = AppGroup("cache", help="Page and fragment cache.")
+valuation_cli = AppGroup("valuation", help="Listing valuation model.")
+changelog_cli = AppGroup("changelog", help="Change log consumers and compaction.")
+jobs_cli = AppGroup("jobs", help="Background job queue.")
+assets_cli = AppGroup("assets", help="Static asset pipeline.")
+
+
+@db_cli.command("init")
+def db_init():
+    """Create missing tables and indexes (existing data is left alone)."""
+    from app.schema import init_database
+    created = init_database()
+    click.echo(f"Schema ready ({len(created)} indexes added).")
+
+
+@click.command("seed")
+@click.option("--init/--no-init", "init_schema", default=True, show_default=True,
+              help="Run 'db init' first.")
+@with_appcontext
+def seed_command(init_schema):
+    """Load the model variants and sample data into an empty database."""
+    from app.schema import init_database
+    from app.seed import seed_database
+    if init_schema:
+        init_database()
+    if seed_database():
+        click.echo("Seeded model variants and sample data.")
+    else:
+        click.echo("Database already seeded; nothing to do.")
+
+
+@stats_cli.command("rebuild")
+def stats_rebuild():
+    """Recompute the materialized variant_stats table from scratch."""
+    from app.stats import rebuild_variant_stats
+    n = rebuild_variant_stats()
+    click.echo(f"Rebuilt variant_stats for {n} variants.")
+
+
+@search_cli.command("rebuild")
+def search_rebuild():
+    """Rebuild and optimize the FTS5 search tables from the base tables."""
+    from app.search import rebuild_search_index
+    if rebuild_search_index():
+        click.echo("Rebuilt the search index.")
+    else:
+        click.echo("No FTS5 index on this database (run 'flask db init'); nothing to do.")
+
+
+@dedup_cli.command("rebuild")
+def dedup_rebuild():
+    """Re-fingerprint every listing and recompute the duplicate clusters."""
+    import time
+    from app.dedup import rebuild_index
+    t0 = time.perf_counter()
+    n = rebuild_index()
+    click.echo(f"Fingerprinted {n:,} listings in {time.perf_counter() - t0:.1f}s.")
+
+
+@rollups_cli.command("rebuild")
+def rollups_rebuild():
+    """Recompute the monthly price rollups from the price records."""
+    from app.rollups import rebuild_rollups
+    n = rebuild_rollups()
+    click.echo(f"Rebuilt {n:,} monthly price buckets.")
+
+
+@quantiles_cli.command("rebuild")
+def quantiles_rebuild():
+    """Recompute the per-variant, per-condition price sketches."""
+    from app.deals import baselines
+    from app.quantiles import rebuild_price_sketches
+    n = rebuild_price_sketches()
+    baselines.invalidate()
+    click.echo(f"Rebuilt {n:,} price sketches.")
+
+
+@cache_cli.command("clear")
+def cache_clear():
+    """Invalidate the cached pages in every worker."""
+    from app.cache import clear_cache
+    clear_cache()
+    click.echo("Cleared the page cache.")
+
+
+@valuation_cli.command("refit")
+@click.option("--full", is_flag=True, help="Refit every variant, not just those with new sales.")
+def valuation_refit(full):
+    """Refit the valuation model for variants whose sale records changed."""
+    import time
+    from app.valuation import refit
+    t0 = time.perf_counter()
+    variant_ids = refit(full=full)
+    click.echo(f"Refitted {len(variant_ids)} variants in {time.perf_counter() - t0:.1f}s.")
+
+
+@valuation_cli.command("show")
+def valuation_show():
+    """Print each variant's fitted condition multipliers and annual trend."""
+    import math
+    from app.reference import variant_cache
+    from app.valuation import CONDITIONS, model_cache
+    names = {v.id: v.name for v in variant_cache.rows()}
+    for model in model_cache.rows():
+        coefs = model.coefficients
+        conditions = ", ".join(f"{c} x{math.exp(coefs.get(f'condition_{c}', 0)):.2f}"
+                               for c in CONDITIONS)
+        click.echo(f"{names.get(model.variant_id, model.variant_id):<24} v{model.version}  "
+                   f"n={model.record_count:<7,} trend {math.expm1(coefs.get('sold', 0)):+.1%}/yr  "
+                   f"rmse {model.rmse:.2f}  {conditions}")
+
+
+@changelog_cli.command("status")
+def changelog_status():
+    """Show the log's size and how far behind each consumer is."""
+    from app.changelog import log_status
+    status = log_status()
+    click.echo(f"{status['entries']:,} entries, latest #{status['latest']}, "
+               f"purged through #{status['purged_through']}.")
+    for consumer in status["consumers"]:
+        click.echo(f"  {consumer['name']:<30} at #{consumer['position']} "
+                   f"({consumer['lag']:,} behind)")
+
+
+@changelog_cli.command("compact")
+@click.option("--retain-hours", type=float, default=None,
+              help="Keep processed entries this long (default: CHANGE_LOG_RETENTION_HOURS).")
+def changelog_compact(retain_hours):
+    """Drop superseded entries and purge old ones every consumer has processed."""
+    from app.changelog import compact
+    superseded, purged = compact(retain_hours)
+    click.echo(f"Removed {superseded:,} superseded and {purged:,} purged entries.")
+
+
+@changelog_cli.command("drop-consumer")
+@click.argument("name")
+def changelog_drop_consumer(name):
+    """Forget a consumer so it no longer holds back compaction."""
+    from app.changelog import drop_consumer
+    if drop_consumer(name):
+        click.echo(f"Dropped consumer {name}.")
+    else:
+        raise click.ClickException(f"No consumer named {name!r}.")
+
+
+@jobs_cli.command("status")
+@click.option("--recent", default=20, show_default=True, help="Jobs to list, newest first.")
+def jobs_status(recent):
+    """Show how many jobs are in each state and the newest ones."""
+    from app.jobs import job_status
+    status = job_status(recent)
+    click.echo(", ".join(f"{n:,} {name}" for name, n in status["counts"].items()) + ".")
+    for job in status["jobs"]:
+        outcome = job.error or job.result or ""
+        click.echo(f"  #{job.id:<6} {job.status:<8} {job.attempts}/{job.max_attempts}  "
+                   f"{job.key:<40} {outcome}")
+
+
+@jobs_cli.command("enqueue")
+@click.argument("name")
+@click.argument("args", nargs=-1)
+@click.option("--delay", type=float, default=0, help="Seconds before it may run.")
+def jobs_enqueue(name, args, delay):
+    """Queue a job, with arguments as KEY=VALUE (values are read as JSON if they parse)."""
+    import json
+    from app import db
+    from app.jobs import TASKS, enqueue, job_key
+    if name not in TASKS:
+        raise click.BadParameter(f"one of {', '.join(sorted(TASKS))}", param_hint="NAME")
+    kwargs = {}
+    for arg in args:
+        key, sep, value = arg.partition("=")
+        if not sep:
+            raise click.BadParameter(f"{arg!r} is not KEY=VALUE", param_hint="ARGS")
+        try:
+            kwargs[key] = json.loads(value)
+        except ValueError:
+            kwargs[key] = value
+    added = enqueue(name, kwargs, delay=delay)
+    db.session.commit()
+    key = job_key(name, kwargs)
+    click.echo(f"Queued {key}." if added else f"{key} is already queued.")
+
+
+@jobs_cli.command("work")
+@click.option("--forever", is_flag=True, help="Keep polling for new jobs instead of exiting.")
+def jobs_work(forever):
+    """Run due jobs in this process until the queue is empty."""
+    import time
+    from app.jobs import work
+    poll = current_app.config["JOBS_POLL_SECONDS"]
+    total = 0
+    while True:
+        ran = work()
+        total += ran
+        if not forever:
+            break
+        if not ran:
+            time.sleep(poll)
+    click.echo(f"Ran {total:,} jobs.")
+
+
+@jobs_cli.command("retry")
+@click.argument("job_id", type=int)
+def jobs_retry(job_id):
+    """Queue a failed job again."""
+    from app.jobs import retry
+    if not retry(job_id):
+        raise click.ClickException(f"Job #{job_id} isn't failed, or is already queued again.")
+    click.echo(f"Queued job #{job_id} again.")
+
+
+@jobs_cli.command("purge")
+@click.option("--older-than-hours", type=float, default=None,
+              help="Age of finished jobs to delete (default: JOBS_RETENTION_HOURS).")
+def jobs_purge(older_than_hours):
+    """Delete finished jobs."""
+    from app.jobs import purge
+    click.echo(f"Deleted {purge(older_than_hours):,} finished jobs.")
+
+
+@assets_cli.command("build")
+def assets_build():
+    """Write pre-compressed .gz (and .br, with brotli installed) copies of the static files."""
+    from app.assets import build_assets
+    for path, sizes in build_assets():
+        variants = ", ".join(f"{encoding} {size / 1024:,.1f} KiB"
+                             for encoding, size in sizes.items() if encoding)
+        click.echo(f"  {path:<40} {sizes[None] / 1024:8,.1f} KiB -> {variants}")
+
+
+@click.command("check-plans")
+@with_appcontext
+def check_plans():
+    """Fail if a read route's query plan scans a whole table or sorts a whole page set."""
+    from app.queryplan import check_routes, CHECKED_URLS, PAGINATED_URLS
+    failures = check_routes(current_app._get_current_object())
+    for url, statement, plan, problems in failures:
+        click.echo(f"{'; '.join(problems).upper()} on {url}:\n  {' '.join(statement.split())}",
+                   err=True)
+        for detail in plan:
+            click.echo(f"    {detail}", err=True)
+    if failures:
+        raise SystemExit(1)
+    click.echo(f"Checked {len(CHECKED_URLS)} routes and {len(PAGINATED_URLS)} next pages: "
+               "no full table scans or sorted pages.")
+
+
+@click.command("refresh-listings")
+@click.option("--site", help="Only re-check listings from this source site.")
+@click.option("--limit", type=int, help="Re-check at most this many listings.")
+@click.option("--min-age-hours", type=float,
+              help="Skip listings checked more recently (default: REFRESH_MIN_AGE_HOURS).")
+@with_appcontext
+def refresh_command(site, limit, min_age_hours):
+    """Re-fetch active listings' source pages and close the ones that have sold."""
+    from app.refresh import refresh_listings
+    report = refresh_listings(site=site, limit=limit, min_age_hours=min_age_hours)
+    outcomes = ", ".join(f"{n:,} {status}" for status, n in sorted(report.statuses.items()))
+    click.echo(f"Checked {report.checked:,} listings in {report.elapsed:.1f}s "
+               f"over {report.connections} connections" + (f": {outcomes}" if outcomes else "."))
+
+
+@click.command("import")
+@click.argument("kind", type=click.Choice(["listings", "prices"]))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(["csv", "jsonl"]),
+              help="Input format (default: from the file extension).")
+@click.option("--batch-size", default=1000, show_default=True,
+              help="Rows per executemany batch.")
+@click.option("--commit-every", default=10000, show_default=True,
+              help="Commit after this many accepted rows.")
+@click.option("--rejects", "rejects_path", type=click.Path(dir_okay=False),
+              help="Write rejected rows with their errors to this JSONL file.")
+@with_appcontext
+def import_command(kind, path, fmt, batch_size, commit_every, rejects_path):
+    """Stream listings or price records from a CSV/JSONL file into the database."""
+    import json
+    from app.importer import import_rows, read_rows
+
+    rejects_file = open(rejects_path, "w", encoding="utf-8") if rejects_path else None
+
+    def on_reject(line, row, errors):
+        if rejects_file:
+            rejects_file.write(json.dumps({"line": line, "row": row, "errors": errors},
+                                          default=str) + "\n")
+
+    try:
+        report = import_rows(kind, read_rows(path, fmt), batch_size=batch_size,
+                             commit_every=commit_every, on_reject=on_reject)
+    finally:
+        if rejects_file:
+            rejects_file.close()
+
+    click.echo(f"Imported {report.accepted:,} {kind}, rejected {report.rejected:,} "
+               f"in {report.elapsed:.1f}s ({report.rows_per_second:,.0f} rows/s).")
+    for line, errors in report.rejects[:20]:
+        detail = "; ".join(f"{k}: {', '.join(map(str, v))}" for k, v in errors.items())
+        click.echo(f"  line {line}: {detail}", err=True)
+    if report.rejected > 20:
+        click.echo(f"  ... and {report.rejected - 20:,} more", err=True)
+
+
+@click.command("export")
+@click.argument("kind", type=click.Choice(["listings", "prices"]))
+@click.option("--format", "fmt", type=click.Choice(["csv", "jsonl", "parquet"]),
+              default="csv", show_default=True)
+@click.option("-o", "--output", type=click.Path(dir_okay=False),
+              help="Output file (default: stdout; required for parquet).")
+@click.option("--variant", help="Only this model variant (by name).")
+@click.option("--include-sold", is_flag=True, help="Include sold listings.")
+@click.option("--start", type=click.DateTime(["%Y-%m-%d"]), help="Earliest date (inclusive).")
+@click.option("--end", type=click.DateTime(["%Y-%m-%d"]), help="Latest date (inclusive).")
+@with_appcontext
+def export_command(kind, fmt, output, variant, include_sold, start, end):
+    """Stream price records or listings to CSV, JSONL or Parquet."""
+    import sys
+    from app import db
+    from app.exporter import export_columns, export_rows, iter_csv, iter_jsonl, write_parquet
+    from app.models import ModelVariant
+
+    variant_id = None
+    if variant:
+        variant_id = db.session.query(ModelVariant.id).filter_by(name=variant).scalar()
+        if variant_id is None:
+            raise click.BadParameter(f"unknown variant {variant!r}", param_hint="--variant")
+    rows = export_rows(kind, variant_id=variant_id, show_sold=include_sold,
+                       start=start.date() if start else None,
+                       end=end.date() if end else None)
+
+    if fmt == "parquet":
+        if not output:
+            raise click.UsageError("--output is required for parquet export")
+        write_parquet(kind, rows, output)
+        return
+    encode = iter_csv if fmt == "csv" else iter_jsonl
+    out = open(output, "w", newline="", encoding="utf-8") if output else sys.stdout
+    try:
+        for chunk in encode(rows, export_columns(kind)):
+            out.write(chunk)
+    finally:
+        if output:
+            out.close()
+
+
+@click.command("synth")
+@click.option("--scale", type=click.Choice(["10k", "100k", "1m"]),
+              help="Preset size (price records); overridden by explicit counts.")
+@click.option("--registry", type=int, help="Registry cars to generate.")
+@click.option("--listings", type=int, help="Listings to generate.")
+@click.option("--prices", type=int, help="Price records to generate.")
+@click.option("--seed", default=2002, show_default=True)
+@with_appcontext
+def synth_command(scale, registry, listings, prices, seed):
+    """Fill the database with realistic synthetic data for load testing."""
+    import time
+    from app.synthetic import SCALES, generate
+
+    preset = SCALES.get(scale, (0, 0, 0))
+    counts = {
+        "registry": registry if registry is not None else preset[0],
+        "listings": listings if listings is not None else preset[1],
+        "prices": prices if prices is not None else preset[2],
+    }
+    t0 = time.perf_counter()
+    generate(seed=seed, **counts)
+    summary = ", ".join(f"{n:,} {k}" for k, n in counts.items())
+    click.echo(f"Generated {summary} in {time.perf_counter() - t0:.1f}s.")
+
+
+def register_commands(app):
+    app.cli.add_command(db_cli)
+    app.cli.add_command(seed_command)
+    app.cli.add_command(stats_cli)
+    app.cli.add_command(search_cli)
+    app.cli.add_command(dedup_cli)
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(quantiles_cli)
+    app.cli.add_command(cache_cli)
+    app.cli.add_command(changelog_cli)
+    app.cli.add_command(valuation_cli)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(assets_cli)
+    app.cli.add_command(check_plans)
+    app.cli.add_command(import_command)
+    app.cli.add_command(refresh_command)
+    app.cli.add_command(export_command)
+    app.cli.add_command(synth_command)
@@ -0,0 +1,43 @@
+"""Engine options and per-connection setup for the configured database."""
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+def engine_options(config):
+    """Return SQLALCHEMY_ENGINE_OPTIONS for the configured database URL."""
+    url = make_url(config["SQLALCHEMY_DATABASE_URI"])
+    options = {"pool_pre_ping": True}
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}  # a single shared in-memory connection; pool settings don't apply
+    options.update(
+        pool_size=config["DB_POOL_SIZE"],
+        max_overflow=config["DB_MAX_OVERFLOW"],
+        pool_timeout=config["DB_POOL_TIMEOUT"],
+    )
+    if url.get_backend_name() != "sqlite":
+        options["pool_recycle"] = config["DB_POOL_RECYCLE"]
+    return options
+
+
+def install_sqlite_pragmas(engine, config):
+    """Apply the SQLITE_* pragmas to every new connection from ``engine``."""
+    if engine.dialect.name != "sqlite":
+        return
+    pragmas = [
+        ("busy_timeout", config["SQLITE_BUSY_TIMEOUT_MS"]),
+        ("journal_mode", config["SQLITE_JOURNAL_MODE"]),
+        ("synchronous", config["SQLITE_SYNCHRONOUS"]),
+        ("mmap_size", config["SQLITE_MMAP_SIZE"]),
+        # Negative cache_size is in KiB rather than pages
+        ("cache_size", -abs(config["SQLITE_CACHE_SIZE_KB"])),
+    ]
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
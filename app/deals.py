@@ -0,0 +1,245 @@
+"""Deal ratings for listings, scored against cached price baselines.
+
+Baselines are the count, sum and quantile sketch of sale prices per
+(variant_id, condition), read from ``price_sketches`` (app/quantiles.py) and
+held in-process. Committing a change to a PriceRecord marks only the affected
+variants stale; they are re-read the next time a page needs them. Other
+workers learn of the change from the change log (app/changelog.py), which each
+one reads at most every ``CHANGE_LOG_POLL_SECONDS``.
+
+``DEAL_BASELINE`` picks what a listing is judged against: the ``model``
+value (default; app/valuation.py, which also accounts for the build year and
+how prices have moved since each sale), the ``median``, the ``mean``, or its
+``percentile`` among recorded sales. Variants without a fitted model fall
+back to the median. The mean is easily dragged by one auction outlier; the
+others are not.
+"""
+
+import threading
+import time
+from collections import namedtuple
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from app import db
+from app.changelog import DEFAULT_BATCH, ChangeLogGap, latest_seq, poll_interval, read_changes
+from app.models import PriceRecord
+from app.quantiles import SKETCH_COMPRESSION, load_sketches
+from app.sketch import merge_all
+
+DEAL_BASELINES = ("model", "median", "mean", "percentile")
+
+Baseline = namedtuple("Baseline", "count total digest")
+
+
+class BaselineCache:
+    """Process-wide {(variant_id, condition): Baseline} price baselines."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_condition = {}
+        self._by_variant = {}
+        self._loaded = False
+        self._stale = set()
+        self._position = 0  # change log sequence number the baselines reflect
+        self._polled = 0.0
+
+    def invalidate(self, variant_ids=None):
+        """Mark ``variant_ids`` (or everything, if None) for reload."""
+        with self._lock:
+            if variant_ids is None:
+                self._loaded = False
+                self._stale.clear()
+            else:
+                self._stale.update(variant_ids)
+
+    def snapshot(self):
+        """Return (by_condition, by_variant) dicts, refreshing stale entries first."""
+        with self._lock:
+            if self._loaded:
+                self._catch_up()
+            if not self._loaded:
+                self._position = latest_seq()
+                self._polled = time.monotonic()
+                self._by_condition, self._by_variant = self._load()
+                self._loaded = True
+                self._stale.clear()
+            elif self._stale:
+                by_condition, by_variant = self._load(self._stale)
+                for key in [k for k in self._by_condition if k[0] in self._stale]:
+                    del self._by_condition[key]
+                for variant_id in self._stale:
+                    self._by_variant.pop(variant_id, None)
+                self._by_condition.update(by_condition)
+                self._by_variant.update(by_variant)
+                self._stale.clear()
+            return self._by_condition, self._by_variant
+
+    def _catch_up(self):
+        """Mark the variants whose price records changed since the last read stale."""
+        now = time.monotonic()
+        if now - self._polled < poll_interval():
+            return
+        self._polled = now
+        try:
+            changes, self._position = read_changes(self._position, tables=("price_records",))
+        except ChangeLogGap:
+            self._loaded = False
+            return
+        if len(changes) == DEFAULT_BATCH:
+            self._loaded = False  # cheaper to reload everything
+            return
+        self._stale.update(change.variant_id for change in changes
+                           if change.variant_id is not None)
+
+    @staticmethod
+    def _load(variant_ids=None):
+        by_condition, parts = {}, {}
+        for (variant_id, condition), entry in load_sketches(variant_ids).items():
+            by_condition[(variant_id, condition)] = Baseline(*entry)
+            parts.setdefault(variant_id, []).append(entry)
+        by_variant = {
+            variant_id: Baseline(sum(e[0] for e in entries), sum(e[1] for e in entries),
+                                 merge_all([e[2] for e in entries], SKETCH_COMPRESSION))
+            for variant_id, entries in parts.items()
+        }
+        return by_condition, by_variant
+
+
+baselines = BaselineCache()
+
+
+def baseline_entry(variant_id, condition, snapshot=None):
+    """Return the Baseline a listing is judged against, or None."""
+    by_condition, by_variant = snapshot or baselines.snapshot()
+    entry = by_condition.get((variant_id, condition)) if condition is not None else None
+    if not entry:
+        # Fall back to the variant as a whole regardless of condition
+        entry = by_variant.get(variant_id)
+    if not entry or not entry.count:
+        return None
+    return entry
+
+
+def baseline_price(variant_id, condition, snapshot=None, basis="mean"):
+    """Return the mean or median sale price used to judge a listing, or None."""
+    entry = baseline_entry(variant_id, condition, snapshot)
+    if entry is None:
+        return None
+    if basis == "median":
+        return int(round(entry.digest.median()))
+    return int(entry.total / entry.count)
+
+
+def rate_listings(listings, basis=None):
+    """Return {listing.id: rating} for every unsold listing, in one pass."""
+    if basis is None:
+        basis = current_app.config.get("DEAL_BASELINE", "median") if has_app_context() else "median"
+    if basis not in DEAL_BASELINES:
+        raise ValueError(f"DEAL_BASELINE must be one of {', '.join(DEAL_BASELINES)}, not {basis!r}")
+    snapshot = baselines.snapshot()
+    values = {}
+    if basis == "model":
+        from app.valuation import value_listings  # keeps NumPy off the worker boot path
+        values = value_listings([listing for listing in listings if not listing.is_sold])
+    ratings = {}
+    for listing in listings:
+        if listing.is_sold:
+            continue
+        if listing.id in values:
+            ratings[listing.id] = deal_rating(listing.price_gbp, values[listing.id], "model value")
+        elif basis == "percentile":
+            entry = baseline_entry(listing.variant_id, listing.condition, snapshot)
+            ratings[listing.id] = percentile_rating(listing.price_gbp, entry and entry.digest)
+        else:
+            price = baseline_price(listing.variant_id, listing.condition, snapshot,
+                                   "mean" if basis == "mean" else "median")
+            label = "avg" if basis == "mean" else "median"
+            ratings[listing.id] = deal_rating(listing.price_gbp, price, label)
+    return ratings
+
+
+def _no_data():
+    return {"rating": "unknown", "label": "No data", "css": "secondary",
+            "detail": "Not enough price history to assess"}
+
+
+def deal_rating(price_gbp, avg_price, basis="avg"):
+    """Rate an asking price against a market average. Returns dict with rating info."""
+    if not avg_price:
+        return _no_data()
+
+    diff_pct = (price_gbp - avg_price) / avg_price * 100
+
+    if diff_pct < -15:
+        return {"rating": "great", "label": "Great deal", "css": "success",
+                "detail": f"£{price_gbp:,} is {abs(diff_pct):.0f}% below {basis} £{avg_price:,}"}
+    elif diff_pct < -5:
+        return {"rating": "good", "label": "Good price", "css": "info",
+                "detail": f"£{price_gbp:,} is {abs(diff_pct):.0f}% below {basis} £{avg_price:,}"}
+    elif diff_pct <= 10:
+        return {"rating": "fair", "label": "Fair price", "css": "warning",
+                "detail": f"£{price_gbp:,} is close to {basis} £{avg_price:,}"}
+    else:
+        return {"rating": "high", "label": "Above market", "css": "danger",
+                "detail": f"£{price_gbp:,} is {diff_pct:.0f}% above {basis} £{avg_price:,}"}
+
+
+def percentile_rating(price_gbp, digest):
+    """Rate an asking price by where it falls among recorded sales."""
+    rank = digest.cdf(price_gbp) if digest is not None else None
+    if rank is None:
+        return _no_data()
+    pct = round(rank * 100)
+    if rank <= 0.0:
+        return {"rating": "great", "label": "Great deal", "css": "success",
+                "detail": f"£{price_gbp:,} is below every recorded sale"}
+    if rank >= 1.0:
+        return {"rating": "high", "label": "Above market", "css": "danger",
+                "detail": f"£{price_gbp:,} is above every recorded sale"}
+
+    if rank < 0.15:
+        return {"rating": "great", "label": "Great deal", "css": "success",
+                "detail": f"£{price_gbp:,} is cheaper than {100 - pct}% of recorded sales"}
+    elif rank < 0.35:
+        return {"rating": "good", "label": "Good price", "css": "info",
+                "detail": f"£{price_gbp:,} is cheaper than {100 - pct}% of recorded sales"}
+    elif rank <= 0.75:
+        return {"rating": "fair", "label": "Fair price", "css": "warning",
+                "detail": f"£{price_gbp:,} is mid-market (percentile {pct})"}
+    else:
+        return {"rating": "high", "label": "Above market", "css": "danger",
+                "detail": f"£{price_gbp:,} is above {pct}% of recorded sales"}
+
+
+# ---------------------------------------------------------------------------
+# Invalidation
+# ---------------------------------------------------------------------------
+def mark_stale(session, variant_ids):
+    """Invalidate ``variant_ids`` once ``session`` commits (for bulk statements)."""
+    stale = session.info.setdefault("stale_baseline_variants", set())
+    stale.update(v for v in variant_ids if v is not None)
+
+
+@event.listens_for(db.session, "after_flush")
+def _collect_stale_variants(session, flush_context):
+    stale = session.info.setdefault("stale_baseline_variants", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, PriceRecord):
+            continue
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        # A record moved between variants leaves its old variant stale too
+        variant_ids = [obj.variant_id, *inspect(obj).attrs.variant_id.history.deleted]
+        stale.update(v for v in variant_ids if v is not None)
+
+
+@event.listens_for(db.session, "after_commit")
+def _invalidate_baselines(session):
+    stale = session.info.pop("stale_baseline_variants", None)
+    if stale:
+        baselines.invalidate(stale)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _discard_stale_variants(session):
+    session.info.pop("stale_baseline_variants", None)
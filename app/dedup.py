@@ -0,0 +1,401 @@
+"""Cross-site duplicate listing detection with MinHash / LSH.
+
+Each listing's title and description are reduced to character shingles and
+summarised as a MinHash signature, whose per-position agreement estimates
+the Jaccard similarity of two listings' text. The signature is cut into
+bands; each band is hashed together with a blocking key (variant, year,
+colour) into an LSH bucket. Only listings sharing a bucket are compared, so
+finding a new listing's duplicates costs a handful of indexed lookups
+rather than a comparison against every row.
+
+Confirmed pairs (estimated similarity >= ``THRESHOLD``) are merged into
+clusters labelled by their lowest listing id. The index is updated by
+session events whenever a Listing is added, edited or deleted, and by
+``bulk_insert`` for rows written outside the ORM; ``flask dedup rebuild``
+recomputes it from scratch.
+"""
+
+import hashlib
+import re
+import struct
+import zlib
+from flask import current_app, has_app_context
+from sqlalchemy import event, exists, func, inspect, or_, select
+from sqlalchemy.orm import aliased
+from app import db
+from app.models import Listing, ListingFingerprint, ListingLshBucket
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS  # candidate threshold ~ (1/BANDS) ** (1/ROWS) = 0.5
+THRESHOLD = 0.7
+SHINGLE = 5
+
+_MASK64 = (1 << 64) - 1
+_BIN_SHIFT = 64 - (NUM_PERM - 1).bit_length()  # top bits pick the bin (NUM_PERM is 2**k)
+_PACK = struct.Struct(f"<{NUM_PERM}I")
+_CHUNK = 500  # ids per IN (...) lookup
+
+# Columns that feed the fingerprint; editing any of them re-indexes a listing
+FINGERPRINT_COLUMNS = ("variant_id", "year", "colour", "title", "description")
+_NOISE_WORDS = {"bmw", "for", "sale", "the", "a", "with", "and"}
+
+
+# ---------------------------------------------------------------------------
+# Fingerprints
+# ---------------------------------------------------------------------------
+def block_key(variant_id, year, colour):
+    colour = re.sub(r"[^a-z0-9]+", "", (colour or "").lower())
+    return f"{variant_id}:{year or ''}:{colour}"
+
+
+def shingles(title, description, year=None, colour=None):
+    """Character shingles of the listing text, minus words the blocking key already fixes."""
+    ignore = _NOISE_WORDS | set(re.findall(r"[a-z0-9]+", (colour or "").lower()))
+    if year:
+        ignore.add(str(year))
+    words = [w for w in re.findall(r"[a-z0-9]+", f"{title or ''} {description or ''}".lower())
+             if w not in ignore]
+    text = " ".join(words)
+    if len(text) <= SHINGLE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE] for i in range(len(text) - SHINGLE + 1)}
+
+
+def minhash(shingle_set):
+    """Return the NUM_PERM-long MinHash signature of a set of strings.
+
+    One-permutation hashing: each shingle is hashed once and the hash's top
+    bits choose one of NUM_PERM bins, which keep their minimum. Empty bins
+    borrow from the next filled bin (rotation densification), so the
+    signature costs O(shingles) rather than O(shingles x NUM_PERM).
+    """
+    bins = [None] * NUM_PERM
+    for s in shingle_set:
+        h = (zlib.crc32(s.encode()) + 1) * 0x9E3779B97F4A7C15 & _MASK64
+        h ^= h >> 31
+        index, value = h >> _BIN_SHIFT, h & 0xFFFFFFFF
+        if bins[index] is None or value < bins[index]:
+            bins[index] = value
+    if all(v is None for v in bins):
+        return (0,) * NUM_PERM
+    signature = []
+    for i in range(NUM_PERM):
+        offset = 0
+        while bins[(i + offset) % NUM_PERM] is None:
+            offset += 1
+        signature.append((bins[(i + offset) % NUM_PERM] + offset * 0x9E3779B1) & 0xFFFFFFFF)
+    return tuple(signature)
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(x == y for x, y in zip(sig_a, sig_b)) / NUM_PERM
+
+
+def lsh_buckets(block, signature):
+    buckets = []
+    for band in range(BANDS):
+        values = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(f"{block}|{band}|{values}".encode(), digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, "big", signed=True))
+    return buckets
+
+
+def fingerprint(row):
+    """Return (block, signature) for a mapping holding the FINGERPRINT_COLUMNS."""
+    block = block_key(row["variant_id"], row["year"], row["colour"])
+    return block, minhash(shingles(row["title"], row["description"], row["year"], row["colour"]))
+
+
+# ---------------------------------------------------------------------------
+# Index maintenance
+# ---------------------------------------------------------------------------
+def index_listings(conn, rows):
+    """Add listings (mappings with ``id`` and FINGERPRINT_COLUMNS) to the index.
+
+    Candidates come from the LSH buckets, both already stored and within
+    ``rows`` itself; confirmed duplicates have their clusters merged.
+    """
+    fp_table, bucket_table = ListingFingerprint.__table__, ListingLshBucket.__table__
+    entries = []
+    for row in rows:
+        block, signature = fingerprint(row)
+        entries.append((row["id"], block, signature, lsh_buckets(block, signature)))
+    if not entries:
+        return
+
+    # Stored listings sharing a bucket with any new one
+    stored = {}
+    all_buckets = list({b for *_, buckets in entries for b in buckets})
+    for chunk in _chunks(all_buckets):
+        for bucket, listing_id in conn.execute(
+            select(bucket_table.c.bucket, bucket_table.c.listing_id)
+            .where(bucket_table.c.bucket.in_(chunk))
+        ):
+            stored.setdefault(bucket, set()).add(listing_id)
+
+    conn.execute(fp_table.insert(), [
+        {"listing_id": lid, "block": block, "signature": _PACK.pack(*sig), "cluster_id": None}
+        for lid, block, sig, _ in entries
+    ])
+    conn.execute(bucket_table.insert(), [
+        {"bucket": b, "listing_id": lid} for lid, _, _, buckets in entries for b in set(buckets)
+    ])
+
+    # Candidate pairs, then verify them against the signatures
+    signatures = {lid: sig for lid, _, sig, _ in entries}
+    candidates = {}
+    seen = {}
+    for lid, _, _, buckets in entries:
+        for b in buckets:
+            candidates.setdefault(lid, set()).update(stored.get(b, ()), seen.get(b, ()))
+            seen.setdefault(b, set()).add(lid)
+    others = {c for cs in candidates.values() for c in cs} - signatures.keys()
+    clusters = {}
+    for chunk in _chunks(list(others)):
+        for listing_id, signature, cluster_id in conn.execute(
+            select(fp_table.c.listing_id, fp_table.c.signature, fp_table.c.cluster_id)
+            .where(fp_table.c.listing_id.in_(chunk))
+        ):
+            signatures[listing_id] = _PACK.unpack(signature)
+            clusters[listing_id] = cluster_id
+
+    forest = _UnionFind()
+    for lid, cands in candidates.items():
+        for other in cands:
+            if other != lid and similarity(signatures[lid], signatures[other]) >= THRESHOLD:
+                forest.union(lid, other)
+                if clusters.get(other) is not None:
+                    forest.union(other, clusters[other])
+    _relabel(conn, forest.groups())
+
+
+def unindex_listings(conn, listing_ids):
+    """Remove listings from the index and re-cluster whatever they were linked to."""
+    if not listing_ids:
+        return
+    fp_table, bucket_table = ListingFingerprint.__table__, ListingLshBucket.__table__
+    affected = set()
+    for chunk in _chunks(list(listing_ids)):
+        affected.update(cid for (cid,) in conn.execute(
+            select(fp_table.c.cluster_id)
+            .where(fp_table.c.listing_id.in_(chunk), fp_table.c.cluster_id.is_not(None))
+        ))
+        conn.execute(bucket_table.delete().where(bucket_table.c.listing_id.in_(chunk)))
+        conn.execute(fp_table.delete().where(fp_table.c.listing_id.in_(chunk)))
+    for cluster_id in affected:
+        _recluster(conn, cluster_id)
+
+
+def index_listing_ids(conn, listing_ids):
+    """Index the listings with these ids (rows written by a bulk insert)."""
+    columns = [Listing.id, *[getattr(Listing, c) for c in FINGERPRINT_COLUMNS]]
+    for chunk in _chunks(list(listing_ids)):
+        index_listings(conn, conn.execute(
+            select(*columns).where(Listing.id.in_(chunk)).order_by(Listing.id)
+        ).mappings().all())
+
+
+def index_new_listings(conn, after_id):
+    """Index every listing with ``id > after_id``."""
+    columns = [Listing.id, *[getattr(Listing, c) for c in FINGERPRINT_COLUMNS]]
+    while True:
+        rows = conn.execute(
+            select(*columns).where(Listing.id > after_id).order_by(Listing.id).limit(5000)
+        ).mappings().all()
+        if not rows:
+            return
+        index_listings(conn, rows)
+        after_id = rows[-1]["id"]
+
+
+def rebuild_index():
+    """Recompute all fingerprints, buckets and clusters from the listings table."""
+    conn = db.session.connection()
+    conn.execute(ListingLshBucket.__table__.delete())
+    conn.execute(ListingFingerprint.__table__.delete())
+    index_new_listings(conn, 0)
+    db.session.commit()
+    return db.session.query(func.count(ListingFingerprint.listing_id)).scalar()
+
+
+def index_bulk_insert(model, ids):
+    """After a bulk insert: index the listings it wrote, given their ids."""
+    if model is Listing and ids and _enabled():
+        index_listing_ids(db.session.connection(), ids)
+
+
+def _recluster(conn, cluster_id):
+    """Recompute one cluster's components after members left or changed."""
+    fp_table = ListingFingerprint.__table__
+    members = {lid: _PACK.unpack(sig) for lid, sig in conn.execute(
+        select(fp_table.c.listing_id, fp_table.c.signature)
+        .where(fp_table.c.cluster_id == cluster_id)
+    )}
+    conn.execute(fp_table.update().where(fp_table.c.cluster_id == cluster_id)
+                 .values(cluster_id=None))
+    forest = _UnionFind()
+    ids = sorted(members)
+    for i, a in enumerate(ids):  # clusters are small; pairwise is fine here
+        for b in ids[i + 1:]:
+            if similarity(members[a], members[b]) >= THRESHOLD:
+                forest.union(a, b)
+    _relabel(conn, forest.groups())
+
+
+def _relabel(conn, groups):
+    """Point every member (and every member of a merged cluster) at the group's lowest id."""
+    fp_table = ListingFingerprint.__table__
+    for group in groups:
+        if len(group) < 2:
+            continue
+        members = list(group)
+        conn.execute(
+            fp_table.update()
+            .where(or_(fp_table.c.listing_id.in_(members), fp_table.c.cluster_id.in_(members)))
+            .values(cluster_id=min(members))
+        )
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        self.parent.setdefault(x, x)
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+    def groups(self):
+        result = {}
+        for x in list(self.parent):
+            result.setdefault(self.find(x), set()).add(x)
+        return list(result.values())
+
+
+def _chunks(items, size=_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+# ---------------------------------------------------------------------------
+# Read path
+# ---------------------------------------------------------------------------
+def collapse_duplicates(query, show_sold=False):
+    """Filter a Listing query to one representative per duplicate cluster.
+
+    The representative is the lowest-id cluster member that is itself visible
+    (unsold, unless ``show_sold``), so a cluster stays on the page when its
+    original listing sells.
+    """
+    mine = aliased(ListingFingerprint)
+    other = aliased(ListingFingerprint)
+    other_listing = aliased(Listing)
+    shadowed = (
+        select(other.listing_id)
+        .join(mine, mine.cluster_id == other.cluster_id)
+        .join(other_listing, other_listing.id == other.listing_id)
+        .where(mine.listing_id == Listing.id, other.listing_id < Listing.id)
+    )
+    if not show_sold:
+        shadowed = shadowed.where(other_listing.is_sold == False)  # noqa: E712
+    return query.filter(~exists(shadowed))
+
+
+def duplicate_sites(listings, show_sold=False):
+    """Return {listing id: [(id, source_site), ...]} of the other cluster members."""
+    ids = [listing.id for listing in listings]
+    if not ids:
+        return {}
+    fp = ListingFingerprint
+    cluster_of = dict(db.session.query(fp.listing_id, fp.cluster_id)
+                      .filter(fp.listing_id.in_(ids), fp.cluster_id.is_not(None)))
+    if not cluster_of:
+        return {}
+    # Members via the cluster index first, then their listings by primary key
+    member_clusters = dict(db.session.query(fp.listing_id, fp.cluster_id)
+                           .filter(fp.cluster_id.in_(set(cluster_of.values()))))
+    query = (
+        db.session.query(Listing.id, Listing.source_site)
+        .filter(Listing.id.in_(list(member_clusters)))
+        .order_by(Listing.id)
+    )
+    if not show_sold:
+        query = query.filter(Listing.is_sold == False)  # noqa: E712
+    members = {}
+    for listing_id, site in query:
+        members.setdefault(member_clusters[listing_id], []).append((listing_id, site))
+    return {lid: [m for m in members.get(cid, []) if m[0] != lid]
+            for lid, cid in cluster_of.items()}
+
+
+def duplicate_counts():
+    """Return {variant_id: active listings beyond the first in their cluster}."""
+    fp = ListingFingerprint
+    clustered = select(fp.listing_id, fp.cluster_id).where(fp.cluster_id.is_not(None))
+    if db.engine.dialect.name == "sqlite":
+        # An unflattenable subquery makes SQLite drive the join from the clustered
+        # fingerprints rather than probing them for every active listing
+        clustered = clustered.limit(-1)
+    clustered = clustered.subquery()
+    rows = db.session.execute(
+        select(Listing.variant_id, func.count() - func.count(clustered.c.cluster_id.distinct()))
+        .select_from(clustered)
+        .join(Listing, Listing.id == clustered.c.listing_id)
+        .where(Listing.is_sold == False)  # noqa: E712
+        .group_by(Listing.variant_id)
+    )
+    return {variant_id: n for variant_id, n in rows if n}
+
+
+# ---------------------------------------------------------------------------
+# Session hooks
+# ---------------------------------------------------------------------------
+def _enabled():
+    return has_app_context() and current_app.config.get("DEDUP_ENABLED")
+
+
+def _changed(obj):
+    state = inspect(obj)
+    return any(state.attrs[c].history.has_changes() for c in FINGERPRINT_COLUMNS)
+
+
+@event.listens_for(db.session, "before_flush")
+def _unindex_removed(session, flush_context, instances):
+    # Fingerprint rows reference the listing, so they go before the listing does
+    if not _enabled():
+        return
+    removed = [obj.id for obj in session.deleted
+               if isinstance(obj, Listing) and inspect(obj).persistent]
+    edited = [obj.id for obj in session.dirty
+              if isinstance(obj, Listing) and inspect(obj).persistent and _changed(obj)]
+    if removed or edited:
+        unindex_listings(session.connection(), removed + edited)
+    session.info["dedup_reindex"] = edited
+
+
+@event.listens_for(db.session, "after_flush")
+def _index_written(session, flush_context):
+    if not _enabled():
+        return
+    edited = set(session.info.pop("dedup_reindex", ()))
+    written = [obj for obj in session.new if isinstance(obj, Listing)]
+    written += [obj for obj in session.dirty if isinstance(obj, Listing) and obj.id in edited]
+    if not written:
+        return
+    rows = [{"id": obj.id, **{c: getattr(obj, c) for c in FINGERPRINT_COLUMNS}}
+            for obj in written]
+    index_listings(session.connection(), rows)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _discard_pending(session):
+    session.info.pop("dedup_reindex", None)
@@ -0,0 +1,154 @@
+"""Streaming export of price records and listings.
+
+Rows come straight off a server-side cursor (``stream_results`` +
+``yield_per``) as plain column tuples and are encoded one batch at a time, so
+a full-history dump never materializes the result set. CSV and JSONL are
+produced by generators; Parquet (optional, needs ``pyarrow``) is written one
+row group per batch.
+"""
+
+import csv
+import io
+import json
+from datetime import date, datetime
+from sqlalchemy import Boolean, Date, Integer, select
+from app import db
+from app.models import ModelVariant, Listing, PriceRecord
+
+EXPORT_FORMATS = ("csv", "jsonl", "parquet")
+YIELD_PER = 2000
+
+# kind -> (model, exported columns, date column used by start/end filters)
+EXPORT_KINDS = {
+    "prices": (PriceRecord, ("id", "variant_id", "price_gbp", "year_of_car", "condition",
+                             "source", "sold_date", "notes"), "sold_date"),
+    "listings": (Listing, ("id", "variant_id", "title", "year", "price_gbp", "mileage",
+                           "condition", "colour", "location", "source_site", "source_url",
+                           "description", "is_sold", "listed_at", "sold_at"), "listed_at"),
+}
+
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def export_columns(kind):
+    _, columns, _ = EXPORT_KINDS[kind]
+    return ["variant", *columns]
+
+
+def export_rows(kind, variant_id=None, show_sold=True, start=None, end=None,
+                yield_per=YIELD_PER):
+    """Yield export rows as tuples (variant name first), streamed from the database.
+
+    Filters mirror the UI: ``variant_id``, ``show_sold`` (listings only) and an
+    inclusive ``start``/``end`` range on the sale or listing date.
+    """
+    model, columns, date_column = EXPORT_KINDS[kind]
+    query = (
+        select(ModelVariant.name, *[getattr(model, c) for c in columns])
+        .join(ModelVariant, model.variant_id == ModelVariant.id)
+        .order_by(model.id)
+        .execution_options(stream_results=True, yield_per=yield_per)
+    )
+    if variant_id:
+        query = query.where(model.variant_id == variant_id)
+    if model is Listing and not show_sold:
+        query = query.where(Listing.is_sold == False)  # noqa: E712
+    if start:
+        query = query.where(getattr(model, date_column) >= start)
+    if end:
+        query = query.where(getattr(model, date_column) <= end)
+
+    for partition in db.session.execute(query).partitions():
+        yield from partition
+
+
+def iter_csv(rows, columns):
+    """Encode rows as CSV, yielding one string per batch of rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for i, row in enumerate(rows, start=1):
+        writer.writerow(_plain(v) for v in row)
+        if i % YIELD_PER == 0:
+            yield _drain(buffer)
+    yield _drain(buffer)
+
+
+def iter_jsonl(rows, columns):
+    """Encode rows as JSON Lines, yielding one string per batch of rows."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(columns, map(_plain, row))), ensure_ascii=False))
+        if len(lines) >= YIELD_PER:
+            yield "\n".join(lines) + "\n"
+            lines.clear()
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def write_parquet(kind, rows, sink, row_group_size=50_000):
+    """Write rows to ``sink`` (path or binary file) as Parquet, one row group at a time."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise RuntimeError("Parquet export requires the 'pyarrow' package") from exc
+
+    schema = _arrow_schema(kind, pa)
+    batch = []
+    with pq.ParquetWriter(sink, schema) as writer:
+        def write_group():
+            columns = list(zip(*batch)) if batch else [[] for _ in schema.names]
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(col, type=f.type) for col, f in zip(columns, schema)], schema=schema,
+            ))
+            batch.clear()
+
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= row_group_size:
+                write_group()
+        if batch:
+            write_group()
+
+
+def _arrow_schema(kind, pa):
+    model, columns, _ = EXPORT_KINDS[kind]
+    fields = [pa.field("variant", pa.string())]
+    for name in columns:
+        column_type = model.__table__.c[name].type
+        if isinstance(column_type, Boolean):
+            arrow_type = pa.bool_()
+        elif isinstance(column_type, Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column_type, Date):
+            arrow_type = pa.date32()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _plain(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _drain(buffer):
+    chunk = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return chunk
@@ -4,15 +4,7 @@ from wtforms import (
     DateField, BooleanField, SubmitField,
 )
 from wtforms.validators import DataRequired, Optional, NumberRange, URL
-
-CONDITION_CHOICES = [
-    ("", "-- Select --"),
-    ("concours", "Concours"),
-    ("excellent", "Excellent"),
-    ("good", "Good"),
-    ("fair", "Fair"),
-    ("project", "Project"),
-]
+from app.models import CONDITION_CHOICES
 
 MOT_CHOICES = [
     ("", "-- Select --"),
@@ -0,0 +1,136 @@
+"""Streaming bulk import of listings and price records from CSV or JSONL.
+
+Rows are read one at a time, validated with the same WTForms classes the
+add pages use, and written in executemany batches, so memory stays bounded
+by the batch size however large the file is. Variant names are resolved
+through a name → id map loaded once up front.
+"""
+
+import csv
+import json
+import time
+from dataclasses import dataclass, field
+from werkzeug.datastructures import MultiDict
+from app import db
+from app.bulk import bulk_insert
+from app.forms import ListingForm, PriceRecordForm
+from app.models import ModelVariant, Listing, PriceRecord
+
+IMPORT_KINDS = {
+    "listings": (Listing, ListingForm),
+    "prices": (PriceRecord, PriceRecordForm),
+}
+
+# Lower-cased before validation so "Good" matches the "good" choice
+_LOWERCASE_FIELDS = ("condition", "source_site")
+_TRUE_VALUES = {"1", "true", "yes", "y", "on", "sold"}
+
+
+@dataclass
+class ImportReport:
+    accepted: int = 0
+    rejected: int = 0
+    elapsed: float = 0.0
+    rejects: list = field(default_factory=list)  # first ``max_rejects`` (line, errors)
+
+    @property
+    def rows_per_second(self):
+        return (self.accepted + self.rejected) / self.elapsed if self.elapsed else 0.0
+
+
+def read_rows(path, fmt=None):
+    """Yield (line number, dict) from a CSV or JSONL file without loading it whole.
+
+    A JSONL line that fails to parse is yielded as (line number, None).
+    """
+    fmt = fmt or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+    with open(path, newline="", encoding="utf-8") as fh:
+        if fmt == "csv":
+            reader = csv.DictReader(fh)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_no, line in enumerate(fh, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    row = None
+                yield line_no, row if isinstance(row, dict) else None
+
+
+def import_rows(kind, rows, batch_size=1000, commit_every=10000,
+                on_reject=None, max_rejects=100):
+    """Validate and insert ``rows`` (iterable of (line, dict)) for ``kind``.
+
+    ``batch_size`` rows go into each executemany; the transaction is committed
+    every ``commit_every`` accepted rows and once more at the end. Rejected
+    rows are passed to ``on_reject(line, row, errors)`` if given.
+    """
+    model, form_cls = IMPORT_KINDS[kind]
+    variant_ids = {name.lower(): vid for vid, name in
+                   db.session.query(ModelVariant.id, ModelVariant.name)}
+    choices = [(vid, "") for vid in variant_ids.values()]
+    column_names = [f.name for f in form_cls(formdata=None, meta={"csrf": False})
+                    if f.name != "submit"]
+
+    report = ImportReport()
+    batch = []
+    since_commit = 0
+    started = time.perf_counter()
+
+    def flush():
+        nonlocal since_commit
+        bulk_insert(model, batch)
+        since_commit += len(batch)
+        batch.clear()
+        if since_commit >= commit_every:
+            db.session.commit()
+            since_commit = 0
+
+    for line_no, raw in rows:
+        values, errors = _validate(raw, form_cls, variant_ids, choices, column_names)
+        if errors:
+            report.rejected += 1
+            if len(report.rejects) < max_rejects:
+                report.rejects.append((line_no, errors))
+            if on_reject:
+                on_reject(line_no, raw, errors)
+            continue
+        batch.append(values)
+        report.accepted += 1
+        if len(batch) >= batch_size:
+            flush()
+
+    if batch:
+        flush()
+    db.session.commit()
+    report.elapsed = time.perf_counter() - started
+    return report
+
+
+def _validate(raw, form_cls, variant_ids, choices, column_names):
+    """Return (column values, None) or (None, {field: [errors]}) for one input row."""
+    if raw is None:
+        return None, {"row": ["Not a JSON object"]}
+
+    data = {k.strip(): v for k, v in raw.items() if k and v not in (None, "")}
+    variant = data.pop("variant", None) or data.pop("variant_name", None)
+    if variant is not None and "variant_id" not in data:
+        variant_id = variant_ids.get(str(variant).strip().lower())
+        if variant_id is None:
+            return None, {"variant": [f"Unknown variant {variant!r}"]}
+        data["variant_id"] = variant_id
+    for name in _LOWERCASE_FIELDS:
+        if name in data:
+            data[name] = str(data[name]).strip().lower()
+    if "is_sold" in data:
+        data["is_sold"] = "y" if str(data["is_sold"]).strip().lower() in _TRUE_VALUES else ""
+
+    form = form_cls(formdata=MultiDict({k: str(v) for k, v in data.items()}),
+                    meta={"csrf": False})
+    form.variant_id.choices = choices
+    if not form.validate():
+        return None, form.errors
+    return {name: form[name].data for name in column_names}, None
@@ -0,0 +1,236 @@
+"""Per-request timing and SQL instrumentation.
+
+For every request to an instrumented blueprint this records the number of
+SQL statements, total SQL time, template render time and overall handler
+time. The figures are:
+
+* returned in a ``Server-Timing`` header (visible in browser dev tools),
+* logged with the slowest statements when a request exceeds ``SLOW_REQUEST_MS``,
+* aggregated per endpoint and exposed in Prometheus text format by
+  ``render_metrics()`` (served at ``/metrics``).
+
+Streamed responses (exports) are timed up to the point the body starts
+streaming. Aggregates are per process; with several gunicorn workers each worker reports
+its own series.
+"""
+
+import heapq
+import logging
+import threading
+import time
+from collections import deque
+from flask import current_app, g, has_request_context, request, template_rendered, \
+    before_render_template
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+SLOWEST_KEPT = 5
+WINDOW = 2048  # recent samples per endpoint used for quantiles
+QUANTILES = (0.5, 0.95, 0.99)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Series:
+    """Count, sum, cumulative buckets and a sliding window for quantiles."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.window = deque(maxlen=WINDOW)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.window.append(value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+
+    def quantile(self, q):
+        if not self.window:
+            return 0.0
+        ordered = sorted(self.window)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class MetricsRegistry:
+    """Thread-safe per-endpoint request metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.duration = {}
+        self.sql_time = {}
+        self.render_time = {}
+        self.queries = {}
+
+    def record(self, endpoint, duration, sql_time, render_time, queries):
+        with self._lock:
+            for series, value in ((self.duration, duration), (self.sql_time, sql_time),
+                                  (self.render_time, render_time), (self.queries, queries)):
+                if endpoint not in series:
+                    series[endpoint] = _Series()
+                series[endpoint].observe(value)
+
+    def render(self):
+        """Return all series in Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            lines += _histogram("tracker_request_duration_seconds",
+                                "Request handling time, seconds.", self.duration)
+            lines += _summary("tracker_request_sql_seconds",
+                              "SQL time per request, seconds.", self.sql_time)
+            lines += _summary("tracker_request_render_seconds",
+                              "Template render time per request, seconds.", self.render_time)
+            lines += _summary("tracker_request_sql_queries",
+                              "SQL statements per request.", self.queries)
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            for series in (self.duration, self.sql_time, self.render_time, self.queries):
+                series.clear()
+
+
+metrics = MetricsRegistry()
+
+
+def _histogram(name, help_text, series_by_endpoint):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for endpoint, s in sorted(series_by_endpoint.items()):
+        label = f'endpoint="{endpoint}"'
+        for bound, n in zip(s.buckets, s.bucket_counts):
+            lines.append(f'{name}_bucket{{{label},le="{bound}"}} {n}')
+        lines.append(f'{name}_bucket{{{label},le="+Inf"}} {s.count}')
+        lines.append(f"{name}_sum{{{label}}} {s.total:.6f}")
+        lines.append(f"{name}_count{{{label}}} {s.count}")
+    # Quantiles over the recent window, alongside the cumulative buckets
+    lines += [f"# HELP {name}_quantile Recent {help_text[0].lower()}{help_text[1:]}",
+              f"# TYPE {name}_quantile gauge"]
+    for endpoint, s in sorted(series_by_endpoint.items()):
+        for q in QUANTILES:
+            lines.append(f'{name}_quantile{{endpoint="{endpoint}",quantile="{q}"}} '
+                         f"{s.quantile(q):.6f}")
+    return lines
+
+
+def _summary(name, help_text, series_by_endpoint):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} summary"]
+    for endpoint, s in sorted(series_by_endpoint.items()):
+        label = f'endpoint="{endpoint}"'
+        for q in QUANTILES:
+            lines.append(f'{name}{{{label},quantile="{q}"}} {s.quantile(q):.6f}')
+        lines.append(f"{name}_sum{{{label}}} {s.total:.6f}")
+        lines.append(f"{name}_count{{{label}}} {s.count}")
+    return lines
+
+
+def render_metrics():
+    return metrics.render()
+
+
+# ---------------------------------------------------------------------------
+# Request hooks
+# ---------------------------------------------------------------------------
+def instrument_blueprint(blueprint, exclude=("metrics",)):
+    """Time every request to ``blueprint`` except the named endpoints."""
+    skipped = {f"{blueprint.name}.{name}" for name in exclude}
+
+    @blueprint.before_request
+    def _start_timing():
+        if request.endpoint in skipped or not current_app.config.get("INSTRUMENTATION_ENABLED"):
+            return
+        g.perf = {"start": time.perf_counter(), "queries": 0, "sql_time": 0.0,
+                  "render_time": 0.0, "slowest": []}
+
+    @blueprint.after_request
+    def _finish_timing(response):
+        perf = g.pop("perf", None)
+        if perf is None:
+            return response
+        total = time.perf_counter() - perf["start"]
+        sql, render = perf["sql_time"], perf["render_time"]
+        metrics.record(request.endpoint, total, sql, render, perf["queries"])
+
+        if current_app.config.get("SERVER_TIMING"):
+            response.headers["Server-Timing"] = ", ".join([
+                f'db;dur={sql * 1000:.1f};desc="{perf["queries"]} queries"',
+                f"tpl;dur={render * 1000:.1f}",
+                f"app;dur={max(total - sql - render, 0) * 1000:.1f}",
+                f"total;dur={total * 1000:.1f}",
+            ])
+
+        if total * 1000 >= current_app.config.get("SLOW_REQUEST_MS", 500):
+            slowest = sorted(perf["slowest"], reverse=True)
+            detail = "".join(f"\n  {d * 1000:8.1f} ms  {' '.join(s.split())[:300]}"
+                             for d, _, s in slowest)
+            logger.warning("Slow request %s %s: %.0f ms, %d queries, %.0f ms SQL, "
+                           "%.0f ms render; slowest statements:%s",
+                           request.method, request.full_path.rstrip("?"), total * 1000,
+                           perf["queries"], sql * 1000, render * 1000, detail)
+        return response
+
+
+def _perf():
+    return g.get("perf") if has_request_context() else None
+
+
+@before_render_template.connect
+def _template_started(sender, template, context, **extra):
+    perf = _perf()
+    if perf is not None:
+        perf.setdefault("render_stack", []).append(time.perf_counter())
+
+
+@template_rendered.connect
+def _template_finished(sender, template, context, **extra):
+    perf = _perf()
+    if perf is not None and perf.get("render_stack"):
+        started = perf["render_stack"].pop()
+        if not perf["render_stack"]:  # don't double count nested renders
+            perf["render_time"] += time.perf_counter() - started
+
+
+# ---------------------------------------------------------------------------
+# Engine hooks
+# ---------------------------------------------------------------------------
+def instrument_engine(engine):
+    """Attribute every statement run on ``engine`` to the current request."""
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("query_started")
+    if started:
+        _record_query(statement, time.perf_counter() - started.pop())
+
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute; drop its start time here
+    conn = context.connection
+    started = conn.info.get("query_started") if conn is not None else None
+    if started and context.execution_context is not None:
+        _record_query(context.statement, time.perf_counter() - started.pop())
+
+
+def _record_query(statement, elapsed):
+    perf = _perf()
+    if perf is None:
+        return
+    perf["queries"] += 1
+    perf["sql_time"] += elapsed
+    entry = (elapsed, perf["queries"], statement)
+    if len(perf["slowest"]) < SLOWEST_KEPT:
+        heapq.heappush(perf["slowest"], entry)
+    else:
+        heapq.heappushpop(perf["slowest"], entry)
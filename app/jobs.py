@@ -0,0 +1,327 @@
+"""Background jobs: a queue table worked by a small thread pool per process.
+
+Heavy recomputation (a valuation refit, a rollup or sketch rebuild, a listing
+refresh) shouldn't run inside the request that made it necessary.
+``enqueue(name, args)`` instead adds a ``jobs`` row in the caller's
+transaction, so the job exists exactly when the write that asked for it
+commits, and the request returns as soon as that commit is done.
+
+* Coalescing: a job's key is its name plus its arguments
+  (``stats.rebuild variant_id=3``). While a key is queued, enqueuing it again
+  is a no-op, and a key that is running is not claimed a second time, so one
+  run after the last request covers all of them.
+* Workers: ``JOBS_WORKERS`` threads per process claim the oldest due job with
+  a single ``UPDATE ... RETURNING`` and run it in their own app context. Web
+  workers start them on their first request (after gunicorn has forked); they
+  wake when this process commits a job and otherwise poll every
+  ``JOBS_POLL_SECONDS``. ``flask jobs work`` drains the queue from the command
+  line instead, e.g. as a separate worker with ``JOBS_WORKERS=0`` in the web
+  processes.
+* Retries: a job that raises is queued again after ``JOBS_RETRY_SECONDS``,
+  doubled per attempt up to ``JOBS_RETRY_MAX_SECONDS``, and after
+  ``max_attempts`` is left failed with its error. A job still running after
+  ``JOBS_TIMEOUT_SECONDS`` is taken to have lost its worker and counts as a
+  failed attempt.
+
+Tasks are plain functions registered with ``@task("name")`` (app/tasks.py).
+/jobs and ``flask jobs status`` show the queue.
+"""
+
+import logging
+import os
+import socket
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Job
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+STATUSES = (QUEUED, RUNNING, DONE, FAILED)
+
+Task = namedtuple("Task", "name func max_attempts")
+_UPSERT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+TASKS = {}
+
+logger = logging.getLogger(__name__)
+
+
+def task(name, max_attempts=None):
+    """Register the decorated function as the job ``name``."""
+    def register(func):
+        TASKS[name] = Task(name, func, max_attempts)
+        return func
+    return register
+
+
+def job_key(name, args):
+    """The coalescing key: ``name`` followed by the sorted ``key=value`` arguments."""
+    return " ".join([name, *(f"{k}={args[k]}" for k in sorted(args))])
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+# ---------------------------------------------------------------------------
+# Queue
+# ---------------------------------------------------------------------------
+def enqueue(name, args=None, delay=0, connection=None):
+    """Queue the job ``name`` with keyword ``args`` in the current transaction.
+
+    ``delay`` seconds hold it back, which lets a burst of writes share one
+    run. Returns False if the same key was already queued. A duplicate never
+    raises, even when two transactions race for it, so enqueuing from a
+    write can't fail that write.
+    """
+    if name not in TASKS:
+        raise ValueError(f"unknown job {name!r}")
+    args = dict(args or {})
+    table = Job.__table__
+    key = job_key(name, args)
+    now = _now()
+    values = {
+        "name": name, "key": key, "args": args, "status": QUEUED, "attempts": 0,
+        "max_attempts": TASKS[name].max_attempts or current_app.config["JOBS_MAX_ATTEMPTS"],
+        "run_after": now + timedelta(seconds=delay), "created_at": now,
+    }
+    connection = connection if connection is not None else db.session.connection()
+    dialect_insert = _UPSERT_INSERTS.get(connection.dialect.name)
+    if dialect_insert is not None:
+        # Skip the row if ix_jobs_queued_key already holds this key
+        added = connection.execute(
+            dialect_insert(table).values(**values).on_conflict_do_nothing(
+                index_elements=[table.c.key], index_where=table.c.status == QUEUED)
+        ).rowcount == 1
+    else:
+        try:
+            with connection.begin_nested():
+                connection.execute(insert(table).values(**values))
+            added = True
+        except IntegrityError:
+            added = False
+    db.session.info["jobs_enqueued"] = True
+    return added
+
+
+def claim(worker):
+    """Mark the oldest due job whose key isn't already running as ours; returns it or None."""
+    table = Job.__table__
+    now = _now()
+    running = select(table.c.key).where(table.c.status == RUNNING)
+    due = (
+        select(table.c.id)
+        .where(table.c.status == QUEUED, table.c.run_after <= now, table.c.key.not_in(running))
+        .order_by(table.c.run_after, table.c.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    row = db.session.execute(
+        update(table)
+        .where(table.c.id == due, table.c.status == QUEUED)
+        .values(status=RUNNING, attempts=table.c.attempts + 1, started_at=now,
+                finished_at=None, worker=worker)
+        .returning(table.c.id, table.c.name, table.c.key, table.c.args, table.c.attempts,
+                   table.c.max_attempts)
+    ).first()
+    db.session.commit()
+    return row
+
+
+def run_job(job):
+    """Run a claimed job and record how it went; returns True if it succeeded."""
+    try:
+        result = TASKS[job.name].func(**job.args)
+    except Exception as exc:
+        db.session.rollback()
+        logger.warning("Job #%s %s failed (attempt %s of %s): %s",
+                       job.id, job.key, job.attempts, job.max_attempts, exc)
+        _attempt_failed(job, f"{type(exc).__name__}: {exc}")
+        db.session.commit()
+        return False
+    table = Job.__table__
+    db.session.execute(
+        update(table).where(table.c.id == job.id)
+        .values(status=DONE, finished_at=_now(), error=None,
+                result=None if result is None else str(result)[:200])
+    )
+    db.session.commit()
+    return True
+
+
+def _attempt_failed(job, error):
+    # Retry with backoff unless attempts are used up or a queued duplicate will redo it anyway
+    table = Job.__table__
+    config = current_app.config
+    now = _now()
+    values = {"error": error, "finished_at": now}
+    duplicate = db.session.execute(
+        select(table.c.id).where(table.c.key == job.key, table.c.status == QUEUED)
+    ).scalar()
+    if job.attempts >= job.max_attempts or job.name not in TASKS:
+        values["status"] = FAILED
+    elif duplicate is not None:
+        values.update(status=FAILED, error=f"{error} (superseded by job #{duplicate})")
+    else:
+        delay = min(config["JOBS_RETRY_SECONDS"] * 2 ** (job.attempts - 1),
+                    config["JOBS_RETRY_MAX_SECONDS"])
+        values.update(status=QUEUED, run_after=now + timedelta(seconds=delay), worker=None)
+    db.session.execute(update(table).where(table.c.id == job.id).values(**values))
+
+
+def recover_stale():
+    """Treat jobs running longer than JOBS_TIMEOUT_SECONDS as failed attempts."""
+    table = Job.__table__
+    timeout = current_app.config["JOBS_TIMEOUT_SECONDS"]
+    cutoff = _now() - timedelta(seconds=timeout)
+    stale = db.session.execute(
+        select(table.c.id, table.c.name, table.c.key, table.c.args, table.c.attempts,
+               table.c.max_attempts)
+        .where(table.c.status == RUNNING, table.c.started_at < cutoff)
+    ).all()
+    for job in stale:
+        _attempt_failed(job, f"worker lost: still running after {timeout:.0f}s")
+    if stale:
+        db.session.commit()
+    return len(stale)
+
+
+def work(worker=None, limit=None):
+    """Run due jobs in this thread until none are left (or ``limit`` ran); returns the count."""
+    worker = worker or _worker_name()
+    recover_stale()
+    ran = 0
+    while limit is None or ran < limit:
+        job = claim(worker)
+        if job is None:
+            break
+        run_job(job)
+        ran += 1
+    return ran
+
+
+def retry(job_id):
+    """Queue a failed job's task and arguments as a new job; False if nothing was queued."""
+    job = db.session.get(Job, job_id)
+    if job is None or job.status != FAILED:
+        return False
+    if not enqueue(job.name, job.args):
+        return False  # the same key is already queued
+    db.session.commit()
+    return True
+
+
+def purge(older_than_hours=None):
+    """Delete finished jobs older than ``older_than_hours``; returns how many."""
+    if older_than_hours is None:
+        older_than_hours = current_app.config["JOBS_RETENTION_HOURS"]
+    table = Job.__table__
+    cutoff = _now() - timedelta(hours=older_than_hours)
+    deleted = db.session.execute(
+        table.delete().where(table.c.status.in_((DONE, FAILED)), table.c.finished_at < cutoff)
+    ).rowcount
+    db.session.commit()
+    return deleted
+
+
+def job_status(recent=50):
+    """Return a dict of per-status counts and the ``recent`` newest jobs."""
+    counts = dict.fromkeys(STATUSES, 0)
+    counts.update(db.session.execute(
+        select(Job.status, func.count()).group_by(Job.status)).all())
+    jobs = Job.query.order_by(Job.id.desc()).limit(recent).all()
+    return {"counts": counts, "jobs": jobs}
+
+
+def _worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+
+
+# ---------------------------------------------------------------------------
+# Worker threads
+# ---------------------------------------------------------------------------
+class JobRunner:
+    """``workers`` daemon threads draining the queue for ``app``.
+
+    The threads belong to the process that started them, so a runner created
+    before a fork starts afresh in the child.
+    """
+
+    def __init__(self, app, workers, poll_seconds):
+        self.app = app
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._threads = [threading.Thread(target=self._run, name=f"jobs-{i}", daemon=True)
+                             for i in range(self.workers)]
+            for thread in self._threads:
+                thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._pid = None
+
+    def _run(self):
+        worker = _worker_name()
+        while not self._stop.is_set():
+            # Cleared before looking, so a job committed meanwhile isn't slept through
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    ran = work(worker, limit=1)
+            except Exception:
+                logger.exception("Job worker %s failed to claim a job", worker)
+                ran = 0
+            if not ran:
+                self._wake.wait(self.poll_seconds)
+
+
+def start_workers():
+    """Start this process's job threads unless JOBS_WORKERS is 0; cheap once started."""
+    extensions = current_app.extensions
+    runner = extensions.get("job_runner")
+    if runner is None:
+        workers = current_app.config["JOBS_WORKERS"]
+        if workers <= 0:
+            return
+        runner = JobRunner(current_app._get_current_object(), workers,
+                           current_app.config["JOBS_POLL_SECONDS"])
+        extensions["job_runner"] = runner
+    runner.start()
+
+
+# ---------------------------------------------------------------------------
+# Session hooks
+# ---------------------------------------------------------------------------
+@event.listens_for(db.session, "after_commit")
+def _wake_workers(session):
+    if session.info.pop("jobs_enqueued", False) and has_app_context():
+        runner = current_app.extensions.get("job_runner")
+        if runner is not None:
+            runner.wake()
+
+
+@event.listens_for(db.session, "after_rollback")
+def _forget_enqueued(session):
+    session.info.pop("jobs_enqueued", None)
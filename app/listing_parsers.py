@@ -0,0 +1,116 @@
+"""Per-site parsers that read a listing page's current price and sale state.
+
+A parser takes the decoded HTML of a listing page and returns a
+``ParsedListing``; any field it can't determine is left as None and the
+stored value is kept. Register a parser for a ``Listing.source_site`` with::
+
+    @register_parser("autotrader")
+    def parse_autotrader(html):
+        ...
+
+Sites without their own parser use ``parse_structured``, which reads the
+schema.org JSON-LD and ``product:price`` meta tags most marketplaces embed.
+"""
+
+import json
+import math
+import re
+from dataclasses import dataclass
+from datetime import date
+
+PARSERS = {}
+MAX_PRICE = 10_000_000  # anything above this is a parse error, not a 2002
+
+_JSON_LD = re.compile(
+    r'<script[^>]+type=["\']application/ld\+json["\'][^>]*>(.*?)</script>', re.S | re.I)
+_META_PRICE = re.compile(
+    r'<meta[^>]+(?:property|itemprop)=["\'](?:product:price:amount|og:price:amount|price)["\']'
+    r'[^>]*content=["\']([\d.,]+)["\']', re.I)
+_SOLD_AVAILABILITY = ("soldout", "outofstock", "discontinued")
+
+
+@dataclass
+class ParsedListing:
+    price_gbp: int = None
+    is_sold: bool = None
+    sold_at: date = None
+
+
+def register_parser(*sites):
+    """Decorator registering a parser for one or more ``source_site`` values."""
+    def decorator(func):
+        for site in sites:
+            PARSERS[site] = func
+        return func
+    return decorator
+
+
+def parser_for(site):
+    return PARSERS.get(site or "", parse_structured)
+
+
+def _price(value):
+    if value is None:
+        return None
+    try:
+        price = float(str(value).replace(",", "").replace("£", ""))
+    except (ValueError, OverflowError):
+        return None
+    if not math.isfinite(price) or not 0 < price <= MAX_PRICE:
+        return None
+    return int(round(price))
+
+
+def _offers(node):
+    """Yield every ``offers`` object in a JSON-LD document."""
+    if isinstance(node, list):
+        for item in node:
+            yield from _offers(item)
+    elif isinstance(node, dict):
+        offers = node.get("offers")
+        if isinstance(offers, dict):
+            yield offers
+        elif isinstance(offers, list):
+            yield from (o for o in offers if isinstance(o, dict))
+        for key in ("@graph", "itemOffered", "mainEntity"):
+            if key in node:
+                yield from _offers(node[key])
+
+
+def parse_structured(html):
+    """Read price and availability from schema.org JSON-LD, falling back to meta tags."""
+    parsed = ParsedListing()
+    for block in _JSON_LD.findall(html):
+        try:
+            document = json.loads(block)
+        except ValueError:
+            continue
+        for offer in _offers(document):
+            if offer.get("priceCurrency", "GBP") != "GBP":
+                continue
+            if parsed.price_gbp is None:
+                parsed.price_gbp = _price(offer.get("price"))
+            availability = str(offer.get("availability", "")).rsplit("/", 1)[-1].lower()
+            if availability:
+                parsed.is_sold = availability in _SOLD_AVAILABILITY
+    if parsed.price_gbp is None:
+        match = _META_PRICE.search(html)
+        if match:
+            parsed.price_gbp = _price(match.group(1))
+    return parsed
+
+
+@register_parser("ebay")
+def parse_ebay(html):
+    parsed = parse_structured(html)
+    if re.search(r"This listing (?:has|was) ended|This item is out of stock", html):
+        parsed.is_sold = True
+    return parsed
+
+
+@register_parser("carandclassic", "pistonheads")
+def parse_classifieds(html):
+    parsed = parse_structured(html)
+    if re.search(r'class="[^"]*\bsold\b[^"]*"[^>]*>\s*sold\s*<', html, re.I):
+        parsed.is_sold = True
+    return parsed
@@ -0,0 +1,46 @@
+"""Market analytics over lightweight price record columns.
+
+The per-variant summaries on /market come from the monthly rollups
+(app/rollups.py); this module holds the trend rule they share and the raw
+sale series behind the charts.
+"""
+
+from sqlalchemy import select
+from app import db
+from app.models import ModelVariant, PriceRecord
+
+TREND_THRESHOLD_PCT = 5
+
+
+def classify_trend(early_avg, late_avg):
+    """Return 'rising', 'stable', or 'falling' from the early/late half averages."""
+    if not early_avg or late_avg is None:
+        return "stable"
+    pct_change = (late_avg - early_avg) / early_avg * 100
+    if pct_change > TREND_THRESHOLD_PCT:
+        return "rising"
+    elif pct_change < -TREND_THRESHOLD_PCT:
+        return "falling"
+    return "stable"
+
+
+def price_history(variant_id=None, start=None, end=None, limit=None):
+    """Return (variant name, sold_date, price, condition) tuples ordered by date.
+
+    ``limit`` caps the number of rows read.
+    """
+    query = (
+        select(ModelVariant.name, PriceRecord.sold_date, PriceRecord.price_gbp,
+               PriceRecord.condition)
+        .join(ModelVariant, PriceRecord.variant_id == ModelVariant.id)
+        .order_by(PriceRecord.sold_date)
+    )
+    if variant_id:
+        query = query.where(PriceRecord.variant_id == variant_id)
+    if start:
+        query = query.where(PriceRecord.sold_date >= start)
+    if end:
+        query = query.where(PriceRecord.sold_date <= end)
+    if limit:
+        query = query.limit(limit)
+    return db.session.execute(query).all()
@@ -1,6 +1,16 @@
 from datetime import datetime, timezone
 from app import db
 
+# The condition grades used by registry cars, listings and price records
+CONDITION_CHOICES = [
+    ("", "-- Select --"),
+    ("concours", "Concours"),
+    ("excellent", "Excellent"),
+    ("good", "Good"),
+    ("fair", "Fair"),
+    ("project", "Project"),
+]
+
 
 class ModelVariant(db.Model):
     """Reference table for BMW 2002 model variants."""
@@ -25,6 +35,12 @@ class ModelVariant(db.Model):
 class RegistryCar(db.Model):
     """Known surviving BMW 2002s in the UK."""
     __tablename__ = "registry_cars"
+    __table_args__ = (
+        # Per-variant counts and the default /registry sort (variant, year)
+        db.Index("ix_registry_cars_variant_year", "variant_id", "year"),
+        db.Index("ix_registry_cars_year", "year"),
+        db.Index("ix_registry_cars_condition", "condition"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     variant_id = db.Column(db.Integer, db.ForeignKey("model_variants.id"), nullable=False)
@@ -41,6 +57,11 @@ class RegistryCar(db.Model):
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc),
                            onupdate=lambda: datetime.now(timezone.utc))
 
+    @property
+    def variant_name(self):
+        # Same attribute the column projections carry (app/projections.py)
+        return self.variant.name
+
     def __repr__(self):
         return f"<RegistryCar {self.year} {self.variant.name if self.variant else '?'}>"
 
@@ -48,6 +69,19 @@ class RegistryCar(db.Model):
 class Listing(db.Model):
     """For-sale listings tracked from UK marketplaces."""
     __tablename__ = "listings"
+    __table_args__ = (
+        # Active-listing counts per variant and the filtered /listings sort
+        db.Index("ix_listings_sold_variant_listed", "is_sold", "variant_id", "listed_at"),
+        db.Index("ix_listings_variant_listed", "variant_id", "listed_at"),
+        # Keyset pagination sort orders on /listings
+        db.Index("ix_listings_listed_at", "listed_at"),
+        db.Index("ix_listings_is_sold_listed_at", "is_sold", "listed_at"),
+        db.Index("ix_listings_price", "price_gbp"),
+        db.Index("ix_listings_year", "year"),
+        # ... and the same on the default active-only /listings
+        db.Index("ix_listings_is_sold_price", "is_sold", "price_gbp"),
+        db.Index("ix_listings_is_sold_year", "is_sold", "year"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     variant_id = db.Column(db.Integer, db.ForeignKey("model_variants.id"), nullable=False)
@@ -66,6 +100,10 @@ class Listing(db.Model):
     sold_at = db.Column(db.Date)
     added_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
+    @property
+    def variant_name(self):
+        return self.variant.name
+
     def __repr__(self):
         return f"<Listing {self.title} £{self.price_gbp}>"
 
@@ -73,6 +111,13 @@ class Listing(db.Model):
 class PriceRecord(db.Model):
     """Historical price data points for market analysis."""
     __tablename__ = "price_records"
+    __table_args__ = (
+        # Covers the (variant, condition) price baselines and per-variant averages
+        db.Index("ix_price_records_variant_condition_price", "variant_id", "condition", "price_gbp"),
+        # Covers the per-variant date-ordered market summary and chart filter
+        db.Index("ix_price_records_variant_sold_price", "variant_id", "sold_date", "price_gbp"),
+        db.Index("ix_price_records_sold_date", "sold_date"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     variant_id = db.Column(db.Integer, db.ForeignKey("model_variants.id"), nullable=False)
@@ -87,3 +132,192 @@ class PriceRecord(db.Model):
 
     def __repr__(self):
         return f"<PriceRecord £{self.price_gbp} on {self.sold_date}>"
+
+
+class VariantStats(db.Model):
+    """Materialized per-variant dashboard aggregates, maintained incrementally."""
+    __tablename__ = "variant_stats"
+
+    variant_id = db.Column(db.Integer, db.ForeignKey("model_variants.id"), primary_key=True)
+    registry_count = db.Column(db.Integer, nullable=False, default=0)
+    listing_count = db.Column(db.Integer, nullable=False, default=0)  # active (unsold) only
+    price_count = db.Column(db.Integer, nullable=False, default=0)
+    price_sum = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<VariantStats variant={self.variant_id}>"
+
+
+class ListingFingerprint(db.Model):
+    """MinHash signature of a listing's text and its duplicate cluster."""
+    __tablename__ = "listing_fingerprints"
+    __table_args__ = (
+        db.Index("ix_listing_fingerprints_cluster", "cluster_id"),
+    )
+
+    listing_id = db.Column(db.Integer, db.ForeignKey("listings.id"), primary_key=True)
+    block = db.Column(db.String(120), nullable=False)  # variant/year/colour blocking key
+    signature = db.Column(db.LargeBinary, nullable=False)
+    # Lowest listing id in the duplicate cluster; NULL when the listing has no duplicates
+    cluster_id = db.Column(db.Integer)
+
+    def __repr__(self):
+        return f"<ListingFingerprint listing={self.listing_id} cluster={self.cluster_id}>"
+
+
+class ListingLshBucket(db.Model):
+    """LSH band bucket membership: listings sharing a bucket are duplicate candidates."""
+    __tablename__ = "listing_lsh_buckets"
+    __table_args__ = (
+        db.Index("ix_listing_lsh_buckets_listing", "listing_id"),
+    )
+
+    bucket = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    listing_id = db.Column(db.Integer, db.ForeignKey("listings.id"), primary_key=True,
+                           autoincrement=False)
+
+
+class PriceRollup(db.Model):
+    """Monthly price bucket per (variant, condition), maintained incrementally."""
+    __tablename__ = "price_rollups"
+    __table_args__ = (
+        # Recent-window reads across all variants
+        db.Index("ix_price_rollups_month", "month"),
+    )
+
+    variant_id = db.Column(db.Integer, db.ForeignKey("model_variants.id"), primary_key=True)
+    condition = db.Column(db.String(20), primary_key=True)  # "" when the record has none
+    month = db.Column(db.Date, primary_key=True)  # first day of the month
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.BigInteger, nullable=False, default=0)
+    min_price = db.Column(db.Integer)
+    max_price = db.Column(db.Integer)
+    sketch = db.Column(db.LargeBinary)  # serialized TDigest of the bucket's prices
+
+    def __repr__(self):
+        return f"<PriceRollup {self.variant_id}/{self.condition or '-'} {self.month:%Y-%m}>"
+
+
+class PriceSketch(db.Model):
+    """All-time price quantile sketch per (variant, condition), maintained incrementally."""
+    __tablename__ = "price_sketches"
+
+    variant_id = db.Column(db.Integer, db.ForeignKey("model_variants.id"), primary_key=True)
+    condition = db.Column(db.String(20), primary_key=True)  # "" when the record has none
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.BigInteger, nullable=False, default=0)
+    sketch = db.Column(db.LargeBinary)  # serialized TDigest of every sale price
+
+    def __repr__(self):
+        return f"<PriceSketch {self.variant_id}/{self.condition or '-'} n={self.count}>"
+
+
+class ListingCheck(db.Model):
+    """Outcome of the last refresh of a listing's source page."""
+    __tablename__ = "listing_checks"
+    __table_args__ = (
+        db.Index("ix_listing_checks_checked_at", "checked_at"),
+    )
+
+    listing_id = db.Column(db.Integer, db.ForeignKey("listings.id"), primary_key=True)
+    checked_at = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(20), nullable=False)  # unchanged, updated, sold, gone, failed
+    http_status = db.Column(db.Integer)
+    # Validators echoed back as If-None-Match / If-Modified-Since on the next check
+    etag = db.Column(db.String(200))
+    last_modified = db.Column(db.String(64))
+    failures = db.Column(db.Integer, nullable=False, default=0)  # consecutive
+    error = db.Column(db.String(200))
+
+    listing = db.relationship("Listing", backref=db.backref(
+        "check", uselist=False, cascade="all, delete-orphan"))
+
+    def __repr__(self):
+        return f"<ListingCheck listing={self.listing_id} {self.status}>"
+
+
+class ReferenceVersion(db.Model):
+    """Change counter for a cached reference table, bumped with every write to it."""
+    __tablename__ = "reference_versions"
+
+    name = db.Column(db.String(60), primary_key=True)  # table name
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<ReferenceVersion {self.name}={self.version}>"
+
+
+class ChangeLogEntry(db.Model):
+    """One insert, update or delete of a tracked row, in commit order (app/changelog.py)."""
+    __tablename__ = "change_log"
+    # AUTOINCREMENT so a sequence number is never reused after old entries are compacted
+    __table_args__ = ({"sqlite_autoincrement": True},)
+
+    seq = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(40), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(1), nullable=False)  # I(nsert), U(pdate) or D(elete)
+    variant_id = db.Column(db.Integer)  # the row's variant (its own id for model_variants)
+    changed_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f"<ChangeLogEntry #{self.seq} {self.op} {self.table_name}/{self.row_id}>"
+
+
+class ChangeLogConsumer(db.Model):
+    """Last change-log sequence number a named consumer has processed."""
+    __tablename__ = "change_log_consumers"
+
+    name = db.Column(db.String(60), primary_key=True)
+    position = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc),
+                           onupdate=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f"<ChangeLogConsumer {self.name}@{self.position}>"
+
+
+class ValuationModel(db.Model):
+    """Fitted log-price coefficients for one variant (app/valuation.py)."""
+    __tablename__ = "valuation_models"
+
+    variant_id = db.Column(db.Integer, db.ForeignKey("model_variants.id"), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)  # bumped by every refit
+    coefficients = db.Column(db.JSON, nullable=False)  # {feature name: coefficient}
+    record_count = db.Column(db.Integer, nullable=False)
+    rmse = db.Column(db.Float)  # residual standard deviation of log(price)
+    fitted_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f"<ValuationModel variant={self.variant_id} v{self.version} n={self.record_count}>"
+
+
+class Job(db.Model):
+    """A queued, running or finished background job (app/jobs.py)."""
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # At most one queued job per key: enqueuing a duplicate coalesces into it
+        db.Index("ix_jobs_queued_key", "key", unique=True,
+                 sqlite_where=db.text("status = 'queued'"),
+                 postgresql_where=db.text("status = 'queued'")),
+        # Claiming the next due job, and the per-status counts on /jobs
+        db.Index("ix_jobs_status_run_after", "status", "run_after"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(60), nullable=False)  # a task registered with @task
+    key = db.Column(db.String(200), nullable=False)  # name plus arguments
+    args = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(10), nullable=False, default="queued")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_after = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    worker = db.Column(db.String(120))
+    result = db.Column(db.String(200))
+    error = db.Column(db.Text)  # the last attempt's exception
+
+    def __repr__(self):
+        return f"<Job #{self.id} {self.key} {self.status}>"
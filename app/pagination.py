@@ -0,0 +1,154 @@
+"""Keyset (cursor) pagination for the list pages.
+
+A page is fetched with ``WHERE (sort key) > (last row's key) ORDER BY key
+LIMIT n`` rather than ``OFFSET``, so the 1,000th page costs the same as the
+first as long as the sort key is backed by an index. Cursors are opaque,
+URL-safe tokens holding the boundary row's key values and the direction.
+
+NULLs sort before every value (ASC NULLS FIRST / DESC NULLS LAST), which is
+SQLite's native order, so nullable keys such as ``listed_at`` page correctly
+and still use their index.
+"""
+
+import base64
+import json
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Callable
+from sqlalchemy import Date, DateTime, Integer, String, and_, false, or_, true
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+@dataclass(frozen=True)
+class SortKey:
+    """One column of a keyset ordering."""
+    column: object
+    getter: Callable  # row -> value of this column
+    descending: bool = False
+    nullable: bool = False
+
+    def order_clause(self, reverse=False):
+        descending = self.descending != reverse
+        clause = self.column.desc() if descending else self.column.asc()
+        if self.nullable:
+            clause = clause.nulls_last() if descending else clause.nulls_first()
+        return clause
+
+    def after(self, value, reverse=False):
+        """SQL predicate: the column sorts strictly after ``value``."""
+        descending = self.descending != reverse
+        if value is None:
+            return self.column.is_not(None) if not descending else false()
+        if descending:
+            beyond = self.column < value
+            return or_(beyond, self.column.is_(None)) if self.nullable else beyond
+        return self.column > value
+
+    def equals(self, value):
+        return self.column.is_(None) if value is None else self.column == value
+
+
+def sort_keys(columns, descending=False):
+    """Build SortKeys from (column, getter, nullable) tuples sharing one direction."""
+    return [SortKey(column, getter, descending, nullable) for column, getter, nullable in columns]
+
+
+@dataclass
+class Page:
+    items: list
+    next_cursor: str = None
+    prev_cursor: str = None
+    per_page: int = DEFAULT_PAGE_SIZE
+
+
+def page_size(requested, default=DEFAULT_PAGE_SIZE):
+    """Clamp a user-supplied page size to 1..MAX_PAGE_SIZE."""
+    if not requested:
+        return default
+    return max(1, min(requested, MAX_PAGE_SIZE))
+
+
+def paginate(query, keys, cursor=None, per_page=DEFAULT_PAGE_SIZE):
+    """Return one Page of ``query`` ordered by ``keys``, starting after ``cursor``."""
+    values, backwards = decode_cursor(cursor, keys)
+    if values is not None:
+        query = query.filter(_after(keys, values, reverse=backwards))
+    rows = (
+        query.order_by(*[k.order_clause(reverse=backwards) for k in keys])
+        .limit(per_page + 1)
+        .all()
+    )
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    page = Page(items=rows, per_page=per_page)
+    if rows:
+        more_after = has_more if not backwards else True
+        more_before = values is not None if not backwards else has_more
+        if more_after:
+            page.next_cursor = encode_cursor(keys, rows[-1])
+        if more_before:
+            page.prev_cursor = encode_cursor(keys, rows[0], backwards=True)
+    return page
+
+
+def _after(keys, values, reverse=False):
+    """Lexicographic ``(k1, k2, ...) > (v1, v2, ...)`` honouring per-key direction."""
+    clauses = []
+    for i, key in enumerate(keys):
+        prefix = [keys[j].equals(values[j]) for j in range(i)]
+        clauses.append(and_(true(), *prefix, key.after(values[i], reverse)))
+    return or_(*clauses)
+
+
+# ---------------------------------------------------------------------------
+# Cursor encoding
+# ---------------------------------------------------------------------------
+def encode_cursor(keys, row, backwards=False):
+    values = []
+    for key in keys:
+        value = key.getter(row)
+        values.append(value.isoformat() if isinstance(value, (date, datetime)) else value)
+    raw = json.dumps({"k": values, "b": int(backwards)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, keys):
+    """Return (values, backwards); an absent or malformed cursor means the first page."""
+    if not cursor:
+        return None, False
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        raw_values = data["k"]
+        if len(raw_values) != len(keys):
+            return None, False
+        values = [_parse(key, value) for key, value in zip(keys, raw_values)]
+        return values, bool(data.get("b"))
+    except (ValueError, TypeError, KeyError):
+        return None, False
+
+
+def _parse(key, value):
+    if value is None:
+        return None
+    column_type = key.column.type
+    if isinstance(column_type, DateTime):
+        return datetime.fromisoformat(value)
+    if isinstance(column_type, Date):
+        return date.fromisoformat(value)
+    if isinstance(column_type, Integer):
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise TypeError("integer cursor value expected")
+        return value
+    if isinstance(column_type, String):
+        if not isinstance(value, str):
+            raise TypeError("string cursor value expected")
+        return value
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise TypeError("unsupported cursor value")
+    return value
@@ -0,0 +1,37 @@
+"""Column projections for the list pages.
+
+/registry and /listings show a handful of columns per row. Selecting just
+those, with the variant name joined in, returns lightweight ``Row`` tuples
+instead of ORM objects: nothing is added to the identity map, unrendered
+columns (listing descriptions, registry provenance) are never fetched, and
+there is no ``row.variant`` relationship to lazy-load. Rows expose the same
+attribute names as the models, plus ``variant_name``, so the templates and
+keyset sort getters work with either.
+"""
+
+from app import db
+from app.models import ModelVariant, RegistryCar, Listing
+
+REGISTRY_COLUMNS = (
+    RegistryCar.id, RegistryCar.variant_id, ModelVariant.name.label("variant_name"),
+    RegistryCar.year, RegistryCar.colour, RegistryCar.location_region, RegistryCar.condition,
+    RegistryCar.mot_status, RegistryCar.mot_expiry, RegistryCar.notes,
+)
+
+LISTING_COLUMNS = (
+    Listing.id, Listing.variant_id, ModelVariant.name.label("variant_name"),
+    Listing.title, Listing.year, Listing.price_gbp, Listing.condition, Listing.location,
+    Listing.source_site, Listing.source_url, Listing.is_sold, Listing.listed_at,
+)
+
+
+def registry_rows():
+    """Query of registry rows as they appear on /registry."""
+    return db.session.query(*REGISTRY_COLUMNS).join(
+        ModelVariant, RegistryCar.variant_id == ModelVariant.id)
+
+
+def listing_rows():
+    """Query of listing rows as they appear on /listings."""
+    return db.session.query(*LISTING_COLUMNS).join(
+        ModelVariant, Listing.variant_id == ModelVariant.id)
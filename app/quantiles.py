@@ -0,0 +1,79 @@
+"""Price quantile sketches per (variant, condition).
+
+``price_sketches`` holds the count and sum of every sale price for a variant
+and condition plus a t-digest of them, so medians and p10/p90 bands are read
+from a few hundred bytes instead of every ``price_records`` row, and a
+variant's sketch is the merge of its conditions'. Inserted PriceRecords are
+folded into their sketch; an edited or deleted record makes its key be
+re-read from ``price_records``, which the (variant, condition, price) index
+covers.
+
+Run ``flask quantiles rebuild`` to re-derive the table in bulk.
+"""
+
+from sqlalchemy import and_, select
+from app import db
+from app.buckets import PriceBuckets, condition_match
+from app.models import PriceRecord, PriceSketch
+from app.sketch import TDigest, merge_all
+
+SKETCH_COMPRESSION = 100
+BANDS = (0.1, 0.5, 0.9)
+
+
+def sketch_key(values):
+    """Return the (variant_id, condition) key for one price record."""
+    return values["variant_id"], values.get("condition") or ""
+
+
+def band_name(q):
+    return f"p{round(q * 100)}"
+
+
+# ---------------------------------------------------------------------------
+# Read path
+# ---------------------------------------------------------------------------
+def load_sketches(variant_ids=None):
+    """Return {(variant_id, condition): (count, total, TDigest)}; condition is None if unrecorded."""
+    query = select(PriceSketch.variant_id, PriceSketch.condition, PriceSketch.count,
+                   PriceSketch.total, PriceSketch.sketch)
+    if variant_ids is not None:
+        query = query.where(PriceSketch.variant_id.in_(variant_ids))
+    return {
+        (variant_id, condition or None): (count, total, TDigest.from_bytes(sketch))
+        for variant_id, condition, count, total, sketch in db.session.execute(query)
+    }
+
+
+def variant_bands(variant_id=None, quantiles=BANDS):
+    """Return {variant_id: {"p10": .., "p50": .., "p90": ..}} across all conditions."""
+    by_variant = {}
+    for (vid, _), (_, _, digest) in load_sketches([variant_id] if variant_id else None).items():
+        by_variant.setdefault(vid, []).append(digest)
+    bands = {}
+    for vid, digests in by_variant.items():
+        merged = merge_all(digests, SKETCH_COMPRESSION)
+        if merged.count:
+            bands[vid] = {band_name(q): int(round(merged.quantile(q))) for q in quantiles}
+    return bands
+
+
+# ---------------------------------------------------------------------------
+# Maintenance
+# ---------------------------------------------------------------------------
+def _records_for_key(key):
+    variant_id, condition = key
+    return and_(PriceRecord.variant_id == variant_id, condition_match(condition))
+
+
+SKETCHES = PriceBuckets(
+    PriceSketch, ("variant_id", "condition"), ("variant_id", "condition"),
+    sketch_key, _records_for_key, SKETCH_COMPRESSION,
+)
+SKETCHES.listen(db.session)
+
+add_records = SKETCHES.add_records
+recompute_sketches = SKETCHES.recompute
+rebuild_price_sketches = SKETCHES.rebuild
+sketches_missing = SKETCHES.missing
+record_bulk_insert = SKETCHES.record_bulk_insert
@@ -0,0 +1,148 @@
+"""Query-plan regression check for the read routes.
+
+Every SELECT issued while rendering the routes in ``CHECKED_URLS`` is
+captured and re-run through ``EXPLAIN QUERY PLAN``. A plan step that scans a
+table without an index (``SCAN <table>``) is a failure unless the table is a
+small reference table listed in ``SCAN_ALLOWED``.
+
+The keyset-paginated list pages in ``PAGINATED_URLS`` are checked twice: as
+the first page and again at the cursor in their "Next" link, since the
+cursor's range predicate gets a plan of its own. On those pages a ``LIMIT``
+query that sorts in a temp B-tree (``USE TEMP B-TREE FOR ORDER BY``) fails
+too: it reads every matching row to return one page. That is allowed only
+when every table the query reads is in ``SORT_ALLOWED`` or ``SCAN_ALLOWED``.
+Run with::
+
+    flask check-plans
+"""
+
+import html
+import re
+from contextlib import contextmanager
+from sqlalchemy import event, text
+from app import db
+
+# Small pages, so the seed data has a second page to follow
+PAGINATED_URLS = [
+    "/registry?per_page=2",
+    "/registry?per_page=2&dir=desc",
+    "/registry?per_page=2&condition=good",
+    "/registry?per_page=2&variant=3",
+    "/registry?per_page=2&sort=year&dir=desc",
+    "/listings?per_page=2",
+    "/listings?per_page=2&sold=1",
+    "/listings?per_page=2&variant=3",
+    "/listings?per_page=2&sort=price",
+    "/listings?per_page=2&sort=year",
+    "/listings?per_page=2&sold=1&sort=year",
+]
+
+CHECKED_URLS = PAGINATED_URLS + [
+    "/",
+    "/market",
+    "/market?variant=1",
+    "/market/chart-data",
+    "/market/chart-data?variant=1&start=2025-01-01",
+    "/market/rollups.json?variant=1",
+    "/search?q=matching+numbers",
+]
+
+# Reference tables that are read whole by design (price_sketches: one row per
+# variant and condition; valuation_models: one row per variant)
+SCAN_ALLOWED = {"model_variants", "price_sketches", "valuation_models"}
+# Tables bounded by something physical, so sorting a page of them is cheap
+# (registry_cars: the UK's surviving cars). SQLite drives a filtered /registry
+# page from registry_cars and sorts it by variant name in a temp B-tree.
+SORT_ALLOWED = {"registry_cars"}
+
+_BARE_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+_TEMP_SORT = "USE TEMP B-TREE FOR ORDER BY"
+_READ = re.compile(r"^(?:SCAN|SEARCH) (\w+)")
+_LIMIT = re.compile(r"\bLIMIT\b", re.IGNORECASE)
+_NEXT_LINK = re.compile(r'<a href="([^"]*cursor=[^"]*)"[^>]*>Next\b')
+
+
+@contextmanager
+def capture_selects(engine):
+    """Collect (statement, parameters) for every SELECT run on ``engine``."""
+    captured = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")) and not executemany:
+            captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", _record)
+    try:
+        yield captured
+    finally:
+        event.remove(engine, "before_cursor_execute", _record)
+
+
+def explain(statement, parameters):
+    """Return the EXPLAIN QUERY PLAN detail lines for one captured statement."""
+    raw = db.engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+        return [row[-1] for row in cursor.fetchall()]
+    finally:
+        raw.close()
+
+
+def full_scans(plan):
+    """Return the tables a plan reads with a bare full-table scan.
+
+    Scans of subqueries and CTEs (``SCAN anon_1``) are not table reads.
+    """
+    tables = []
+    for detail in plan:
+        match = _BARE_SCAN.match(detail.strip())
+        if not match:
+            continue
+        table = match.group(1)
+        if table in db.metadata.tables and table not in SCAN_ALLOWED:
+            tables.append(table)
+    return tables
+
+
+def plan_problems(statement, plan, paginated=False):
+    """Return what is wrong with one statement's plan (an empty list if nothing)."""
+    problems = [f"full scan of {table}" for table in full_scans(plan)]
+    if paginated and _LIMIT.search(statement) and any(_TEMP_SORT in d for d in plan):
+        read = {m.group(1) for m in map(_READ.match, (d.strip() for d in plan)) if m}
+        if read & set(db.metadata.tables) - SORT_ALLOWED - SCAN_ALLOWED:
+            problems.append("page sorted in a temp B-tree")
+    return problems
+
+
+def check_routes(app, urls=CHECKED_URLS):
+    """Render each URL and return a list of (url, statement, plan, problems) failures.
+
+    URLs in ``PAGINATED_URLS`` are also checked at their next page's cursor.
+    """
+    if db.engine.dialect.name != "sqlite":
+        raise RuntimeError("query-plan checks are only implemented for SQLite")
+    client = app.test_client()
+    failures = []
+    pending = list(urls)
+    while pending:
+        url = pending.pop(0)
+        paginated = url in PAGINATED_URLS or "cursor=" in url
+        with capture_selects(db.engine) as captured:
+            # Skip the page cache so the view's queries actually run
+            response = client.get(url, headers={"Cache-Control": "no-cache"})
+        if response.status_code >= 400:
+            failures.append((url, f"HTTP {response.status_code}", [], ["request failed"]))
+            continue
+        for statement, parameters in captured:
+            plan = explain(statement, parameters)
+            problems = plan_problems(statement, plan, paginated)
+            if problems:
+                failures.append((url, statement, plan, problems))
+        if url in PAGINATED_URLS:
+            link = _NEXT_LINK.search(response.get_data(as_text=True))
+            if link is None:
+                failures.append((url, "no next page to follow", [], ["no cursor checked"]))
+            else:
+                pending.append(html.unescape(link.group(1)))
+    return failures
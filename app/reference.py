@@ -0,0 +1,133 @@
+"""Process-wide cache of the ``model_variants`` reference table.
+
+Nearly every page needs the variant list (filters, form choices, dashboard
+rows) but the table changes a few times a year. ``variant_cache`` keeps a
+detached copy per worker and merges it into the request's session without
+SQL, which also lets lazy ``listing.variant`` loads resolve from the identity
+map.
+
+A write to a cached table bumps its row in ``reference_versions`` in the same
+transaction. The writing worker drops its copy at commit; other workers read
+the version (one primary-key lookup) at most every
+``REFERENCE_CHECK_SECONDS`` and reload when it has moved.
+"""
+
+import threading
+import time
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from app import db
+from app.models import ModelVariant, ReferenceVersion
+
+_caches = []
+
+
+class ReferenceCache:
+    """Read-mostly, version-checked copy of a small table."""
+
+    def __init__(self, model, order_by):
+        self.model = model
+        self.order_by = order_by
+        self._key = inspect(model).primary_key[0].key
+        self._lock = threading.Lock()
+        self._rows = None
+        self._by_id = {}
+        self._version = None
+        self._checked = 0.0
+        self._stale = False
+        _caches.append(self)
+
+    @property
+    def name(self):
+        return self.model.__tablename__
+
+    def invalidate(self):
+        self._stale = True
+
+    def rows(self):
+        """Return the cached rows (detached), reloading if the table has changed."""
+        with self._lock:
+            now = time.monotonic()
+            if (self._rows is not None and not self._stale
+                    and now - self._checked < _check_interval()):
+                return self._rows
+            version = current_version(db.session.connection(), self.name)
+            self._checked = now
+            if self._rows is None or self._stale or version != self._version:
+                self._stale = False
+                self._rows = self._load()
+                self._by_id = {getattr(row, self._key): row for row in self._rows}
+                self._version = version
+            return self._rows
+
+    def all(self):
+        """Return the rows as instances attached to the current session, without SQL."""
+        return [db.session.merge(row, load=False) for row in self.rows()]
+
+    def get(self, row_id):
+        """Return one row attached to the current session, or None."""
+        self.rows()
+        row = self._by_id.get(row_id)
+        return db.session.merge(row, load=False) if row is not None else None
+
+    def _load(self):
+        # A private session, so the copies are detached as soon as it closes
+        with Session(db.engine) as session:
+            return tuple(session.scalars(select(self.model).order_by(self.order_by)))
+
+
+variant_cache = ReferenceCache(ModelVariant, ModelVariant.name)
+
+
+def variant_choices():
+    """Return (id, name) tuples for variant select fields."""
+    return [(v.id, v.name) for v in variant_cache.rows()]
+
+
+def current_version(connection, name):
+    return connection.execute(
+        select(ReferenceVersion.version).where(ReferenceVersion.name == name)
+    ).scalar() or 0
+
+
+def bump_version(connection, name):
+    table = ReferenceVersion.__table__
+    result = connection.execute(
+        table.update().where(table.c.name == name).values(version=table.c.version + 1))
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(name=name, version=1))
+
+
+def _check_interval():
+    if not has_app_context():
+        return 0.0
+    return current_app.config.get("REFERENCE_CHECK_SECONDS", 5.0)
+
+
+# ---------------------------------------------------------------------------
+# Invalidation
+# ---------------------------------------------------------------------------
+@event.listens_for(db.session, "after_flush")
+def _bump_changed_tables(session, flush_context):
+    changed = session.info.setdefault("changed_reference_tables", set())
+    # Collection-only changes (e.g. a backref append to variant.listings) don't count
+    touched = list(session.new) + list(session.deleted) + [
+        obj for obj in session.dirty if session.is_modified(obj, include_collections=False)]
+    for cache in _caches:
+        if cache in changed:
+            continue
+        if any(isinstance(obj, cache.model) for obj in touched):
+            bump_version(session.connection(), cache.name)
+            changed.add(cache)
+
+
+@event.listens_for(db.session, "after_commit")
+def _invalidate_changed(session):
+    for cache in session.info.pop("changed_reference_tables", ()):
+        cache.invalidate()
+
+
+@event.listens_for(db.session, "after_rollback")
+def _discard_changed(session):
+    session.info.pop("changed_reference_tables", None)
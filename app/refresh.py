@@ -0,0 +1,459 @@
+"""Re-check active listings against their source pages.
+
+``refresh_listings()`` re-fetches the ``source_url`` of every active listing
+not checked in the last ``REFRESH_MIN_AGE_HOURS``, concurrently on one asyncio
+event loop:
+
+* each ``source_site`` has its own pool of workers (``REFRESH_CONCURRENCY``)
+  and token bucket (``REFRESH_RATE`` requests a second), overridable per site
+  in ``REFRESH_SITE_LIMITS``; a 429/503 pauses that site for its Retry-After;
+* connections are kept alive and reused per host;
+* each page's ETag / Last-Modified is kept in ``listing_checks`` and sent back
+  as If-None-Match / If-Modified-Since, so an unchanged page costs a 304;
+* pages are read by the site's parser (app/listing_parsers.py) and the price,
+  ``is_sold`` and ``sold_at`` changes are committed in batches of
+  ``REFRESH_BATCH_SIZE`` through the ORM, so the derived-data hooks see them.
+
+A 404 or 410 means the car has gone (sold or withdrawn) and closes the listing.
+The HTTP client is a small stdlib HTTP/1.1 implementation, so the worker needs
+no extra packages; ``benchmarks/bench_refresh.py`` runs it against a local
+stub server.
+"""
+
+import asyncio
+import re
+import ssl
+import time
+import zlib
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import urljoin, urlsplit
+from flask import current_app
+from sqlalchemy import or_, select
+from app import db
+from app.listing_parsers import ParsedListing, parser_for
+from app.models import Listing, ListingCheck
+
+MAX_BODY = 4 * 1024 * 1024
+MAX_RETRY_AFTER = 300
+_REDIRECTS = {301, 302, 303, 307, 308}
+_THROTTLED = {429, 503}
+
+
+# ---------------------------------------------------------------------------
+# HTTP client
+# ---------------------------------------------------------------------------
+class HttpError(Exception):
+    """A request failed before a complete response was read."""
+
+
+@dataclass
+class Response:
+    status: int
+    headers: dict  # lower-cased names
+    body: bytes
+
+    def text(self):
+        match = re.search(r"charset=([\w-]+)", self.headers.get("content-type", ""))
+        try:
+            return self.body.decode(match.group(1) if match else "utf-8", errors="replace")
+        except LookupError:
+            return self.body.decode("utf-8", errors="replace")
+
+
+class HttpClient:
+    """Minimal asyncio HTTP/1.1 GET client with per-host keep-alive connections."""
+
+    def __init__(self, timeout=15.0, user_agent="tracker", max_idle=8):
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.max_idle = max_idle
+        self.connections_opened = 0
+        self._idle = {}  # (scheme, host, port) -> [(reader, writer)]
+
+    async def get(self, url, headers=None, max_redirects=5):
+        for _ in range(max_redirects + 1):
+            response = await asyncio.wait_for(self._request(url, headers or {}), self.timeout)
+            if response.status not in _REDIRECTS or "location" not in response.headers:
+                return response
+            url = urljoin(url, response.headers["location"])
+        raise HttpError("too many redirects")
+
+    async def close(self):
+        for connections in self._idle.values():
+            for _, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+    async def _request(self, url, headers):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise HttpError(f"unsupported URL {url!r}")
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        lines = [
+            f"GET {path} HTTP/1.1",
+            f"Host: {parts.netloc.rpartition('@')[2]}",
+            f"User-Agent: {self.user_agent}",
+            "Accept: text/html,application/xhtml+xml",
+            "Accept-Encoding: gzip",
+            *(f"{name}: {value}" for name, value in headers.items()),
+        ]
+        request = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+        idle = self._idle.setdefault(key, [])
+        while idle:
+            reader, writer = idle.pop()
+            try:
+                return await self._exchange(key, reader, writer, request)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                continue  # the server closed it while idle; GET is safe to resend
+        reader, writer = await self._connect(key)
+        try:
+            return await self._exchange(key, reader, writer, request)
+        except (ConnectionError, asyncio.IncompleteReadError) as exc:
+            raise HttpError(f"connection lost: {exc}") from exc
+
+    async def _connect(self, key):
+        scheme, host, port = key
+        try:
+            connection = await asyncio.open_connection(
+                host, port, ssl=ssl.create_default_context() if scheme == "https" else None)
+        except OSError as exc:
+            raise HttpError(f"cannot connect to {host}:{port}: {exc}") from exc
+        self.connections_opened += 1
+        return connection
+
+    async def _exchange(self, key, reader, writer, request):
+        try:
+            writer.write(request)
+            await writer.drain()
+            status, headers, reusable = await _read_head(reader)
+            body, reusable = await _read_body(reader, status, headers, reusable)
+        except BaseException:
+            writer.close()
+            raise
+        if reusable and len(self._idle[key]) < self.max_idle:
+            self._idle[key].append((reader, writer))
+        else:
+            writer.close()
+        if headers.get("content-encoding", "").lower() == "gzip" and body:
+            body = _gunzip(body)
+        return Response(status, headers, body)
+
+
+def _gunzip(body):
+    """Decompress a gzip body, refusing corrupt data and anything over MAX_BODY."""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = decompressor.decompress(body, MAX_BODY + 1)
+    except zlib.error as exc:
+        raise HttpError(f"corrupt gzip body: {exc}") from exc
+    if len(data) > MAX_BODY or decompressor.unconsumed_tail:
+        raise HttpError("decompressed response too large")
+    return data
+
+
+async def _read_head(reader):
+    line = await reader.readline()
+    if not line:
+        raise asyncio.IncompleteReadError(b"", None)
+    version, _, rest = line.decode("latin-1").partition(" ")
+    if not version.startswith("HTTP/") or not rest[:3].isdigit():
+        raise HttpError(f"malformed status line {line[:80]!r}")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    reusable = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+    return int(rest[:3]), headers, reusable
+
+
+async def _read_body(reader, status, headers, reusable):
+    if status in (204, 304) or status < 200:
+        return b"", reusable
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        chunks, size = [], 0
+        while True:
+            length = int(((await reader.readline()).split(b";")[0].strip() or b"0"), 16)
+            if not length:
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass  # trailers
+                return b"".join(chunks), reusable
+            size += length
+            if size > MAX_BODY:
+                raise HttpError("response too large")
+            chunks.append(await reader.readexactly(length))
+            await reader.readexactly(2)
+    if "content-length" in headers:
+        length = int(headers["content-length"])
+        if length > MAX_BODY:
+            raise HttpError("response too large")
+        return await reader.readexactly(length), reusable
+    # No framing: the body runs to EOF and the connection can't be reused
+    body = await reader.read(MAX_BODY + 1)
+    while len(body) <= MAX_BODY:
+        chunk = await reader.read(MAX_BODY + 1 - len(body))
+        if not chunk:
+            return body, False
+        body += chunk
+    raise HttpError("response too large")
+
+
+# ---------------------------------------------------------------------------
+# Rate limiting
+# ---------------------------------------------------------------------------
+class TokenBucket:
+    """Async token bucket: ``rate`` requests a second with bursts of up to ``burst``."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                if self.rate <= 0:
+                    return
+                self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+# ---------------------------------------------------------------------------
+# Refresh pipeline
+# ---------------------------------------------------------------------------
+@dataclass
+class Target:
+    listing_id: int
+    site: str
+    url: str
+    etag: str = None
+    last_modified: str = None
+    attempts: int = 0
+
+
+@dataclass
+class CheckResult:
+    target: Target
+    status: str  # fetched, unchanged, gone, failed
+    http_status: int = None
+    parsed: ParsedListing = None
+    etag: str = None
+    last_modified: str = None
+    error: str = None
+    retry_after: float = None
+
+
+@dataclass
+class RefreshReport:
+    checked: int = 0
+    elapsed: float = 0.0
+    connections: int = 0
+    statuses: Counter = field(default_factory=Counter)
+
+    @property
+    def requests_per_second(self):
+        return self.checked / self.elapsed if self.elapsed else 0.0
+
+
+def site_limits(config, site):
+    """Return (concurrency, requests per second) for ``site``."""
+    default = (config["REFRESH_CONCURRENCY"], config["REFRESH_RATE"])
+    return config.get("REFRESH_SITE_LIMITS", {}).get(site, default)
+
+
+def due_listings(min_age_hours, site=None, limit=None):
+    """Return Targets for active listings with a URL not checked within ``min_age_hours``."""
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=min_age_hours)
+    query = (
+        select(Listing.id, Listing.source_site, Listing.source_url,
+               ListingCheck.etag, ListingCheck.last_modified)
+        .outerjoin(ListingCheck, ListingCheck.listing_id == Listing.id)
+        .where(Listing.is_sold == False, Listing.source_url.is_not(None))  # noqa: E712
+        .where(or_(ListingCheck.checked_at.is_(None), ListingCheck.checked_at < cutoff))
+        .order_by(ListingCheck.checked_at.asc().nulls_first(), Listing.id)
+    )
+    if site:
+        query = query.where(Listing.source_site == site)
+    if limit:
+        query = query.limit(limit)
+    return [Target(*row) for row in db.session.execute(query)]
+
+
+def refresh_listings(site=None, limit=None, min_age_hours=None):
+    """Re-check due listings against their source pages; returns a RefreshReport."""
+    config = current_app.config
+    if min_age_hours is None:
+        min_age_hours = config["REFRESH_MIN_AGE_HOURS"]
+    report = RefreshReport()
+    targets = due_listings(min_age_hours, site, limit)
+    if targets:
+        started = time.perf_counter()
+        asyncio.run(_refresh(targets, config, report))
+        report.elapsed = time.perf_counter() - started
+    return report
+
+
+async def _refresh(targets, config, report):
+    queues = {}
+    for target in targets:
+        queues.setdefault(target.site, deque()).append(target)
+
+    pending = []
+
+    def collect(result):
+        pending.append(result)
+        if len(pending) >= config["REFRESH_BATCH_SIZE"]:
+            flush()
+
+    def flush():
+        report.statuses.update(apply_results(pending))
+        report.checked += len(pending)
+        pending.clear()
+
+    plan = []
+    for site, queue in queues.items():
+        concurrency, rate = site_limits(config, site)
+        plan.append((queue, TokenBucket(rate), max(1, min(concurrency, len(queue)))))
+    # Sites may share a host (a CDN, or a stub server), so keep enough idle
+    # connections per host for every worker
+    client = HttpClient(config["REFRESH_TIMEOUT"], config["REFRESH_USER_AGENT"],
+                        max_idle=sum(workers for _, _, workers in plan))
+    try:
+        await asyncio.gather(*[
+            _site_worker(client, bucket, queue, collect)
+            for queue, bucket, workers in plan
+            for _ in range(workers)
+        ])
+        if pending:
+            flush()
+    finally:
+        report.connections = client.connections_opened
+        await client.close()
+
+
+async def _site_worker(client, bucket, queue, collect):
+    while queue:
+        target = queue.popleft()
+        await bucket.acquire()
+        result = await check_listing(client, target)
+        if result.http_status in _THROTTLED and target.attempts == 0:
+            # Back off the whole site, then give this listing one more try
+            bucket.pause(result.retry_after or 30)
+            target.attempts += 1
+            queue.append(target)
+            continue
+        collect(result)
+
+
+async def check_listing(client, target):
+    """Fetch one listing page (conditionally) and parse it.
+
+    Anything that goes wrong with this one page becomes a "failed" result, so
+    it can't abort the rest of the run.
+    """
+    headers = {}
+    if target.etag:
+        headers["If-None-Match"] = target.etag
+    if target.last_modified:
+        headers["If-Modified-Since"] = target.last_modified
+    try:
+        response = await client.get(target.url, headers)
+    except Exception as exc:
+        return CheckResult(target, "failed", error=str(exc) or type(exc).__name__)
+
+    if response.status == 304:
+        return CheckResult(target, "unchanged", 304, etag=target.etag,
+                           last_modified=target.last_modified)
+    if response.status in (404, 410):
+        return CheckResult(target, "gone", response.status)
+    if response.status != 200:
+        return CheckResult(target, "failed", response.status, error=f"HTTP {response.status}",
+                           retry_after=_retry_after(response.headers.get("retry-after")))
+    try:
+        parsed = parser_for(target.site)(response.text())
+    except Exception as exc:
+        return CheckResult(target, "failed", 200, error=f"unparseable page: {exc!r}"[:200])
+    return CheckResult(target, "fetched", 200, parsed, response.headers.get("etag"),
+                       response.headers.get("last-modified"))
+
+
+def _retry_after(value):
+    if value and value.strip().isdigit():
+        return min(int(value), MAX_RETRY_AFTER)
+    return None
+
+
+def apply_results(results, today=None):
+    """Write a batch of CheckResults in one transaction; returns a Counter of outcomes."""
+    today = today or date.today()
+    now = datetime.now(timezone.utc)
+    ids = [result.target.listing_id for result in results]
+    listings = {listing.id: listing for listing in Listing.query.filter(Listing.id.in_(ids))}
+    checks = {check.listing_id: check
+              for check in ListingCheck.query.filter(ListingCheck.listing_id.in_(ids))}
+
+    outcomes = Counter()
+    for result in results:
+        listing = listings.get(result.target.listing_id)
+        if listing is None:
+            continue  # deleted while its page was being fetched
+        status = result.status
+        if status == "gone":
+            _close(listing, today)
+        elif status == "fetched":
+            status = _apply_parsed(listing, result.parsed, today)
+
+        check = checks.get(listing.id)
+        if check is None:
+            check = ListingCheck(listing_id=listing.id, failures=0)
+            db.session.add(check)
+        check.checked_at = now
+        check.status = status
+        check.http_status = result.http_status
+        if status == "failed":
+            check.failures = (check.failures or 0) + 1
+            check.error = (result.error or "")[:200]
+        else:
+            check.failures = 0
+            check.error = None
+            check.etag = result.etag
+            check.last_modified = result.last_modified
+        outcomes[status] += 1
+    db.session.commit()
+    return outcomes
+
+
+def _apply_parsed(listing, parsed, today):
+    status = "unchanged"
+    if parsed.price_gbp and parsed.price_gbp != listing.price_gbp:
+        listing.price_gbp = parsed.price_gbp
+        status = "updated"
+    if parsed.is_sold and not listing.is_sold:
+        _close(listing, parsed.sold_at or today)
+        status = "sold"
+    return status
+
+
+def _close(listing, sold_at):
+    listing.is_sold = True
+    listing.sold_at = listing.sold_at or sold_at
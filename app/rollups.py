@@ -0,0 +1,186 @@
+"""Monthly price rollups for trend and median queries.
+
+``price_rollups`` holds one row per (variant, condition, month) with the
+count, sum, min and max of that month's sale prices plus a t-digest of them.
+Session events keep it current: inserted PriceRecords are folded into their
+bucket, and an edited or deleted record makes its bucket(s) be recomputed
+from that month's records. Market summaries, trends and rolling medians then
+read the buckets — O(months), however many sales there are.
+
+Run ``flask rollups rebuild`` to re-derive the table from ``price_records``.
+"""
+
+from datetime import date
+from sqlalchemy import and_, func, select
+from app import db
+from app.buckets import PriceBuckets, condition_match
+from app.market import classify_trend
+from app.models import PriceRecord, PriceRollup
+from app.sketch import TDigest, merge_all
+
+SKETCH_COMPRESSION = 50
+DEFAULT_ROLLING_MONTHS = 6
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(month, n):
+    """Return the first day of the month ``n`` months after ``month``."""
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def recent_start(recent_months, today=None):
+    """First month of a window of ``recent_months`` months ending with the current one."""
+    return add_months(month_start(today or date.today()), -(max(recent_months, 1) - 1))
+
+
+def bucket_key(values):
+    """Return the (variant_id, condition, month) bucket for one price record."""
+    sold = values["sold_date"]
+    if isinstance(sold, str):
+        sold = date.fromisoformat(sold)
+    return values["variant_id"], values.get("condition") or "", month_start(sold)
+
+
+# ---------------------------------------------------------------------------
+# Read path
+# ---------------------------------------------------------------------------
+def monthly_totals(variant_id=None):
+    """Return {variant_id: [(month, count, total, min, max), ...]} merged across conditions."""
+    query = (
+        select(PriceRollup.variant_id, PriceRollup.month, func.sum(PriceRollup.count),
+               func.sum(PriceRollup.total), func.min(PriceRollup.min_price),
+               func.max(PriceRollup.max_price))
+        .group_by(PriceRollup.variant_id, PriceRollup.month)
+        .order_by(PriceRollup.variant_id, PriceRollup.month)
+    )
+    if variant_id:
+        query = query.where(PriceRollup.variant_id == variant_id)
+    series = {}
+    for vid, month, count, total, lo, hi in db.session.execute(query):
+        series.setdefault(vid, []).append((month, count, int(total), lo, hi))
+    return series
+
+
+def _sketches(variant_id=None, since=None):
+    query = select(PriceRollup.variant_id, PriceRollup.sketch)
+    if variant_id:
+        query = query.where(PriceRollup.variant_id == variant_id)
+    if since:
+        query = query.where(PriceRollup.month >= since)
+    return db.session.execute(query)
+
+
+def rollup_summaries(variant_id=None, recent_months=12, today=None):
+    """Return {variant_id: summary dict} for the /market table, from the rollups.
+
+    The recent window covers the last ``recent_months`` calendar months, and
+    its median is read from the merged bucket sketches. The trend compares the
+    average of the first half of a variant's sales with the second half; the
+    month that straddles the midpoint is split pro rata.
+    """
+    since = recent_start(recent_months, today)
+    summaries = {}
+    for vid, months in monthly_totals(variant_id).items():
+        count = sum(m[1] for m in months)
+        total = sum(m[2] for m in months)
+        recent = [m for m in months if m[0] >= since]
+        recent_count = sum(m[1] for m in recent)
+        summaries[vid] = {
+            "count": count,
+            "min_price": min(m[3] for m in months),
+            "max_price": max(m[4] for m in months),
+            "avg_price": int(total / count),
+            "recent_avg": int(sum(m[2] for m in recent) / recent_count) if recent_count else None,
+            "recent_count": recent_count,
+            "recent_median": None,
+            "trend": classify_trend(*_half_averages(months, count)),
+        }
+
+    digests = {}
+    for vid, sketch in _sketches(variant_id, since):
+        if vid in summaries:
+            digests.setdefault(vid, []).append(TDigest.from_bytes(sketch))
+    for vid, parts in digests.items():
+        median = merge_all(parts, SKETCH_COMPRESSION).median()
+        summaries[vid]["recent_median"] = int(round(median)) if median is not None else None
+    return summaries
+
+
+def _half_averages(months, count):
+    half = count // 2
+    if count < 2:
+        return None, None
+    early = late = 0.0
+    seen = 0
+    for _, n, total, _, _ in months:
+        early_n = min(max(half - seen, 0), n)
+        early += total * early_n / n
+        late += total * (n - early_n) / n
+        seen += n
+    return early / half, late / (count - half)
+
+
+def rolling_medians(variant_id, window=DEFAULT_ROLLING_MONTHS, condition=None):
+    """Return per-month rows for one variant with a median over the trailing ``window`` months.
+
+    Each month's digest is merged once per window it falls in, so the cost is
+    O(months x window) sketch merges and never touches ``price_records``.
+    """
+    query = (
+        select(PriceRollup.month, PriceRollup.count, PriceRollup.total, PriceRollup.sketch)
+        .where(PriceRollup.variant_id == variant_id)
+        .order_by(PriceRollup.month)
+    )
+    if condition is not None:
+        query = query.where(PriceRollup.condition == (condition or ""))
+    months = {}
+    for month, count, total, sketch in db.session.execute(query):
+        slot = months.setdefault(month, [0, 0, []])
+        slot[0] += count
+        slot[1] += total
+        slot[2].append(TDigest.from_bytes(sketch))
+
+    series = []
+    ordered = sorted(months)
+    for i, month in enumerate(ordered):
+        count, total, parts = months[month]
+        first = add_months(month, -(window - 1))
+        trailing = [d for m in ordered[max(0, i - window + 1):i + 1] if m >= first
+                    for d in months[m][2]]
+        monthly = merge_all(parts, SKETCH_COMPRESSION)
+        rolling = merge_all(trailing, SKETCH_COMPRESSION)
+        series.append({
+            "month": month.isoformat(),
+            "count": count,
+            "avg": int(total / count),
+            "median": int(round(monthly.median())),
+            "rolling_count": len(rolling),
+            "rolling_median": int(round(rolling.median())),
+        })
+    return series
+
+
+# ---------------------------------------------------------------------------
+# Maintenance
+# ---------------------------------------------------------------------------
+def _records_in_bucket(key):
+    variant_id, condition, month = key
+    return and_(PriceRecord.variant_id == variant_id, condition_match(condition),
+                PriceRecord.sold_date >= month, PriceRecord.sold_date < add_months(month, 1))
+
+
+BUCKETS = PriceBuckets(
+    PriceRollup, ("variant_id", "condition", "month"), ("variant_id", "condition", "sold_date"),
+    bucket_key, _records_in_bucket, SKETCH_COMPRESSION, extremes=True,
+)
+BUCKETS.listen(db.session)
+
+add_records = BUCKETS.add_records
+recompute_buckets = BUCKETS.recompute
+rebuild_rollups = BUCKETS.rebuild
+rollups_missing = BUCKETS.missing
+record_bulk_insert = BUCKETS.record_bulk_insert
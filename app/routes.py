@@ -1,78 +1,115 @@
+import tempfile
 from datetime import date
-from flask import Blueprint, render_template, redirect, url_for, flash, request
-from sqlalchemy import func
+from operator import attrgetter
+from flask import (
+    Blueprint, render_template, redirect, url_for, flash, request, jsonify, abort,
+    current_app, Response, send_file, stream_with_context,
+)
 from app import db
 from app.models import ModelVariant, RegistryCar, Listing, PriceRecord
-from app.forms import RegistryCarForm, ListingForm, PriceRecordForm
+from app.stats import dashboard_stats
+from app.reference import variant_cache, variant_choices
+from app.projections import registry_rows, listing_rows
+from app.deals import rate_listings
+from app.dedup import collapse_duplicates, duplicate_sites
+from app.rollups import rollup_summaries, rolling_medians, recent_start
+from app.quantiles import variant_bands
+from app.charts import chart_payload, DOWNSAMPLE_MODES, DEFAULT_MAX_POINTS, RAW_MAX_POINTS
+from app.pagination import paginate, page_size, sort_keys
+from app.exporter import (
+    EXPORT_KINDS, EXPORT_FORMATS, CONTENT_TYPES,
+    export_rows, export_columns, iter_csv, iter_jsonl, write_parquet, parquet_available,
+)
+from app.instrumentation import instrument_blueprint, render_metrics
+from app.assets import compress_responses
+from app.cache import cached_response, cached_fragment
+from app.search import search as search_text, SEARCH_KINDS, DEFAULT_LIMIT
+from app.jobs import job_status, start_workers
+from app import tasks  # noqa: F401 -- registers the job tasks and the writes that queue them
+
+# Forms are imported inside the views that use them, which keeps WTForms off
+# the worker boot path.
 
 main = Blueprint("main", __name__)
-
-
-def _variant_choices():
-    """Return list of (id, name) tuples for select fields."""
-    return [(v.id, v.name) for v in ModelVariant.query.order_by(ModelVariant.name).all()]
+instrument_blueprint(main)
+compress_responses(main)
+main.add_app_template_global(cached_fragment)
+# Job threads start with the first request, so each forked worker gets its own
+main.before_app_request(start_workers)
+
+# Sortable columns: name -> ((column, row getter, nullable), ...), default descending.
+# Every ordering ends in the primary key so keyset cursors are unique.
+REGISTRY_SORTS = {
+    "variant": ([(ModelVariant.name, attrgetter("variant_name"), False),
+                 (RegistryCar.year, attrgetter("year"), False),
+                 (RegistryCar.id, attrgetter("id"), False)], False),
+    "year": ([(RegistryCar.year, attrgetter("year"), False),
+              (RegistryCar.id, attrgetter("id"), False)], False),
+}
+LISTING_SORTS = {
+    "listed": ([(Listing.listed_at, attrgetter("listed_at"), True),
+                (Listing.id, attrgetter("id"), False)], True),
+    "price": ([(Listing.price_gbp, attrgetter("price_gbp"), False),
+               (Listing.id, attrgetter("id"), False)], False),
+    "year": ([(Listing.year, attrgetter("year"), True),
+              (Listing.id, attrgetter("id"), False)], False),
+}
+
+
+def _sort_args(sorts, default):
+    """Resolve ?sort=&dir= into (sort name, descending, keyset SortKeys)."""
+    sort = request.args.get("sort", default)
+    if sort not in sorts:
+        sort = default
+    columns, default_desc = sorts[sort]
+    direction = request.args.get("dir")
+    descending = default_desc if direction not in ("asc", "desc") else direction == "desc"
+    return sort, descending, sort_keys(columns, descending)
+
+
+def _per_page():
+    return page_size(request.args.get("per_page", type=int),
+                     default=current_app.config["PAGE_SIZE"])
 
 
 # ---------------------------------------------------------------------------
 # Dashboard
 # ---------------------------------------------------------------------------
 @main.route("/")
+@cached_response
 def index():
-    total_registry = RegistryCar.query.count()
-    total_listings = Listing.query.filter_by(is_sold=False).count()
-    total_sold = PriceRecord.query.count()
-    variants = ModelVariant.query.order_by(ModelVariant.name).all()
-
-    # Aggregate stats per variant
-    variant_stats = []
-    for v in variants:
-        avg_price = (
-            db.session.query(func.avg(PriceRecord.price_gbp))
-            .filter(PriceRecord.variant_id == v.id)
-            .scalar()
-        )
-        listing_count = Listing.query.filter_by(variant_id=v.id, is_sold=False).count()
-        registry_count = RegistryCar.query.filter_by(variant_id=v.id).count()
-        variant_stats.append({
-            "variant": v,
-            "avg_price": int(avg_price) if avg_price else None,
-            "listing_count": listing_count,
-            "registry_count": registry_count,
-        })
-
-    return render_template(
-        "index.html",
-        total_registry=total_registry,
-        total_listings=total_listings,
-        total_sold=total_sold,
-        variant_stats=variant_stats,
-    )
+    return render_template("index.html", **dashboard_stats())
 
 
 # ---------------------------------------------------------------------------
 # Registry — known surviving BMW 02s in the UK
 # ---------------------------------------------------------------------------
 @main.route("/registry")
+@cached_response
 def registry():
     variant_filter = request.args.get("variant", type=int)
     condition_filter = request.args.get("condition")
+    sort, descending, keys = _sort_args(REGISTRY_SORTS, default="variant")
 
-    query = RegistryCar.query.join(ModelVariant)
+    query = registry_rows()
     if variant_filter:
         query = query.filter(RegistryCar.variant_id == variant_filter)
     if condition_filter:
         query = query.filter(RegistryCar.condition == condition_filter)
 
-    cars = query.order_by(ModelVariant.name, RegistryCar.year).all()
-    variants = ModelVariant.query.order_by(ModelVariant.name).all()
-    return render_template("registry.html", cars=cars, variants=variants,
-                           variant_filter=variant_filter, condition_filter=condition_filter)
+    page = paginate(query, keys, cursor=request.args.get("cursor"),
+                    per_page=_per_page())
+    variants = variant_cache.all()
+    return render_template("registry.html", cars=page.items, page=page, variants=variants,
+                           variant_filter=variant_filter, condition_filter=condition_filter,
+                           sort=sort, descending=descending)
 
 
 @main.route("/registry/add", methods=["GET", "POST"])
 def registry_add():
+    from app.forms import RegistryCarForm
     form = RegistryCarForm()
-    form.variant_id.choices = _variant_choices()
+    form.variant_id.choices = variant_choices()
     if form.validate_on_submit():
         car = RegistryCar()
         form.populate_obj(car)
@@ -86,8 +123,9 @@ def registry_add():
 @main.route("/registry/<int:car_id>/edit", methods=["GET", "POST"])
 def registry_edit(car_id):
     car = RegistryCar.query.get_or_404(car_id)
+    from app.forms import RegistryCarForm
     form = RegistryCarForm(obj=car)
-    form.variant_id.choices = _variant_choices()
+    form.variant_id.choices = variant_choices()
     if form.validate_on_submit():
         form.populate_obj(car)
         db.session.commit()
@@ -109,34 +147,41 @@ def registry_delete(car_id):
 # Listings — for-sale tracker
 # ---------------------------------------------------------------------------
 @main.route("/listings")
+@cached_response
 def listings():
     show_sold = request.args.get("sold", "0") == "1"
+    show_dupes = request.args.get("dupes", "0") == "1"
     variant_filter = request.args.get("variant", type=int)
+    sort, descending, keys = _sort_args(LISTING_SORTS, default="listed")
+    dedup = current_app.config["DEDUP_ENABLED"]
 
-    query = Listing.query.join(ModelVariant)
+    query = listing_rows()
     if not show_sold:
         query = query.filter(Listing.is_sold == False)  # noqa: E712
     if variant_filter:
         query = query.filter(Listing.variant_id == variant_filter)
+    if dedup and not show_dupes:
+        query = collapse_duplicates(query, show_sold)
 
-    all_listings = query.order_by(Listing.listed_at.desc()).all()
-    variants = ModelVariant.query.order_by(ModelVariant.name).all()
+    page = paginate(query, keys, cursor=request.args.get("cursor"),
+                    per_page=_per_page())
+    variants = variant_cache.all()
 
-    # Compute deal ratings for active listings
-    deal_ratings = {}
-    for listing in all_listings:
-        if not listing.is_sold:
-            deal_ratings[listing.id] = _compute_deal_rating(listing)
+    # Rate every active listing on the page against the cached price baselines
+    deal_ratings = rate_listings(page.items)
+    duplicates = duplicate_sites(page.items, show_sold) if dedup else {}
 
-    return render_template("listings.html", listings=all_listings, variants=variants,
+    return render_template("listings.html", listings=page.items, page=page, variants=variants,
                            variant_filter=variant_filter, show_sold=show_sold,
-                           deal_ratings=deal_ratings)
+                           show_dupes=show_dupes, duplicates=duplicates,
+                           deal_ratings=deal_ratings, sort=sort, descending=descending)
 
 
 @main.route("/listings/add", methods=["GET", "POST"])
 def listing_add():
+    from app.forms import ListingForm
     form = ListingForm()
-    form.variant_id.choices = _variant_choices()
+    form.variant_id.choices = variant_choices()
     if form.validate_on_submit():
         listing = Listing()
         form.populate_obj(listing)
@@ -150,8 +195,9 @@ def listing_add():
 @main.route("/listings/<int:listing_id>/edit", methods=["GET", "POST"])
 def listing_edit(listing_id):
     listing = Listing.query.get_or_404(listing_id)
+    from app.forms import ListingForm
     form = ListingForm(obj=listing)
-    form.variant_id.choices = _variant_choices()
+    form.variant_id.choices = variant_choices()
     if form.validate_on_submit():
         form.populate_obj(listing)
         db.session.commit()
@@ -169,62 +215,115 @@ def listing_delete(listing_id):
     return redirect(url_for("main.listings"))
 
 
+@main.route("/listings/mark-sold", methods=["POST"])
+def listings_mark_sold():
+    from app.sales import mark_sold
+    listing_ids = request.form.getlist("listing_id", type=int)
+    if not listing_ids:
+        flash("Select at least one listing to mark sold.", "warning")
+        return redirect(url_for("main.listings"))
+    sold_at = request.form.get("sold_at", type=_parse_date)
+    report = mark_sold(listing_ids, sold_at=sold_at)
+    flash(f"Marked {len(report.sold)} listing{'s' if len(report.sold) != 1 else ''} sold "
+          f"and recorded their sale prices.", "success")
+    if report.skipped:
+        flash(f"Skipped {len(report.skipped)} already sold or missing.", "info")
+    next_url = request.form.get("next", "")
+    if not next_url.startswith("/") or next_url.startswith("//"):
+        next_url = url_for("main.listings")
+    return redirect(next_url)
+
+
+@main.route("/listings/mark-sold.json", methods=["POST"])
+def listings_mark_sold_json():
+    """Body: {"listings": [id or {"id", "price_gbp"}], "sold_at": "YYYY-MM-DD"}."""
+    from app.sales import mark_sold
+    payload = request.get_json(silent=True) or {}
+    listing_ids, prices = [], {}
+    try:
+        for item in payload.get("listings") or []:
+            if isinstance(item, dict):
+                listing_ids.append(int(item["id"]))
+                if item.get("price_gbp") is not None:
+                    prices[int(item["id"])] = int(item["price_gbp"])
+                    if prices[int(item["id"])] <= 0:
+                        abort(400)
+            else:
+                listing_ids.append(int(item))
+        sold_at = _parse_date(payload["sold_at"]) if payload.get("sold_at") else None
+    except (KeyError, TypeError, ValueError):
+        abort(400)
+    if not listing_ids:
+        abort(400)
+    report = mark_sold(listing_ids, sold_at=sold_at, prices=prices)
+    return jsonify({"sold": report.sold, "skipped": report.skipped})
+
+
+def _parse_date(value):
+    return date.fromisoformat(value) if value else None
+
+
 # ---------------------------------------------------------------------------
 # Market Analysis
 # ---------------------------------------------------------------------------
 @main.route("/market")
+@cached_response
 def market():
-    variants = ModelVariant.query.order_by(ModelVariant.name).all()
+    variants = variant_cache.all()
     variant_filter = request.args.get("variant", type=int)
 
-    # Build price history data for chart
-    price_query = PriceRecord.query.join(ModelVariant).order_by(PriceRecord.sold_date)
-    if variant_filter:
-        price_query = price_query.filter(PriceRecord.variant_id == variant_filter)
-
-    price_records = price_query.all()
-
-    # Per-variant summary stats
-    analysis = []
-    target_variants = [ModelVariant.query.get(variant_filter)] if variant_filter else variants
-    for v in target_variants:
-        records = [r for r in price_records if r.variant_id == v.id]
-        if not records:
-            continue
-        prices = [r.price_gbp for r in records]
-        recent = [r for r in records if r.sold_date >= date(2025, 1, 1)]
-        recent_prices = [r.price_gbp for r in recent] if recent else prices
-
-        analysis.append({
-            "variant": v,
-            "count": len(records),
-            "min_price": min(prices),
-            "max_price": max(prices),
-            "avg_price": int(sum(prices) / len(prices)),
-            "recent_avg": int(sum(recent_prices) / len(recent_prices)),
-            "trend": _price_trend(records),
-        })
-
-    # Chart data: group by variant name → list of {date, price}
-    chart_data = {}
-    for r in price_records:
-        vname = r.variant.name
-        if vname not in chart_data:
-            chart_data[vname] = []
-        chart_data[vname].append({
-            "date": r.sold_date.isoformat(),
-            "price": r.price_gbp,
-            "condition": r.condition or "unknown",
-        })
+    recent = request.args.get("recent", current_app.config["MARKET_RECENT_MONTHS"], type=int)
+    recent = max(1, min(recent, 240))
+
+    # Per-variant summary stats, read from the monthly rollups and price sketches
+    summaries = rollup_summaries(variant_filter, recent_months=recent)
+    bands = variant_bands(variant_filter)
+    analysis = [
+        {"variant": v, **summaries[v.id], **bands.get(v.id, {})}
+        for v in variants
+        if v.id in summaries
+    ]
 
     return render_template("market.html", variants=variants, analysis=analysis,
-                           chart_data=chart_data, variant_filter=variant_filter)
+                           variant_filter=variant_filter, recent=recent,
+                           recent_since=recent_start(recent))
+
+
+@main.route("/market/rollups.json")
+def market_rollups():
+    variant_id = request.args.get("variant", type=int)
+    if not variant_id:
+        abort(400)
+    window = request.args.get("window", current_app.config["MARKET_ROLLING_MONTHS"], type=int)
+    window = max(1, min(window, 60))
+    return jsonify({
+        "variant": variant_id,
+        "window": window,
+        "months": rolling_medians(variant_id, window, condition=request.args.get("condition")),
+    })
+
+
+@main.route("/market/chart-data")
+def market_chart_data():
+    mode = request.args.get("mode", "lttb")
+    if mode not in DOWNSAMPLE_MODES:
+        abort(400)
+    max_points = request.args.get("max_points", DEFAULT_MAX_POINTS, type=int)
+    payload = chart_payload(
+        variant_id=request.args.get("variant", type=int),
+        start=request.args.get("start", type=date.fromisoformat),
+        end=request.args.get("end", type=date.fromisoformat),
+        mode=mode,
+        max_points=max(3, min(max_points, RAW_MAX_POINTS)),
+    )
+    return jsonify(payload)
 
 
 @main.route("/market/add", methods=["GET", "POST"])
 def price_record_add():
+    from app.forms import PriceRecordForm
     form = PriceRecordForm()
-    form.variant_id.choices = _variant_choices()
+    form.variant_id.choices = variant_choices()
     if form.validate_on_submit():
         record = PriceRecord()
         form.populate_obj(record)
@@ -236,57 +335,85 @@ def price_record_add():
 
 
 # ---------------------------------------------------------------------------
-# Helpers
+# Search — full-text over listing text and registry notes
+# ---------------------------------------------------------------------------
+def _search_args():
+    """Resolve ?q=&kind=&limit= into (query, kind or None, ranked hits)."""
+    query = request.args.get("q", "").strip()
+    kind = request.args.get("kind")
+    if kind not in SEARCH_KINDS:
+        kind = None
+    limit = request.args.get("limit", DEFAULT_LIMIT, type=int)
+    return query, kind, search_text(query, (kind,) if kind else SEARCH_KINDS, limit)
+
+
+@main.route("/search")
+def search():
+    query, kind, hits = _search_args()
+    return render_template("search.html", query=query, kind=kind, hits=hits)
+
+
+@main.route("/search.json")
+def search_json():
+    query, kind, hits = _search_args()
+    return jsonify({"query": query, "results": [hit.as_dict() for hit in hits]})
+
+
+# ---------------------------------------------------------------------------
+# Export — streaming CSV / JSONL / Parquet downloads
 # ---------------------------------------------------------------------------
-def _price_trend(records):
-    """Return 'rising', 'stable', or 'falling' based on simple comparison."""
-    if len(records) < 2:
-        return "stable"
-    sorted_recs = sorted(records, key=lambda r: r.sold_date)
-    mid = len(sorted_recs) // 2
-    early_avg = sum(r.price_gbp for r in sorted_recs[:mid]) / mid
-    late_avg = sum(r.price_gbp for r in sorted_recs[mid:]) / (len(sorted_recs) - mid)
-    pct_change = (late_avg - early_avg) / early_avg * 100
-    if pct_change > 5:
-        return "rising"
-    elif pct_change < -5:
-        return "falling"
-    return "stable"
-
-
-def _compute_deal_rating(listing):
-    """Rate a listing against recent market data. Returns dict with rating info."""
-    avg_price = (
-        db.session.query(func.avg(PriceRecord.price_gbp))
-        .filter(
-            PriceRecord.variant_id == listing.variant_id,
-            PriceRecord.condition == listing.condition,
-        )
-        .scalar()
+@main.route("/export/<kind>.<fmt>")
+def export(kind, fmt):
+    if kind not in EXPORT_KINDS or fmt not in EXPORT_FORMATS:
+        abort(404)
+    rows = export_rows(
+        kind,
+        variant_id=request.args.get("variant", type=int),
+        show_sold=request.args.get("sold", "0") == "1",
+        start=request.args.get("start", type=date.fromisoformat),
+        end=request.args.get("end", type=date.fromisoformat),
     )
-    if not avg_price:
-        # Fall back to variant average regardless of condition
-        avg_price = (
-            db.session.query(func.avg(PriceRecord.price_gbp))
-            .filter(PriceRecord.variant_id == listing.variant_id)
-            .scalar()
-        )
-    if not avg_price:
-        return {"rating": "unknown", "label": "No data", "css": "secondary",
-                "detail": "Not enough price history to assess"}
-
-    avg_price = int(avg_price)
-    diff_pct = (listing.price_gbp - avg_price) / avg_price * 100
-
-    if diff_pct < -15:
-        return {"rating": "great", "label": "Great deal", "css": "success",
-                "detail": f"£{listing.price_gbp:,} is {abs(diff_pct):.0f}% below avg £{avg_price:,}"}
-    elif diff_pct < -5:
-        return {"rating": "good", "label": "Good price", "css": "info",
-                "detail": f"£{listing.price_gbp:,} is {abs(diff_pct):.0f}% below avg £{avg_price:,}"}
-    elif diff_pct <= 10:
-        return {"rating": "fair", "label": "Fair price", "css": "warning",
-                "detail": f"£{listing.price_gbp:,} is close to avg £{avg_price:,}"}
-    else:
-        return {"rating": "high", "label": "Above market", "css": "danger",
-                "detail": f"£{listing.price_gbp:,} is {diff_pct:.0f}% above avg £{avg_price:,}"}
+    if fmt == "parquet":
+        if not parquet_available():
+            abort(501, description="Parquet export requires the 'pyarrow' package.")
+        spool = tempfile.TemporaryFile()
+        write_parquet(kind, rows, spool)
+        spool.seek(0)
+        return send_file(spool, mimetype=CONTENT_TYPES[fmt], as_attachment=True,
+                         download_name=f"{kind}.{fmt}")
+
+    encode = iter_csv if fmt == "csv" else iter_jsonl
+    body = stream_with_context(encode(rows, export_columns(kind)))
+    headers = {"Content-Disposition": f"attachment; filename={kind}.{fmt}"}
+    return Response(body, mimetype=CONTENT_TYPES[fmt], headers=headers)
+
+
+# ---------------------------------------------------------------------------
+# Jobs — background queue status
+# ---------------------------------------------------------------------------
+@main.route("/jobs")
+def jobs():
+    return render_template("jobs.html", **job_status())
+
+
+@main.route("/jobs.json")
+def jobs_json():
+    status = job_status()
+    return jsonify({
+        "counts": status["counts"],
+        "jobs": [{"id": job.id, "key": job.key, "status": job.status,
+                  "attempts": job.attempts, "max_attempts": job.max_attempts,
+                  "run_after": job.run_after, "started_at": job.started_at,
+                  "finished_at": job.finished_at, "result": job.result, "error": job.error}
+                 for job in status["jobs"]],
+    })
+
+
+# ---------------------------------------------------------------------------
+# Metrics — per-endpoint request timings in Prometheus text format
+# ---------------------------------------------------------------------------
+@main.route("/metrics")
+def metrics():
+    if not current_app.config["METRICS_ENDPOINT"]:
+        abort(404)
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
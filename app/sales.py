@@ -0,0 +1,70 @@
+"""Marking listings sold in bulk.
+
+``mark_sold()`` closes many listings and records their sale prices in one
+transaction: per chunk of ids, one UPDATE of ``listings`` and one executemany
+INSERT into ``price_records``, both through app/bulk.py so the derived tables
+(dashboard stats, rollups, price sketches) move in the same transaction. The
+deal-rating baselines are invalidated once, at commit, for the variants
+touched.
+"""
+
+from dataclasses import dataclass, field
+from datetime import date
+from sqlalchemy import select
+from app import db
+from app.bulk import bulk_close_listings, bulk_insert
+from app.models import Listing, PriceRecord
+
+CHUNK_SIZE = 500
+
+
+@dataclass
+class SaleReport:
+    sold: list = field(default_factory=list)      # listing ids closed
+    skipped: list = field(default_factory=list)   # missing or already sold
+
+
+def mark_sold(listing_ids, sold_at=None, prices=None):
+    """Mark ``listing_ids`` sold on ``sold_at`` (default today) with one PriceRecord each.
+
+    ``prices`` maps listing id -> achieved price; any listing without one is
+    recorded at its asking price. Ids that don't exist or are already sold are
+    skipped. Everything is committed together, or not at all.
+    """
+    from app.forms import SOURCE_SITE_CHOICES
+    site_labels = dict(SOURCE_SITE_CHOICES[1:])
+    sold_at = sold_at or date.today()
+    prices = prices or {}
+    wanted = list(dict.fromkeys(listing_ids))
+    report = SaleReport()
+
+    try:
+        for start in range(0, len(wanted), CHUNK_SIZE):
+            chunk = wanted[start:start + CHUNK_SIZE]
+            rows = db.session.execute(
+                select(Listing.id, Listing.variant_id, Listing.price_gbp, Listing.year,
+                       Listing.condition, Listing.source_site)
+                .where(Listing.id.in_(chunk), Listing.is_sold == False)  # noqa: E712
+            ).mappings().all()
+            found = {row["id"] for row in rows}
+            report.skipped += [listing_id for listing_id in chunk if listing_id not in found]
+
+            bulk_close_listings(rows, sold_at)
+            bulk_insert(PriceRecord, [
+                {
+                    "variant_id": row["variant_id"],
+                    "price_gbp": prices[row["id"]] if row["id"] in prices else row["price_gbp"],
+                    "year_of_car": row["year"],
+                    "condition": row["condition"],
+                    "source": site_labels.get(row["source_site"], row["source_site"]),
+                    "sold_date": sold_at,
+                    "notes": f"Listing #{row['id']} marked sold",
+                }
+                for row in rows
+            ])
+            report.sold += [row["id"] for row in rows]
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return report
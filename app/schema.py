@@ -0,0 +1,45 @@
+"""Schema helpers that are safe to run against an existing database."""
+
+from sqlalchemy import inspect
+from app import db
+
+
+def init_database():
+    """Create missing tables and indexes; safe to run on every deploy."""
+    from app import models  # noqa: F401 -- register the tables on db.metadata
+    from app.quantiles import rebuild_price_sketches, sketches_missing
+    from app.rollups import rebuild_rollups, rollups_missing
+    from app.search import install_search_index
+    from app.valuation import refit, valuations_missing
+    db.create_all()
+    created = ensure_indexes()
+    install_search_index(db.engine)
+    if rollups_missing():
+        rebuild_rollups()
+    if sketches_missing():
+        rebuild_price_sketches()
+    if valuations_missing():
+        refit(full=True)
+    return created
+
+
+def ensure_indexes():
+    """Create any declared index missing from an existing database.
+
+    ``db.create_all()`` skips tables that already exist, so indexes added to a
+    model after its table was created are applied here instead. Only
+    ``CREATE INDEX`` is issued; no table is altered or rebuilt.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in present:
+                index.create(bind=engine)
+                created.append(index.name)
+    return created
@@ -0,0 +1,270 @@
+"""Full-text search over listing text and registry notes.
+
+On SQLite the text lives in external-content FTS5 tables (``listings_fts``,
+``registry_fts``) that triggers keep in step with the base tables, so ORM
+writes, bulk inserts and raw SQL are all indexed. On PostgreSQL the same
+columns are searched through GIN indexes on ``to_tsvector`` expressions,
+which need no triggers. Anything else (or a SQLite built without FTS5)
+falls back to ``LIKE`` matching so the page still works, just slowly.
+
+Results are ranked (bm25 / ts_rank, higher is better) and carry a highlighted
+snippet of the matching text.
+"""
+
+import re
+from dataclasses import dataclass
+from types import SimpleNamespace
+from markupsafe import Markup, escape
+from sqlalchemy import or_, text
+from app import db
+from app.models import ModelVariant, RegistryCar, Listing
+
+SEARCH_KINDS = ("listings", "registry")
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+TS_CONFIG = "english"
+
+# Snippet highlight markers; replaced with <mark> after the text is escaped
+_START, _STOP = "\x02", "\x03"
+
+# kind -> base table, FTS table, indexed columns, bm25 column weights
+SOURCES = {
+    "listings": ("listings", "listings_fts", ("title", "description"), (5.0, 1.0)),
+    "registry": ("registry_cars", "registry_fts", ("notes", "source"), (2.0, 1.0)),
+}
+
+# kind -> extra columns selected for display (base table aliased "t")
+_DISPLAY = {
+    "listings": "t.title AS label, t.price_gbp AS price, t.is_sold AS sold",
+    "registry": "t.year AS year, t.colour AS colour, t.location_region AS region",
+}
+
+
+@dataclass
+class SearchHit:
+    kind: str
+    id: int
+    variant: str
+    label: str
+    snippet: Markup
+    score: float
+    price: int = None
+    sold: bool = False
+
+    def as_dict(self):
+        return {"kind": self.kind, "id": self.id, "variant": self.variant, "label": self.label,
+                "snippet": str(self.snippet), "score": round(self.score, 4),
+                "price": self.price, "sold": self.sold}
+
+
+def search(query, kinds=SEARCH_KINDS, limit=DEFAULT_LIMIT):
+    """Return up to ``limit`` SearchHits for ``query`` across ``kinds``, best first."""
+    query = (query or "").strip()
+    if not query:
+        return []
+    limit = max(1, min(limit, MAX_LIMIT))
+    backend = _backend()
+    hits = []
+    for kind in kinds:
+        if backend == "fts5":
+            match = fts5_query(query)
+            if match:
+                hits += _search_fts5(kind, match, limit)
+        elif backend == "postgresql":
+            hits += _search_postgres(kind, query, limit)
+        else:
+            hits += _search_like(kind, query, limit)
+    hits.sort(key=lambda hit: hit.score, reverse=True)
+    return hits[:limit]
+
+
+def fts5_query(query):
+    """Translate user input into a safe FTS5 MATCH expression.
+
+    Words and "quoted phrases" are ANDed; a trailing ``*`` makes a prefix
+    search and a leading ``-`` excludes the term. Everything else is quoted,
+    so FTS5 operators and punctuation in the input can't cause syntax errors.
+    """
+    include, exclude = [], []
+    for phrase, word in re.findall(r'(-?"[^"]*")|(\S+)', query):
+        term = phrase or word
+        negate = term.startswith("-") and len(term) > 1
+        term = term.lstrip("-")
+        prefix = term.endswith("*")
+        term = term.strip('"*').replace('"', "")
+        if not re.search(r"\w", term):
+            continue
+        quoted = f'"{term}"' + ("*" if prefix else "")
+        (exclude if negate else include).append(quoted)
+    if not include:
+        return None
+    return " ".join(include) + "".join(f" NOT {term}" for term in exclude)
+
+
+def _highlight(snippet):
+    html = str(escape(snippet or ""))
+    return Markup(html.replace(_START, "<mark>").replace(_STOP, "</mark>"))
+
+
+def _hit(kind, row, score):
+    if kind == "listings":
+        return SearchHit(kind, row.id, row.variant, row.label, _highlight(row.snippet), score,
+                         price=row.price, sold=bool(row.sold))
+    label = f"{row.year} {row.variant}"
+    if row.colour:
+        label += f" — {row.colour}"
+    if row.region:
+        label += f" ({row.region})"
+    return SearchHit(kind, row.id, row.variant, label, _highlight(row.snippet), score)
+
+
+# ---------------------------------------------------------------------------
+# Backends
+# ---------------------------------------------------------------------------
+_backends = {}  # engine URL -> backend name, probed once per engine
+
+
+def _backend():
+    engine = db.engine
+    if engine.url not in _backends:
+        if engine.dialect.name == "postgresql":
+            _backends[engine.url] = "postgresql"
+        elif engine.dialect.name == "sqlite" and _fts_tables_present(engine):
+            _backends[engine.url] = "fts5"
+        else:
+            _backends[engine.url] = "like"
+    return _backends[engine.url]
+
+
+def _fts_tables_present(engine):
+    names = {fts for _, fts, _, _ in SOURCES.values()}
+    with engine.connect() as conn:
+        found = {row[0] for row in conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"))}
+    return names <= found
+
+
+def _search_fts5(kind, match, limit):
+    table, fts, columns, weights = SOURCES[kind]
+    sql = text(f"""
+        SELECT t.id, mv.name AS variant, {_DISPLAY[kind]},
+               snippet({fts}, -1, :start, :stop, '…', 16) AS snippet,
+               bm25({fts}, {', '.join(map(str, weights))}) AS rank
+        FROM {fts}
+        JOIN {table} AS t ON t.id = {fts}.rowid
+        JOIN model_variants AS mv ON mv.id = t.variant_id
+        WHERE {fts} MATCH :match
+        ORDER BY rank
+        LIMIT :limit
+    """)
+    rows = db.session.execute(sql, {"match": match, "start": _START, "stop": _STOP,
+                                    "limit": limit})
+    return [_hit(kind, row, -row.rank) for row in rows]
+
+
+def _tsvector(columns, alias=""):
+    prefix = f"{alias}." if alias else ""
+    document = " || ' ' || ".join(f"coalesce({prefix}{c}, '')" for c in columns)
+    return f"to_tsvector('{TS_CONFIG}', {document})"
+
+
+def _search_postgres(kind, query, limit):
+    table, _, columns, _ = SOURCES[kind]
+    document = " || ' ' || ".join(f"coalesce(t.{c}, '')" for c in columns)
+    sql = text(f"""
+        SELECT t.id, mv.name AS variant, {_DISPLAY[kind]},
+               ts_headline('{TS_CONFIG}', {document}, q, :options) AS snippet,
+               ts_rank({_tsvector(columns, 't')}, q) AS rank
+        FROM {table} AS t
+        JOIN model_variants AS mv ON mv.id = t.variant_id,
+             websearch_to_tsquery('{TS_CONFIG}', :query) AS q
+        WHERE {_tsvector(columns, 't')} @@ q
+        ORDER BY rank DESC
+        LIMIT :limit
+    """)
+    options = f"StartSel={_START}, StopSel={_STOP}, MaxWords=24, MinWords=8, MaxFragments=2"
+    rows = db.session.execute(sql, {"query": query, "options": options, "limit": limit})
+    return [_hit(kind, row, float(row.rank)) for row in rows]
+
+
+def _search_like(kind, query, limit):
+    """Unindexed fallback: every word must appear in one of the searched columns."""
+    model = Listing if kind == "listings" else RegistryCar
+    _, _, columns, _ = SOURCES[kind]
+    terms = [t.strip('"*') for t in query.split() if not t.startswith("-")]
+    q = db.session.query(model, ModelVariant.name).join(ModelVariant)
+    for term in filter(None, terms):
+        q = q.filter(or_(*[getattr(model, c).contains(term, autoescape=True) for c in columns]))
+    hits = []
+    for obj, variant in q.order_by(model.id.desc()).limit(limit):
+        body = " … ".join(filter(None, (getattr(obj, c) for c in columns)))
+        if kind == "listings":
+            row = SimpleNamespace(id=obj.id, variant=variant, label=obj.title,
+                                  price=obj.price_gbp, sold=obj.is_sold, snippet=body[:200])
+        else:
+            row = SimpleNamespace(id=obj.id, variant=variant, year=obj.year, colour=obj.colour,
+                                  region=obj.location_region, snippet=body[:200])
+        hits.append(_hit(kind, row, 0.0))
+    return hits
+
+
+# ---------------------------------------------------------------------------
+# Index management
+# ---------------------------------------------------------------------------
+def install_search_index(engine):
+    """Create the search index for ``engine``'s dialect; returns the backend name.
+
+    Idempotent. A newly created FTS5 table is filled from its base table.
+    """
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            for kind, (table, _, columns, _) in SOURCES.items():
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_fts "
+                                  f"ON {table} USING gin ({_tsvector(columns)})"))
+        _backends[engine.url] = "postgresql"
+        return "postgresql"
+    if engine.dialect.name != "sqlite" or not _fts5_available(engine):
+        _backends[engine.url] = "like"
+        return "like"
+
+    with engine.begin() as conn:
+        existing = {row[0] for row in conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"))}
+        for table, fts, columns, _ in SOURCES.values():
+            cols = ", ".join(columns)
+            new = ", ".join(f"new.{c}" for c in columns)
+            old = ", ".join(f"old.{c}" for c in columns)
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, "
+                f"content='{table}', content_rowid='id', "
+                f"tokenize='porter unicode61 remove_diacritics 2')"))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+                f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END"))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); END"))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+                f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END"))
+            if fts not in existing:
+                conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+    _backends[engine.url] = "fts5"
+    return "fts5"
+
+
+def rebuild_search_index():
+    """Re-derive the FTS5 tables from their base tables (SQLite only)."""
+    if _backend() != "fts5":
+        return False
+    for _, fts, _, _ in SOURCES.values():
+        db.session.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+        db.session.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('optimize')"))
+    db.session.commit()
+    return True
+
+
+def _fts5_available(engine):
+    with engine.connect() as conn:
+        return bool(conn.execute(text("SELECT sqlite_compileoption_used('ENABLE_FTS5')")).scalar())
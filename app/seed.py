@@ -182,9 +182,9 @@ SAMPLE_PRICE_RECORDS = [
 
 
 def seed_database():
-    """Populate the database with reference data and samples."""
+    """Populate the database with reference data and samples; False if already seeded."""
     if ModelVariant.query.first():
-        return  # already seeded
+        return False
 
     # Insert model variants
     variant_map = {}
@@ -196,20 +196,24 @@ def seed_database():
 
     # Insert registry cars
     for car_data in SAMPLE_REGISTRY:
+        car_data = dict(car_data)
         name = car_data.pop("variant_name")
         car_data["variant_id"] = variant_map[name]
         db.session.add(RegistryCar(**car_data))
 
     # Insert listings
     for listing_data in SAMPLE_LISTINGS:
+        listing_data = dict(listing_data)
         name = listing_data.pop("variant_name")
         listing_data["variant_id"] = variant_map[name]
         db.session.add(Listing(**listing_data))
 
     # Insert price records
     for price_data in SAMPLE_PRICE_RECORDS:
+        price_data = dict(price_data)
         name = price_data.pop("variant_name")
         price_data["variant_id"] = variant_map[name]
         db.session.add(PriceRecord(**price_data))
 
     db.session.commit()
+    return True
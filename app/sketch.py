@@ -0,0 +1,180 @@
+"""Mergeable, constant-memory quantile sketch (merging t-digest).
+
+A ``TDigest`` summarises a stream of values as at most ~``compression``
+weighted centroids, small near the tails and larger in the middle, so
+medians and percentiles come out within a fraction of a percent of the
+exact rank while the sketch stays a few hundred bytes to a couple of KB.
+Two digests merge by pooling their centroids, so monthly or per-group
+sketches can be combined into any larger window without the raw rows.
+
+Digests serialize to a compact binary form for storage in a LargeBinary
+column.
+"""
+
+import math
+import struct
+
+DEFAULT_COMPRESSION = 100
+
+_HEADER = struct.Struct("<HdddI")  # compression, count, min, max, centroids
+_CENTROID = struct.Struct("<dd")    # mean, weight
+
+
+class TDigest:
+    """Approximate quantiles of a weighted stream of numbers."""
+
+    def __init__(self, compression=DEFAULT_COMPRESSION):
+        self.compression = compression
+        self.means = []
+        self.weights = []
+        self.count = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._buffer = []
+
+    def __len__(self):
+        return int(self.count)
+
+    def add(self, value, weight=1.0):
+        value = float(value)
+        self._buffer.append((value, float(weight)))
+        self.count += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._buffer) >= 5 * self.compression:
+            self._compress()
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+        return self
+
+    def merge(self, other):
+        """Fold ``other`` into this digest (``other`` is left unchanged)."""
+        self._absorb(other)
+        self._compress()
+        return self
+
+    def _absorb(self, other):
+        if not other.count:
+            return
+        other._compress()
+        self._buffer.extend(zip(other.means, other.weights))
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """Return the approximate ``q``-quantile (0 <= q <= 1), or None if empty."""
+        self._compress()
+        if not self.count:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1 or len(self.means) == 1:
+            return self.max if q >= 1 else self.means[0]
+
+        target = q * self.count
+        # Each centroid's mass is centred on its mean; interpolate between centres
+        cumulative = 0.0
+        prev_mean, prev_centre = self.min, 0.0
+        for mean, weight in zip(self.means, self.weights):
+            centre = cumulative + weight / 2
+            if target < centre:
+                span = centre - prev_centre
+                frac = (target - prev_centre) / span if span else 0.0
+                return prev_mean + frac * (mean - prev_mean)
+            cumulative += weight
+            prev_mean, prev_centre = mean, centre
+        span = self.count - prev_centre
+        frac = (target - prev_centre) / span if span else 1.0
+        return prev_mean + frac * (self.max - prev_mean)
+
+    def median(self):
+        return self.quantile(0.5)
+
+    def cdf(self, value):
+        """Return the approximate fraction of the stream <= ``value``, or None if empty."""
+        self._compress()
+        if not self.count:
+            return None
+        if value < self.min:
+            return 0.0
+        if value >= self.max:
+            return 1.0
+        # Inverse of quantile(): the same piecewise-linear curve through centroid centres
+        cumulative = 0.0
+        prev_mean, prev_centre = self.min, 0.0
+        for mean, weight in zip(self.means, self.weights):
+            centre = cumulative + weight / 2
+            if value < mean:
+                span = mean - prev_mean
+                frac = (value - prev_mean) / span if span else 1.0
+                return (prev_centre + frac * (centre - prev_centre)) / self.count
+            cumulative += weight
+            prev_mean, prev_centre = mean, centre
+        span = self.max - prev_mean
+        frac = (value - prev_mean) / span if span else 1.0
+        return (prev_centre + frac * (self.count - prev_centre)) / self.count
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        points = sorted(list(zip(self.means, self.weights)) + self._buffer)
+        self._buffer = []
+        total = sum(w for _, w in points)
+        means, weights = [], []
+        done = 0.0
+        mean, weight = points[0]
+        limit = self._k_inverse(self._k(0.0) + 1.0) * total
+        for m, w in points[1:]:
+            if done + weight + w <= limit:
+                mean += (m - mean) * w / (weight + w)
+                weight += w
+            else:
+                means.append(mean)
+                weights.append(weight)
+                done += weight
+                limit = self._k_inverse(self._k(done / total) + 1.0) * total
+                mean, weight = m, w
+        means.append(mean)
+        weights.append(weight)
+        self.means, self.weights = means, weights
+
+    # k1 scale function: centroids are allowed to grow large only mid-distribution
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def _k_inverse(self, k):
+        return (math.sin(min(k * 2 * math.pi / self.compression, math.pi / 2)) + 1) / 2
+
+    # -----------------------------------------------------------------------
+    # Serialization
+    # -----------------------------------------------------------------------
+    def to_bytes(self):
+        self._compress()
+        parts = [_HEADER.pack(self.compression, self.count, self.min, self.max, len(self.means))]
+        parts += [_CENTROID.pack(m, w) for m, w in zip(self.means, self.weights)]
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data, compression=None):
+        if not data:
+            return cls(compression or DEFAULT_COMPRESSION)
+        stored, count, lo, hi, n = _HEADER.unpack_from(data)
+        digest = cls(compression or stored)
+        digest.count, digest.min, digest.max = count, lo, hi
+        body = data[_HEADER.size:_HEADER.size + n * _CENTROID.size]
+        for mean, weight in _CENTROID.iter_unpack(body):
+            digest.means.append(mean)
+            digest.weights.append(weight)
+        return digest
+
+
+def merge_all(digests, compression=DEFAULT_COMPRESSION):
+    """Return a new digest combining every digest in ``digests``, compressed once."""
+    result = TDigest(compression)
+    for digest in digests:
+        result._absorb(digest)
+    result._compress()
+    return result
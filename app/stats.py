@@ -0,0 +1,263 @@
+"""Dashboard aggregates computed in a constant number of grouped queries.
+
+Two read paths are offered:
+
+* ``live`` — one grouped query per table (price records, active listings,
+  registry cars) plus the variant list, regardless of how many variants exist.
+* ``materialized`` — a single read of the ``variant_stats`` table, which is kept
+  up to date by session events whenever a RegistryCar, Listing or PriceRecord
+  is inserted, updated or deleted.
+
+The materialized table is opt-in via ``VARIANT_STATS_MATERIALIZED``; run
+``flask stats rebuild`` once after enabling it on an existing database.
+"""
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, inspect, select
+from app import db
+from app.dedup import duplicate_counts
+from app.models import ModelVariant, RegistryCar, Listing, PriceRecord, VariantStats
+from app.reference import variant_cache
+
+STAT_FIELDS = ("registry_count", "listing_count", "price_count", "price_sum")
+
+# Columns whose values feed a row's contribution to the per-variant counters
+_TRACKED = {
+    RegistryCar: ("variant_id",),
+    Listing: ("variant_id", "is_sold"),
+    PriceRecord: ("variant_id", "price_gbp"),
+}
+
+
+# ---------------------------------------------------------------------------
+# Read path
+# ---------------------------------------------------------------------------
+def dashboard_stats():
+    """Return the template context for the dashboard."""
+    if current_app.config.get("VARIANT_STATS_MATERIALIZED"):
+        rows = _materialized_rows()
+    else:
+        rows = _grouped_rows()
+
+    # The same car listed on several sites counts once
+    duplicates = duplicate_counts() if current_app.config.get("DEDUP_ENABLED") else {}
+
+    variant_stats = []
+    totals = dict.fromkeys(STAT_FIELDS, 0)
+    for variant, counts in rows:
+        if variant.id in duplicates:
+            counts = {**counts, "listing_count": counts["listing_count"] - duplicates[variant.id]}
+        for key in STAT_FIELDS:
+            totals[key] += counts[key]
+        avg_price = counts["price_sum"] / counts["price_count"] if counts["price_count"] else None
+        variant_stats.append({
+            "variant": variant,
+            "avg_price": int(avg_price) if avg_price else None,
+            "listing_count": counts["listing_count"],
+            "registry_count": counts["registry_count"],
+        })
+
+    return {
+        "total_registry": totals["registry_count"],
+        "total_listings": totals["listing_count"],
+        "total_sold": totals["price_count"],
+        "variant_stats": variant_stats,
+    }
+
+
+def grouped_counts():
+    """Return {variant_id: counts} computed from the base tables in three grouped queries."""
+    counts = {}
+
+    def _slot(variant_id):
+        return counts.setdefault(variant_id, dict.fromkeys(STAT_FIELDS, 0))
+
+    price_rows = db.session.execute(
+        select(PriceRecord.variant_id, func.count(), func.sum(PriceRecord.price_gbp))
+        .group_by(PriceRecord.variant_id)
+    )
+    for variant_id, n, total in price_rows:
+        slot = _slot(variant_id)
+        slot["price_count"] = n
+        slot["price_sum"] = int(total or 0)
+
+    listing_rows = db.session.execute(
+        select(Listing.variant_id, func.count())
+        .where(Listing.is_sold == False)  # noqa: E712
+        .group_by(Listing.variant_id)
+    )
+    for variant_id, n in listing_rows:
+        _slot(variant_id)["listing_count"] = n
+
+    registry_rows = db.session.execute(
+        select(RegistryCar.variant_id, func.count()).group_by(RegistryCar.variant_id)
+    )
+    for variant_id, n in registry_rows:
+        _slot(variant_id)["registry_count"] = n
+
+    return counts
+
+
+def _grouped_rows():
+    variants = variant_cache.all()
+    counts = grouped_counts()
+    empty = dict.fromkeys(STAT_FIELDS, 0)
+    return [(v, counts.get(v.id, empty)) for v in variants]
+
+
+def _materialized_rows():
+    rows = (
+        db.session.query(ModelVariant, VariantStats)
+        .outerjoin(VariantStats, VariantStats.variant_id == ModelVariant.id)
+        .order_by(ModelVariant.name)
+        .all()
+    )
+    result = []
+    for variant, stats in rows:
+        counts = {key: (getattr(stats, key) if stats else 0) for key in STAT_FIELDS}
+        result.append((variant, counts))
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Materialized table maintenance
+# ---------------------------------------------------------------------------
+def rebuild_variant_stats():
+    """Recompute the whole ``variant_stats`` table from the base tables."""
+    counts = grouped_counts()
+    db.session.execute(VariantStats.__table__.delete())
+    if counts:
+        db.session.execute(
+            VariantStats.__table__.insert(),
+            [{"variant_id": vid, **c} for vid, c in counts.items()],
+        )
+    db.session.commit()
+    return len(counts)
+
+
+def apply_deltas(deltas, connection=None):
+    """Add {variant_id: {field: delta}} onto the materialized counters.
+
+    Bulk writers that bypass the ORM unit of work (``session.execute(insert(...))``)
+    call this directly with the deltas of the rows they wrote.
+    """
+    conn = connection if connection is not None else db.session.connection()
+    table = VariantStats.__table__
+    for variant_id, delta in deltas.items():
+        delta = {k: v for k, v in delta.items() if v}
+        if not delta:
+            continue
+        result = conn.execute(
+            table.update()
+            .where(table.c.variant_id == variant_id)
+            .values({k: table.c[k] + v for k, v in delta.items()})
+        )
+        if result.rowcount == 0:
+            row = dict.fromkeys(STAT_FIELDS, 0)
+            row.update(delta)
+            conn.execute(table.insert().values(variant_id=variant_id, **row))
+
+
+def record_bulk_insert(model, rows, connection=None):
+    """Account for rows inserted with a bulk statement that skipped the ORM events."""
+    if model not in _TRACKED or not _enabled():
+        return
+    deltas = {}
+    for values in rows:
+        variant_id, contribution = row_contribution(model, values)
+        _merge(deltas, variant_id, contribution, 1)
+    apply_deltas(deltas, connection)
+
+
+def record_bulk_update(model, old_rows, new_rows, connection=None):
+    """Account for rows changed with a bulk UPDATE that skipped the ORM events."""
+    if model not in _TRACKED or not _enabled():
+        return
+    deltas = {}
+    for old, new in zip(old_rows, new_rows):
+        _merge(deltas, *row_contribution(model, old), -1)
+        _merge(deltas, *row_contribution(model, new), 1)
+    apply_deltas(deltas, connection)
+
+
+def row_contribution(cls, values):
+    """Return (variant_id, {field: value}) for one row of a tracked table."""
+    variant_id = values.get("variant_id")
+    if cls is RegistryCar:
+        return variant_id, {"registry_count": 1}
+    if cls is Listing:
+        return variant_id, {"listing_count": 0 if values.get("is_sold") else 1}
+    return variant_id, {"price_count": 1, "price_sum": values.get("price_gbp") or 0}
+
+
+def _merge(deltas, variant_id, contribution, sign):
+    if variant_id is None:
+        return
+    slot = deltas.setdefault(variant_id, dict.fromkeys(STAT_FIELDS, 0))
+    for key, value in contribution.items():
+        slot[key] += sign * value
+
+
+def old_values(session, obj, keys):
+    """Return the pre-flush values of ``keys`` for a persistent object."""
+    state = inspect(obj)
+    values = {}
+    missing = False
+    for key in keys:
+        hist = state.attrs[key].history
+        if hist.deleted:
+            values[key] = hist.deleted[0]
+        elif hist.unchanged:
+            values[key] = hist.unchanged[0]
+        elif hist.added:
+            missing = True  # overwritten before the old value was ever loaded
+        else:
+            values[key] = getattr(obj, key)
+    if missing:
+        table = type(obj).__table__
+        row = session.connection().execute(
+            select(*[table.c[k] for k in keys]).where(table.c.id == state.identity[0])
+        ).one()
+        values = dict(zip(keys, row))
+    return values
+
+
+def _enabled():
+    return has_app_context() and current_app.config.get("VARIANT_STATS_MATERIALIZED")
+
+
+@event.listens_for(db.session, "before_flush")
+def _capture_old_contributions(session, flush_context, instances):
+    if not _enabled():
+        return
+    deltas = session.info.setdefault("variant_stats_deltas", {})
+    for obj in list(session.dirty) + list(session.deleted):
+        keys = _TRACKED.get(type(obj))
+        if keys is None or not inspect(obj).persistent:
+            continue
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        variant_id, contribution = row_contribution(type(obj), old_values(session, obj, keys))
+        _merge(deltas, variant_id, contribution, -1)
+
+
+@event.listens_for(db.session, "after_flush")
+def _apply_new_contributions(session, flush_context):
+    if not _enabled():
+        return
+    deltas = session.info.pop("variant_stats_deltas", {})
+    for obj in list(session.new) + list(session.dirty):
+        keys = _TRACKED.get(type(obj))
+        if keys is None or obj in session.deleted:
+            continue
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        values = {key: getattr(obj, key) for key in keys}
+        variant_id, contribution = row_contribution(type(obj), values)
+        _merge(deltas, variant_id, contribution, 1)
+    apply_deltas(deltas, session.connection())
+
+
+@event.listens_for(db.session, "after_rollback")
+def _discard_pending_deltas(session):
+    session.info.pop("variant_stats_deltas", None)
@@ -0,0 +1,169 @@
+"""Synthetic data generator for load testing.
+
+Builds registry cars, listings and price records on top of the ``VARIANTS``
+reference data with plausible distributions: variants weighted by estimated
+UK survivors, a skewed condition mix, per-variant price levels scaled by
+condition with log-normal noise and steady appreciation over time, and
+production years inside each variant's run. Deterministic for a given seed.
+"""
+
+import math
+import random
+from datetime import date, timedelta
+from app import db
+from app.bulk import bulk_insert
+from app.models import ModelVariant, RegistryCar, Listing, PriceRecord
+from app.seed import VARIANTS
+
+# Named sizes: (registry cars, listings, price records)
+SCALES = {
+    "10k": (1_000, 2_000, 10_000),
+    "100k": (5_000, 20_000, 100_000),
+    "1m": (20_000, 100_000, 1_000_000),
+}
+
+# Typical "good condition" sale price per variant, in 2024 pounds
+BASE_PRICES = {
+    "1502": 9_500,
+    "1602": 12_500,
+    "1802": 14_000,
+    "2002": 20_000,
+    "2002 Automatic": 14_500,
+    "2002 tii": 45_000,
+    "2002 Turbo": 125_000,
+    "2002 Cabriolet (Baur)": 35_000,
+    "2002 Touring": 22_000,
+}
+
+CONDITION_WEIGHTS = {"concours": 4, "excellent": 18, "good": 40, "fair": 23, "project": 15}
+CONDITION_FACTORS = {"concours": 1.6, "excellent": 1.25, "good": 1.0, "fair": 0.7, "project": 0.38}
+ANNUAL_APPRECIATION = 0.05
+PRICE_EPOCH = date(2024, 1, 1)
+
+COLOURS = [
+    "Inka Orange", "Fjord Blue", "Chamonix White", "Polaris Silver", "Colorado Orange",
+    "Golf Yellow", "Malaga Red", "Sahara Beige", "Riviera Blue", "Taiga Green",
+    "Verona Red", "Atlantis Blue", "Granada Red", "Mint Green",
+]
+REGIONS = [
+    "Surrey", "Kent", "London", "Yorkshire", "Norfolk", "Oxfordshire", "Scotland",
+    "Hampshire", "Dorset", "Cambridgeshire", "Devon", "Cheshire", "Wales", "Lancashire",
+]
+SOURCE_SITES = ["ebay", "autotrader", "carandclassic", "pistonheads", "facebook", "club", "other"]
+AUCTION_SOURCES = [
+    "Bonhams", "Silverstone Auctions", "RM Sotheby's", "Car & Classic", "eBay",
+    "PistonHeads", "Facebook", "Iconic Auctioneers",
+]
+NOTE_FRAGMENTS = [
+    "matching numbers", "Kugelfischer rebuilt", "round tail", "square tail",
+    "solid floors", "recent respray", "full history file", "some rust in usual places",
+    "LHD import", "converted to RHD", "engine rebuilt", "original interior",
+    "stored in barn", "needs recommissioning", "concours winner", "garage kept",
+]
+
+
+class _Generator:
+    def __init__(self, variants, seed):
+        self.rng = random.Random(seed)
+        self.variants = variants
+        self.variant_weights = [v.estimated_uk_survivors or 1 for v in variants]
+        self.conditions = list(CONDITION_WEIGHTS)
+        self.condition_weights = list(CONDITION_WEIGHTS.values())
+
+    def variant(self):
+        return self.rng.choices(self.variants, self.variant_weights)[0]
+
+    def condition(self):
+        return self.rng.choices(self.conditions, self.condition_weights)[0]
+
+    def year(self, variant):
+        return self.rng.randint(variant.year_start, variant.year_end)
+
+    def day(self, start, end):
+        return start + timedelta(days=self.rng.randint(0, (end - start).days))
+
+    def price(self, variant, condition, when):
+        base = BASE_PRICES.get(variant.name, 18_000) * CONDITION_FACTORS[condition]
+        years = (when - PRICE_EPOCH).days / 365.25
+        noisy = base * (1 + ANNUAL_APPRECIATION) ** years * math.exp(self.rng.gauss(0, 0.18))
+        return int(round(noisy, -2))
+
+    def notes(self, k=2):
+        return ", ".join(self.rng.sample(NOTE_FRAGMENTS, k)).capitalize()
+
+    def registry_car(self):
+        v = self.variant()
+        return {
+            "variant_id": v.id,
+            "year": self.year(v),
+            "colour": self.rng.choice(COLOURS),
+            "chassis_prefix": None,
+            "location_region": self.rng.choice(REGIONS),
+            "condition": self.condition(),
+            "mot_status": self.rng.choice(["valid", "valid", "sorn", "exempt"]),
+            "mot_expiry": None,
+            "notes": self.notes(),
+            "source": self.rng.choice(AUCTION_SOURCES),
+        }
+
+    def listing(self, today):
+        v = self.variant()
+        condition = self.condition()
+        year = self.year(v)
+        colour = self.rng.choice(COLOURS)
+        listed_at = self.day(today - timedelta(days=730), today)
+        is_sold = self.rng.random() < 0.25
+        return {
+            "variant_id": v.id,
+            "title": f"{year} BMW {v.name} - {colour}",
+            "year": year,
+            "price_gbp": self.price(v, condition, listed_at),
+            "mileage": self.rng.randint(20, 180) * 1000,
+            "condition": condition,
+            "colour": colour,
+            "location": self.rng.choice(REGIONS),
+            "source_site": self.rng.choice(SOURCE_SITES),
+            "source_url": None,
+            "description": self.notes(3) + ".",
+            "is_sold": is_sold,
+            "listed_at": listed_at,
+            "sold_at": self.day(listed_at, today) if is_sold else None,
+        }
+
+    def price_record(self, start, today):
+        v = self.variant()
+        condition = self.condition()
+        sold_date = self.day(start, today)
+        return {
+            "variant_id": v.id,
+            "price_gbp": self.price(v, condition, sold_date),
+            "year_of_car": self.year(v),
+            "condition": condition,
+            "source": self.rng.choice(AUCTION_SOURCES),
+            "sold_date": sold_date,
+            "notes": None,
+        }
+
+
+def generate(registry=0, listings=0, prices=0, seed=2002, chunk=10_000,
+             history_start=date(2015, 1, 1), today=None):
+    """Insert the requested number of synthetic rows; returns the counts written."""
+    today = today or date.today()
+    variants = ModelVariant.query.order_by(ModelVariant.id).all()
+    if not variants:
+        for v in VARIANTS:
+            db.session.add(ModelVariant(**v))
+        db.session.commit()
+        variants = ModelVariant.query.order_by(ModelVariant.id).all()
+
+    gen = _Generator(variants, seed)
+    plan = [
+        (RegistryCar, registry, gen.registry_car),
+        (Listing, listings, lambda: gen.listing(today)),
+        (PriceRecord, prices, lambda: gen.price_record(history_start, today)),
+    ]
+    for model, count, make in plan:
+        for offset in range(0, count, chunk):
+            bulk_insert(model, [make() for _ in range(min(chunk, count - offset))])
+            db.session.commit()
+    return {"registry": registry, "listings": listings, "prices": prices}
@@ -0,0 +1,112 @@
+"""The jobs the background runner knows (app/jobs.py), and the writes that queue them.
+
+Each task imports its module when it runs, so registering them costs the web
+workers nothing. Writing price records queues a coalesced ``valuation.refit``
+``VALUATION_REFIT_DELAY_SECONDS`` later, so a burst of sales (or an import)
+shares one refit and the request that wrote them doesn't wait for it. The
+rebuilds can be queued by hand::
+
+    flask jobs enqueue rollups.rebuild
+    flask jobs enqueue listings.refresh site=ebay limit=500
+"""
+
+from flask import current_app
+from sqlalchemy import event
+from app import db
+from app.jobs import enqueue, task
+from app.models import PriceRecord
+
+
+@task("valuation.refit")
+def refit_valuations(full=False):
+    from app.valuation import refit
+    return f"{len(refit(full=full))} variants refitted or dropped"
+
+
+@task("stats.rebuild")
+def rebuild_stats():
+    from app.stats import rebuild_variant_stats
+    return f"{rebuild_variant_stats()} variants"
+
+
+@task("rollups.rebuild")
+def rebuild_monthly_rollups():
+    from app.rollups import rebuild_rollups
+    return f"{rebuild_rollups():,} monthly buckets"
+
+
+@task("quantiles.rebuild")
+def rebuild_sketches():
+    from app.deals import baselines
+    from app.quantiles import rebuild_price_sketches
+    n = rebuild_price_sketches()
+    baselines.invalidate()
+    return f"{n:,} price sketches"
+
+
+@task("dedup.rebuild")
+def rebuild_dedup():
+    from app.dedup import rebuild_index
+    return f"{rebuild_index():,} listings fingerprinted"
+
+
+@task("search.rebuild")
+def rebuild_search():
+    from app.search import rebuild_search_index
+    return "rebuilt" if rebuild_search_index() else "no search index"
+
+
+@task("changelog.compact")
+def compact_change_log(retain_hours=None):
+    from app.changelog import compact
+    return "{:,} superseded, {:,} purged".format(*compact(retain_hours))
+
+
+@task("listings.refresh", max_attempts=1)
+def refresh_due_listings(site=None, limit=None):
+    from app.refresh import refresh_listings
+    report = refresh_listings(site=site, limit=limit)
+    outcomes = ", ".join(f"{n:,} {status}" for status, n in sorted(report.statuses.items()))
+    return f"{report.checked:,} checked" + (f": {outcomes}" if outcomes else "")
+
+
+@task("jobs.purge")
+def purge_jobs(older_than_hours=None):
+    from app.jobs import purge
+    return f"{purge(older_than_hours):,} finished jobs deleted"
+
+
+# ---------------------------------------------------------------------------
+# Triggers
+# ---------------------------------------------------------------------------
+def queue_refit(session, connection=None):
+    """Queue one delayed valuation refit for this transaction's price record writes."""
+    if session.info.get("refit_queued"):
+        return
+    enqueue("valuation.refit", delay=current_app.config["VALUATION_REFIT_DELAY_SECONDS"],
+            connection=connection)
+    session.info["refit_queued"] = True
+
+
+def record_bulk_insert(model):
+    """After a bulk insert: queue the jobs its rows make due."""
+    if model is PriceRecord:
+        queue_refit(db.session())
+
+
+@event.listens_for(db.session, "after_flush")
+def _queue_for_written_rows(session, flush_context):
+    touched = list(session.new) + list(session.deleted) + [
+        obj for obj in session.dirty if session.is_modified(obj, include_collections=False)]
+    if any(isinstance(obj, PriceRecord) for obj in touched):
+        queue_refit(session, session.connection())
+
+
+@event.listens_for(db.session, "after_commit")
+def _reset_after_commit(session):
+    session.info.pop("refit_queued", None)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _reset_after_rollback(session):
+    session.info.pop("refit_queued", None)
@@ -0,0 +1,229 @@
+"""Per-variant valuation model fitted by least squares over the sale records.
+
+For each variant the log of the sale price is modelled as::
+
+    intercept + condition offset (vs "good", or "unknown") +
+    b_year * build decade (vs 1972) + b_sold * years since 2020
+
+so a condition is a price multiplier, the build year a small premium or
+discount, and the sale date the market's annual appreciation. Listing
+mileage is not modelled: sale records don't carry it.
+
+Fitting reads ``price_records`` once, in chunks; each chunk becomes a
+feature matrix whose X'X and X'y are added to per-variant accumulators, and
+every variant is then solved in one batched ``np.linalg.solve``. A small
+ridge penalty keeps a condition a variant has never sold in at zero rather
+than making the system singular. Coefficients are stored in
+``valuation_models`` with a version each refit bumps, and held per worker in
+a ReferenceCache, so a refit anywhere reaches every worker.
+
+``flask valuation refit`` refits only the variants whose price records
+changed since the last fit (read from the change log); ``--full`` refits all
+of them. Run it from cron or after an import. Scoring builds one feature
+matrix for a batch of listings and prices it with one row-wise dot product.
+"""
+
+from datetime import date, datetime, timezone
+import numpy as np
+from sqlalchemy import select
+from app import db
+from app.changelog import DEFAULT_BATCH, ChangeLogGap, consumer_position, latest_seq, read_changes
+from app.models import ChangeLogConsumer, Listing, PriceRecord, ValuationModel
+from app.reference import ReferenceCache, variant_cache
+
+REFERENCE_CONDITION = "good"
+CONDITIONS = ("concours", "excellent", "fair", "project")
+YEAR_CENTRE = 1972
+SOLD_EPOCH = date(2020, 1, 1)
+RIDGE = 1.0
+MIN_RECORDS = 10  # fewer sales than this and a variant keeps the median baseline
+CHUNK = 50_000
+CONSUMER = "valuation"  # change log consumer tracking what the stored fit reflects
+
+FEATURES = ("intercept", *(f"condition_{c}" for c in CONDITIONS), "condition_unknown",
+            "year", "year_unknown", "sold")
+_COLUMN = {name: i for i, name in enumerate(FEATURES)}
+_CONDITION_COLUMN = {c: _COLUMN[f"condition_{c}"] for c in CONDITIONS}
+
+model_cache = ReferenceCache(ValuationModel, ValuationModel.variant_id)
+_parameters_for = (None, None)  # (cached rows, (variant index, coefficient matrix))
+
+
+# ---------------------------------------------------------------------------
+# Features
+# ---------------------------------------------------------------------------
+def years_since_epoch(days):
+    """Convert dates to fractional years since ``SOLD_EPOCH``, as an array."""
+    ordinals = np.fromiter((d.toordinal() for d in days), float, len(days))
+    return (ordinals - SOLD_EPOCH.toordinal()) / 365.25
+
+
+def feature_matrix(conditions, years, sold):
+    """Return the (n, len(FEATURES)) design matrix; ``sold`` is from years_since_epoch()."""
+    n = len(conditions)
+    X = np.zeros((n, len(FEATURES)))
+    X[:, _COLUMN["intercept"]] = 1.0
+
+    unknown = _COLUMN["condition_unknown"]
+    columns = np.fromiter(
+        (-1 if c == REFERENCE_CONDITION else _CONDITION_COLUMN.get(c, unknown) for c in conditions),
+        np.intp, n)
+    offset = columns >= 0
+    X[np.flatnonzero(offset), columns[offset]] = 1.0
+
+    build = np.array([np.nan if y is None else y for y in years], float)
+    missing = np.isnan(build)
+    X[:, _COLUMN["year"]] = np.where(missing, 0.0, (build - YEAR_CENTRE) / 10)
+    X[:, _COLUMN["year_unknown"]] = missing
+    X[:, _COLUMN["sold"]] = sold
+    return X
+
+
+# ---------------------------------------------------------------------------
+# Fitting
+# ---------------------------------------------------------------------------
+def fit(variant_ids):
+    """Fit ``variant_ids`` from ``price_records``; returns {variant_id: (coefs, n, rmse)}."""
+    variant_ids = list(variant_ids)
+    slot_of = {vid: i for i, vid in enumerate(variant_ids)}
+    k, v = len(FEATURES), len(variant_ids)
+    xtx, xty = np.zeros((v, k, k)), np.zeros((v, k))
+    yty, counts = np.zeros(v), np.zeros(v)
+
+    rows = db.session.execute(
+        select(PriceRecord.variant_id, PriceRecord.condition, PriceRecord.year_of_car,
+               PriceRecord.sold_date, PriceRecord.price_gbp)
+        .where(PriceRecord.variant_id.in_(variant_ids), PriceRecord.price_gbp > 0)
+        .execution_options(yield_per=CHUNK)
+    )
+    for chunk in rows.partitions():
+        vids, conditions, years, sold_dates, prices = zip(*chunk)
+        slots = np.fromiter((slot_of[vid] for vid in vids), np.intp, len(chunk))
+        X = feature_matrix(conditions, years, years_since_epoch(sold_dates))
+        y = np.log(np.asarray(prices, float))
+        # One-hot rows -> variants, so every accumulator is a single matrix product
+        member = np.zeros((len(chunk), v))
+        member[np.arange(len(chunk)), slots] = 1.0
+        xtx += np.einsum("nv,ni,nj->vij", member, X, X, optimize=True)
+        xty += member.T @ (X * y[:, None])
+        yty += member.T @ (y * y)
+        counts += member.sum(axis=0)
+
+    fitted = np.flatnonzero(counts >= MIN_RECORDS)
+    if not len(fitted):
+        return {}
+    penalty = np.eye(k) * RIDGE
+    penalty[_COLUMN["intercept"], _COLUMN["intercept"]] = 0.0
+    beta = np.linalg.solve(xtx[fitted] + penalty, xty[fitted][..., None])[..., 0]
+    sse = (yty[fitted] - 2 * np.einsum("vi,vi->v", beta, xty[fitted])
+           + np.einsum("vi,vij,vj->v", beta, xtx[fitted], beta))
+    rmse = np.sqrt(np.maximum(sse, 0) / np.maximum(counts[fitted] - k, 1))
+    return {
+        variant_ids[slot]: (beta[i], int(counts[slot]), float(rmse[i]))
+        for i, slot in enumerate(fitted)
+    }
+
+
+def refit(full=False):
+    """Refit the variants with changed sale records (every variant if ``full``).
+
+    Returns the variant ids that were refitted or dropped.
+    """
+    position = consumer_position(CONSUMER)
+    variant_ids = None
+    if not full and position is not None:
+        try:
+            variant_ids, end = _changed_variants(position)
+        except ChangeLogGap:
+            variant_ids = None
+    if variant_ids is None:
+        end = latest_seq()
+        variant_ids = {variant.id for variant in variant_cache.rows()}
+
+    try:
+        fitted = fit(variant_ids) if variant_ids else {}
+        stored = {m.variant_id: m for m in
+                  ValuationModel.query.filter(ValuationModel.variant_id.in_(variant_ids))}
+        for variant_id in variant_ids:
+            model = stored.get(variant_id)
+            if variant_id not in fitted:
+                if model is not None:
+                    db.session.delete(model)  # too few sales left to fit
+                continue
+            coefs, count, rmse = fitted[variant_id]
+            if model is None:
+                model = ValuationModel(variant_id=variant_id, version=0)
+                db.session.add(model)
+            model.version += 1
+            model.coefficients = dict(zip(FEATURES, map(float, coefs)))
+            model.record_count = count
+            model.rmse = rmse
+            model.fitted_at = datetime.now(timezone.utc)
+        consumer = db.session.get(ChangeLogConsumer, CONSUMER)
+        if consumer is None:
+            consumer = ChangeLogConsumer(name=CONSUMER)
+            db.session.add(consumer)
+        consumer.position = end
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return sorted(variant_ids)
+
+
+def valuations_missing():
+    """True when there are sale records but nothing has been fitted yet."""
+    has_records = db.session.execute(select(PriceRecord.id).limit(1)).first() is not None
+    return has_records and consumer_position(CONSUMER) is None
+
+
+def _changed_variants(position):
+    variant_ids = set()
+    while True:
+        changes, position = read_changes(position, tables=(PriceRecord.__tablename__,))
+        variant_ids.update(c.variant_id for c in changes if c.variant_id is not None)
+        if len(changes) < DEFAULT_BATCH:
+            return variant_ids, position
+
+
+# ---------------------------------------------------------------------------
+# Scoring
+# ---------------------------------------------------------------------------
+def _parameters():
+    """Return ({variant_id: row}, coefficient matrix) for the cached models."""
+    global _parameters_for
+    rows = model_cache.rows()
+    cached_rows, parameters = _parameters_for
+    if cached_rows is not rows:
+        index = {model.variant_id: i for i, model in enumerate(rows)}
+        matrix = np.array([[model.coefficients.get(name, 0.0) for name in FEATURES]
+                           for model in rows]).reshape(len(rows), len(FEATURES))
+        parameters = (index, matrix)
+        _parameters_for = (rows, parameters)
+    return parameters
+
+
+def value_listings(listings, on=None):
+    """Return {listing.id: modelled price on ``on`` (default today)} in one array pass.
+
+    Listings whose variant has no fitted model are left out.
+    """
+    index, matrix = _parameters()
+    listings = [listing for listing in listings if listing.variant_id in index]
+    if not listings:
+        return {}
+    sold = np.full(len(listings), years_since_epoch([on or date.today()])[0])
+    X = feature_matrix([listing.condition for listing in listings],
+                       [listing.year for listing in listings], sold)
+    coefs = matrix[[index[listing.variant_id] for listing in listings]]
+    values = np.exp(np.einsum("nk,nk->n", X, coefs))
+    return {listing.id: int(round(value, -2)) for listing, value in zip(listings, values)}
+
+
+def value_active_listings(on=None):
+    """Return {listing id: modelled price} for every unsold listing."""
+    rows = db.session.execute(
+        select(Listing.id, Listing.variant_id, Listing.condition, Listing.year)
+        .where(Listing.is_sold == False)  # noqa: E712
+    ).all()
+    return value_listings(rows, on)
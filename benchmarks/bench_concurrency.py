@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Show that readers are not blocked by a long write transaction under WAL.
+
+For each journal mode a writer thread inserts a large batch of price records
+in one transaction and holds it open, while reader threads keep running the
+dashboard's grouped count. Reported per mode: the slowest read and how many
+reads failed with "database is locked".
+
+    python benchmarks/bench_concurrency.py
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.schema import init_database  # noqa: E402
+from app.models import PriceRecord  # noqa: E402
+from app.seed import seed_database  # noqa: E402
+
+READ_SQL = text("SELECT variant_id, count(*) FROM price_records GROUP BY variant_id")
+
+
+def run(journal_mode, rows, hold, readers):
+    workdir = tempfile.mkdtemp()
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "SQLITE_JOURNAL_MODE": journal_mode,
+        # A small page cache makes the writer spill to the database file mid-transaction,
+        # which is when rollback-journal mode takes its exclusive lock
+        "SQLITE_CACHE_SIZE_KB": 256,
+        "SQLITE_BUSY_TIMEOUT_MS": 3000,
+        "DB_POOL_SIZE": readers + 1,
+    })
+    with app.app_context():
+        init_database()
+        seed_database()
+        engine = db.engine
+
+    ready = threading.Barrier(readers + 1)
+    writing = threading.Event()
+    done = threading.Event()
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def writer():
+        batch = [{"variant_id": 3, "price_gbp": 20000 + i % 5000, "condition": "good",
+                  "sold_date": date(2025, 1, 1), "notes": "x" * 200} for i in range(rows)]
+        ready.wait()
+        with engine.connect() as conn:
+            with conn.begin():
+                conn.execute(PriceRecord.__table__.insert(), batch)
+                writing.set()
+                time.sleep(hold)
+        done.set()
+
+    def reader():
+        with engine.connect() as conn:
+            conn.execute(READ_SQL).all()  # connect (and run pragmas) before the writer starts
+            conn.rollback()
+            ready.wait()
+            writing.wait()
+            while not done.is_set():
+                t0 = time.perf_counter()
+                try:
+                    conn.execute(READ_SQL).all()
+                    conn.rollback()  # end the read transaction, as a request would
+                    elapsed = time.perf_counter() - t0
+                    with lock:
+                        latencies.append(elapsed)
+                except OperationalError:
+                    with lock:
+                        errors.append(time.perf_counter() - t0)
+                    conn.rollback()
+                time.sleep(0.01)
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader)
+                                                   for _ in range(readers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    slowest = max(latencies) * 1000 if latencies else float("nan")
+    print(f"{journal_mode:>7}: {len(latencies):5d} reads, slowest {slowest:8.1f} ms, "
+          f"{len(errors)} 'database is locked' errors")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--hold", type=float, default=1.5, help="Seconds the writer stays open.")
+    parser.add_argument("--readers", type=int, default=4)
+    args = parser.parse_args()
+    for mode in ("DELETE", "WAL"):
+        run(mode, args.rows, args.hold, args.readers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Benchmark the list pages: ORM objects vs column projections.
+
+Builds synthetic ``registry_cars`` and ``listings`` tables in a throwaway
+SQLite database and, for each page size, fetches one page the way /registry
+and /listings used to (``Model.query.join(ModelVariant)``, hydrating full ORM
+objects and resolving ``row.variant``) and the way they do now
+(``app/projections.py``), then renders the page template from the rows.
+Reported per path: fetch and render time, memory held per row and the SQL
+statements issued for the page: the page query plus any lazy ``row.variant``
+loads (the keyset cursor reads the last row's variant name too).
+
+    python benchmarks/bench_lists.py --registry 100000 --listings 100000 --sizes 50 500
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from flask import render_template  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.schema import init_database  # noqa: E402
+from app.models import ModelVariant, RegistryCar, Listing  # noqa: E402
+from app.pagination import paginate, sort_keys  # noqa: E402
+from app.projections import registry_rows, listing_rows  # noqa: E402
+from app.reference import variant_cache  # noqa: E402
+from app.routes import REGISTRY_SORTS, LISTING_SORTS  # noqa: E402
+from app.synthetic import generate  # noqa: E402
+
+PAGES = {
+    # name: (template, context name, sorts, default sort, ORM query, projection query)
+    "registry": ("registry.html", "cars", REGISTRY_SORTS, "variant",
+                 lambda: RegistryCar.query.join(ModelVariant), registry_rows),
+    "listings": ("listings.html", "listings", LISTING_SORTS, "listed",
+                 lambda: Listing.query.join(ModelVariant), listing_rows),
+}
+PATHS = (
+    # label, use the ORM query, attach the cached variants before fetching
+    ("ORM + identity map", True, True),
+    ("ORM, cold session", True, False),
+    ("projection", False, False),
+)
+
+
+def run_once(page_name, per_page, orm, attach):
+    template, items_name, sorts, default, orm_query, projection_query = PAGES[page_name]
+    columns, descending = sorts[default]
+    keys = sort_keys(columns, descending)
+    db.session.expunge_all()
+    # Detached copies for the filter dropdown unless attached, so a cold session stays cold
+    variants = variant_cache.all() if attach else variant_cache.rows()
+    statements = []
+
+    def count(*_):
+        statements.append(1)
+
+    event.listen(db.engine, "before_cursor_execute", count)
+    try:
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        page = paginate(orm_query() if orm else projection_query(), keys, per_page=per_page)
+        fetch = time.perf_counter() - t0
+        held, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        context = {items_name: page.items, "page": page, "variants": variants,
+                   "sort": default, "descending": descending, "deal_ratings": {},
+                   "duplicates": {}, "show_sold": True, "show_dupes": True}
+        t0 = time.perf_counter()
+        html = render_template(template, **context)
+        render = time.perf_counter() - t0
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count)
+    return fetch, render, held / max(len(page.items), 1), len(statements), len(html)
+
+
+def measure(page_name, per_page, orm, attach, repeat):
+    runs = [run_once(page_name, per_page, orm, attach) for _ in range(repeat)]
+    return (min(r[0] for r in runs), min(r[1] for r in runs),
+            runs[-1][2], runs[-1][3], runs[-1][4])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--registry", type=int, default=100_000)
+    parser.add_argument("--listings", type=int, default=100_000)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(workdir, 'bench.db')}"})
+    with app.app_context():
+        init_database()
+        t0 = time.perf_counter()
+        generate(registry=args.registry, listings=args.listings)
+        print(f"built {args.registry:,} registry cars and {args.listings:,} listings "
+              f"in {time.perf_counter() - t0:.1f}s")
+
+    for page_name in PAGES:
+        for per_page in args.sizes:
+            print(f"\n/{page_name}, {per_page} rows per page")
+            baseline = None
+            for label, orm, attach in PATHS:
+                with app.test_request_context(f"/{page_name}"):
+                    fetch, render, per_row, queries, size = measure(
+                        page_name, per_page, orm, attach, args.repeat)
+                total = fetch + render
+                baseline = baseline or total
+                print(f"  {label:<20} fetch {fetch * 1000:7.2f} ms  render {render * 1000:7.2f} ms  "
+                      f"{per_row / 1024:6.2f} KiB/row  {queries:3} queries  "
+                      f"{baseline / total:4.1f}x  ({size / 1024:.0f} KiB html)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""Benchmark market analysis: ORM loop vs grouped SQL vs monthly rollups.
+
+Builds a synthetic ``price_records`` table (``app/synthetic.py``) in a throwaway
+SQLite database and times the original per-variant Python loop and a grouped
+SQL query over the raw rows against the rollup-backed ``rollup_summaries()``.
+All three use the app's recent window (``MARKET_RECENT_MONTHS``).
+
+    python benchmarks/bench_market.py --rows 1000000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import and_, case, func, select  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.schema import init_database  # noqa: E402
+from app.models import ModelVariant, PriceRecord  # noqa: E402
+from app.market import classify_trend  # noqa: E402
+from app.rollups import (  # noqa: E402
+    rebuild_rollups, recent_start, rollup_summaries, rolling_medians,
+)
+from app.synthetic import generate  # noqa: E402
+
+
+def legacy_analysis(recent_cutoff):
+    """The original market() analysis: load ORM objects, filter per variant."""
+    variants = ModelVariant.query.order_by(ModelVariant.name).all()
+    price_records = PriceRecord.query.join(ModelVariant).order_by(PriceRecord.sold_date).all()
+    analysis = []
+    for v in variants:
+        records = [r for r in price_records if r.variant_id == v.id]
+        if not records:
+            continue
+        prices = [r.price_gbp for r in records]
+        recent = [r for r in records if r.sold_date >= recent_cutoff]
+        recent_prices = [r.price_gbp for r in recent] if recent else prices
+        sorted_recs = sorted(records, key=lambda r: r.sold_date)
+        mid = len(sorted_recs) // 2
+        early = sum(r.price_gbp for r in sorted_recs[:mid]) / mid if mid else None
+        late = sum(r.price_gbp for r in sorted_recs[mid:]) / (len(sorted_recs) - mid)
+        analysis.append((v.id, len(records), min(prices), max(prices),
+                         int(sum(prices) / len(prices)),
+                         int(sum(recent_prices) / len(recent_prices)), early, late))
+    return analysis
+
+
+def variant_summaries(recent_cutoff, variant_id=None):
+    """One grouped query over the raw rows, numbering each variant's sales with window functions."""
+    ranked = select(
+        PriceRecord.variant_id,
+        PriceRecord.price_gbp,
+        PriceRecord.sold_date,
+        func.row_number().over(
+            partition_by=PriceRecord.variant_id,
+            order_by=(PriceRecord.sold_date, PriceRecord.id),
+        ).label("rn"),
+        func.count().over(partition_by=PriceRecord.variant_id).label("n"),
+    )
+    if variant_id:
+        ranked = ranked.where(PriceRecord.variant_id == variant_id)
+    ranked = ranked.subquery()
+
+    price = ranked.c.price_gbp
+    is_recent = ranked.c.sold_date >= recent_cutoff
+    is_early = ranked.c.rn <= ranked.c.n // 2
+    query = select(
+        ranked.c.variant_id,
+        func.count(),
+        func.min(price),
+        func.max(price),
+        func.sum(price),
+        func.count(case((is_recent, 1))),
+        func.sum(case((is_recent, price))),
+        func.avg(case((is_early, price))),
+        func.avg(case((and_(ranked.c.n >= 2, ~is_early), price))),
+    ).group_by(ranked.c.variant_id)
+
+    summaries = {}
+    for row in db.session.execute(query):
+        (vid, count, min_price, max_price, total,
+         recent_count, recent_total, early_avg, late_avg) = row
+        summaries[vid] = {
+            "count": count,
+            "min_price": min_price,
+            "max_price": max_price,
+            "avg_price": int(total / count),
+            "recent_avg": int(recent_total / recent_count) if recent_count else int(total / count),
+            "trend": classify_trend(early_avg, late_avg),
+        }
+    return summaries
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        db.session.expunge_all()
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(workdir, 'bench.db')}"})
+    with app.app_context():
+        init_database()
+        t0 = time.perf_counter()
+        generate(prices=args.rows)
+        print(f"built {args.rows:,} price_records in {time.perf_counter() - t0:.1f}s")
+
+        recent_months = app.config["MARKET_RECENT_MONTHS"]
+        cutoff = recent_start(recent_months)
+        rollups = timed(lambda: rollup_summaries(recent_months=recent_months), args.repeat)
+        print(f"rollups       : {rollups * 1000:9.1f} ms")
+        variant_id = db.session.query(func.min(ModelVariant.id)).scalar()
+        rolling = timed(lambda: rolling_medians(variant_id), args.repeat)
+        print(f"rolling median: {rolling * 1000:9.1f} ms  (one variant, 6-month window)")
+        sql = timed(lambda: variant_summaries(cutoff), args.repeat)
+        print(f"grouped SQL   : {sql * 1000:9.1f} ms")
+        legacy = timed(lambda: legacy_analysis(cutoff), args.repeat)
+        print(f"legacy ORM    : {legacy * 1000:9.1f} ms")
+        print(f"speedup       : {legacy / sql:9.1f}x (SQL), {legacy / rollups:.1f}x (rollups)")
+        t0 = time.perf_counter()
+        n = rebuild_rollups()
+        print(f"rebuild       : {time.perf_counter() - t0:9.1f} s   ({n:,} buckets)")
+
+
+if __name__ == "__main__":
+    main()
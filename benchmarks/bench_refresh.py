@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Benchmark the listing refresh worker against a local stub marketplace.
+
+Starts a threaded HTTP/1.1 stub server whose listing pages carry schema.org
+JSON-LD, an ETag and a fixed latency; every 10th listing has sold, every 17th
+is gone (404) and every 7th has a new price. The first pass fetches every
+page; the second (with ``--min-age-hours 0`` semantics) should be all 304s.
+
+    python benchmarks/bench_refresh.py --listings 2000 --latency-ms 50 --concurrency 16
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import func, text  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.schema import init_database  # noqa: E402
+from app.models import Listing  # noqa: E402
+from app.refresh import refresh_listings  # noqa: E402
+from app.synthetic import generate  # noqa: E402
+
+
+class StubMarketplace(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    stats = {"requests": 0, "not_modified": 0, "connections": 0}
+
+    def setup(self):
+        super().setup()
+        self.stats["connections"] += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.stats["requests"] += 1
+        time.sleep(self.latency)
+        listing_id = int(self.path.rsplit("/", 1)[-1])
+        if listing_id % 17 == 0:
+            return self._send(404, b"gone")
+        etag = f'"{listing_id}-v1"'
+        if self.headers.get("If-None-Match") == etag:
+            self.stats["not_modified"] += 1
+            return self._send(304, b"", {"ETag": etag})
+        offer = {
+            "@type": "Offer",
+            "price": self.server.prices[listing_id] + (500 if listing_id % 7 == 0 else 0),
+            "priceCurrency": "GBP",
+            "availability": "https://schema.org/" + ("SoldOut" if listing_id % 10 == 0 else "InStock"),
+        }
+        document = {"@context": "https://schema.org", "@type": "Car", "offers": offer}
+        body = (f"<html><head><script type=\"application/ld+json\">{json.dumps(document)}"
+                f"</script></head><body>{'x' * 4000}</body></html>").encode()
+        self._send(200, body, {"ETag": etag, "Content-Type": "text/html; charset=utf-8"})
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--listings", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--concurrency", type=int, default=16, help="Workers per site.")
+    parser.add_argument("--rate", type=float, default=0, help="Requests/second per site (0 = unlimited).")
+    args = parser.parse_args()
+
+    StubMarketplace.latency = args.latency_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubMarketplace)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}/listing/"
+
+    workdir = tempfile.mkdtemp()
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "REFRESH_CONCURRENCY": args.concurrency,
+        "REFRESH_RATE": args.rate,
+        "REFRESH_TIMEOUT": 30,
+    })
+    with app.app_context():
+        init_database()
+        generate(listings=args.listings)
+        db.session.execute(text("UPDATE listings SET is_sold = 0, sold_at = NULL, "
+                                "source_url = :base || id"), {"base": base})
+        db.session.commit()
+        server.prices = dict(db.session.query(Listing.id, Listing.price_gbp))
+        sites = db.session.query(func.count(func.distinct(Listing.source_site))).scalar()
+        print(f"{args.listings:,} listings over {sites} sites, {args.latency_ms:.0f} ms latency, "
+              f"{args.concurrency} workers/site")
+
+        for label in ("first pass", "second pass"):
+            before = dict(StubMarketplace.stats)
+            report = refresh_listings(min_age_hours=0)
+            served = {k: StubMarketplace.stats[k] - before[k] for k in before}
+            outcomes = ", ".join(f"{n} {s}" for s, n in sorted(report.statuses.items()))
+            print(f"{label:12}: {report.elapsed:6.2f}s  {report.requests_per_second:7.0f} req/s  "
+                  f"{served['connections']} connections, {served['not_modified']} x 304  ({outcomes})")
+
+        active = Listing.query.filter_by(is_sold=False).count()
+        print(f"active listings left: {active:,}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
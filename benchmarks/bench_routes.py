@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Route benchmark: latency, SQL query count and peak memory per page.
+
+Builds (or reuses) a synthetic database at the chosen scale, drives the read
+routes through the Flask test client and writes a JSON result file that can
+be compared against a previous run:
+
+    python benchmarks/bench_routes.py --scale 100k
+    python benchmarks/bench_routes.py --scale 100k --compare benchmarks/results/<old>.json
+
+Pages are rendered uncached unless ``--cache lru`` (or ``file``) is given, in
+which case every timed request after the warm-up is a cache hit.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import event  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.schema import init_database  # noqa: E402
+from app.models import PriceRecord  # noqa: E402
+from app.synthetic import SCALES, generate  # noqa: E402
+
+ROUTES = {
+    "index": "/",
+    "registry": "/registry",
+    "listings": "/listings",
+    "market": "/market",
+}
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True,
+            cwd=os.path.dirname(__file__), stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def measure(client, url, repeat):
+    queries = []
+
+    def count(*_):
+        queries.append(1)
+
+    event.listen(db.engine, "before_cursor_execute", count)
+    try:
+        client.get(url)  # warm-up
+        timings = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            response = client.get(url)
+            timings.append(time.perf_counter() - t0)
+            assert response.status_code == 200, (url, response.status_code)
+        queries.clear()
+        tracemalloc.start()
+        client.get(url)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count)
+
+    timings.sort()
+    return {
+        "median_ms": round(statistics.median(timings) * 1000, 2),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000, 2),
+        "queries": len(queries),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def compare(current, previous_path):
+    with open(previous_path) as fh:
+        previous = json.load(fh)
+    print(f"\nvs {previous['revision']} ({previous_path}):")
+    for name, now in current["routes"].items():
+        before = previous["routes"].get(name)
+        if not before:
+            continue
+        change = (now["median_ms"] - before["median_ms"]) / before["median_ms"] * 100
+        print(f"  {name:<10} {before['median_ms']:>9.1f} -> {now['median_ms']:>9.1f} ms "
+              f"({change:+.0f}%), queries {before['queries']} -> {now['queries']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=sorted(SCALES), default="10k")
+    parser.add_argument("--db", help="Reuse this SQLite file (built on first use).")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/<rev>-<scale>.json)")
+    parser.add_argument("--compare", help="Previous result file to compare against.")
+    parser.add_argument("--cache", choices=("none", "lru", "file"), default="none",
+                        help="Page cache backend (default: none, to time the views themselves).")
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), "bench.db")
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.abspath(db_path)}",
+        "CACHE_BACKEND": args.cache,
+        "CACHE_DIR": os.path.join(os.path.dirname(os.path.abspath(db_path)), "cache"),
+        # No background jobs (the refit queued by generate()) competing with the timed views
+        "JOBS_WORKERS": 0,
+    })
+    with app.app_context():
+        init_database()
+        if not db.session.query(PriceRecord.id).first():
+            registry, listings, prices = SCALES[args.scale]
+            t0 = time.perf_counter()
+            generate(registry=registry, listings=listings, prices=prices)
+            print(f"built {args.scale} dataset in {time.perf_counter() - t0:.1f}s")
+
+    client = app.test_client()
+    result = {
+        "revision": git_revision(),
+        "scale": args.scale,
+        "cache": args.cache,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "routes": {},
+    }
+    for name, url in ROUTES.items():
+        with app.app_context():
+            stats = measure(client, url, args.repeat)
+        result["routes"][name] = stats
+        print(f"{name:<10} median {stats['median_ms']:>9.1f} ms  p95 {stats['p95_ms']:>9.1f} ms  "
+              f"{stats['queries']:>4} queries  peak {stats['peak_kib']:>9.1f} KiB")
+
+    suffix = "" if args.cache == "none" else f"-{args.cache}"
+    output = args.output or os.path.join(RESULTS_DIR, f"{result['revision']}-{args.scale}{suffix}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as fh:
+        json.dump(result, fh, indent=2)
+    print(f"wrote {output}")
+
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Worker startup benchmark: time from process spawn to first served request.
+
+Boots ``--workers`` fresh Python processes at once against the same SQLite
+file, the way gunicorn does on start or restart, and reports per worker how
+long imports, ``create_app()`` and the first request took. ``--legacy`` also
+runs the schema creation and seed check that used to happen on every boot,
+for comparison. ``--writer`` keeps a bulk insert running in the background
+so the boots happen under write load.
+
+    python benchmarks/bench_startup.py --workers 8
+    python benchmarks/bench_startup.py --workers 8 --legacy --writer
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+WORKER = """
+import json, sys, time
+t0 = time.perf_counter()
+from app import create_app, db
+t1 = time.perf_counter()
+app = create_app()
+if {legacy}:
+    from app.schema import init_database
+    from app.seed import seed_database
+    with app.app_context():
+        init_database()
+        seed_database()
+t2 = time.perf_counter()
+status = app.test_client().get("/").status_code
+t3 = time.perf_counter()
+print(json.dumps({{"ready": time.time(), "import": t1 - t0, "create": t2 - t1,
+                  "first": t3 - t2, "status": status}}))
+"""
+
+WRITER = """
+import time
+from app import create_app, db
+from app.synthetic import generate
+app = create_app()
+with app.app_context():
+    while True:
+        generate(prices=5000, seed=int(time.time()))
+"""
+
+
+def build_database(path):
+    from app import create_app
+    from app.schema import init_database
+    from app.synthetic import generate
+
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}"})
+    with app.app_context():
+        init_database()
+        generate(registry=1_000, listings=2_000, prices=10_000)
+
+
+def boot(workers, env, legacy):
+    code = WORKER.format(legacy=legacy)
+    spawned = time.time()
+    procs = [subprocess.Popen([sys.executable, "-c", code], cwd=ROOT, env=env,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+             for _ in range(workers)]
+    results = []
+    for proc in procs:
+        out, err = proc.communicate()
+        if proc.returncode:
+            raise SystemExit(f"worker failed:\n{err}")
+        result = json.loads(out.strip().splitlines()[-1])
+        result["spawn_to_ready"] = result["ready"] - spawned
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--legacy", action="store_true",
+                        help="Also create the schema and check the seed on every boot.")
+    parser.add_argument("--writer", action="store_true",
+                        help="Run a background bulk insert while the workers boot.")
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    build_database(db_path)
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}")
+
+    writer = None
+    if args.writer:
+        writer = subprocess.Popen([sys.executable, "-c", WRITER], cwd=ROOT, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        time.sleep(1)
+    try:
+        results = []
+        for _ in range(args.rounds):
+            results += boot(args.workers, env, args.legacy)
+    finally:
+        if writer:
+            writer.kill()
+
+    if any(r["status"] != 200 for r in results):
+        raise SystemExit(f"non-200 first response: {[r['status'] for r in results]}")
+    label = "legacy boot" if args.legacy else "boot"
+    print(f"{label}, {args.workers} workers x {args.rounds} rounds"
+          f"{' under write load' if args.writer else ''}:")
+    for key in ("import", "create", "first", "spawn_to_ready"):
+        values = sorted(r[key] * 1000 for r in results)
+        print(f"  {key:<15} median {statistics.median(values):8.1f} ms   "
+              f"max {values[-1]:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
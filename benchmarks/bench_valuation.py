@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Benchmark the valuation model against per-listing average lookups.
+
+Builds synthetic price records and listings (``app/synthetic.py``; prices
+depend on condition and appreciate ~5% a year) in a throwaway SQLite
+database, then times a full fit, an incremental refit after new sales in one
+variant, and valuing every active listing: one SQL aggregate per listing
+(the old deal rating) against one array pass. Accuracy is the median
+absolute error against the listings' asking prices, which the generator
+draws from the same process as the sales.
+
+    python benchmarks/bench_valuation.py --prices 1000000 --listings 100000
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import func, select  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.bulk import bulk_insert  # noqa: E402
+from app.deals import baseline_price, baselines  # noqa: E402
+from app.schema import init_database  # noqa: E402
+from app.models import Listing, PriceRecord  # noqa: E402
+from app.synthetic import generate  # noqa: E402
+from app.valuation import refit, value_active_listings, value_listings  # noqa: E402
+
+
+def legacy_values(listings):
+    """One AVG() per listing over the same variant and condition."""
+    values = {}
+    for listing in listings:
+        avg = db.session.execute(
+            select(func.avg(PriceRecord.price_gbp))
+            .where(PriceRecord.variant_id == listing.variant_id,
+                   PriceRecord.condition == listing.condition)
+        ).scalar()
+        if avg:
+            values[listing.id] = int(avg)
+    return values
+
+
+def median_error(values, listings):
+    errors = [abs(values[l.id] - l.price_gbp) / l.price_gbp for l in listings if l.id in values]
+    return statistics.median(errors) if errors else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prices", type=int, default=200_000)
+    parser.add_argument("--listings", type=int, default=20_000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(workdir, 'bench.db')}"})
+    with app.app_context():
+        init_database()
+        t0 = time.perf_counter()
+        generate(listings=args.listings, prices=args.prices)
+        print(f"built {args.prices:,} price records and {args.listings:,} listings "
+              f"in {time.perf_counter() - t0:.1f}s")
+
+        t0 = time.perf_counter()
+        fitted = refit(full=True)
+        print(f"full fit          : {time.perf_counter() - t0:8.2f} s   ({len(fitted)} variants)")
+
+        variant_id = db.session.query(func.min(PriceRecord.variant_id)).scalar()
+        bulk_insert(PriceRecord, [
+            {"variant_id": variant_id, "price_gbp": 15_000 + i, "condition": "good",
+             "sold_date": date.today()} for i in range(1000)
+        ])
+        db.session.commit()
+        t0 = time.perf_counter()
+        fitted = refit()
+        print(f"incremental refit : {time.perf_counter() - t0:8.2f} s   "
+              f"(1,000 new sales, variants {fitted})")
+
+        active = db.session.execute(
+            select(Listing.id, Listing.variant_id, Listing.condition, Listing.year,
+                   Listing.price_gbp, Listing.listed_at)
+            .where(Listing.is_sold == False)  # noqa: E712
+        ).all()
+        t0 = time.perf_counter()
+        value_active_listings()
+        vectorized = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        legacy = legacy_values(active)
+        per_listing = time.perf_counter() - t0
+        print(f"value {len(active):,} active listings: {vectorized * 1000:8.1f} ms array pass, "
+              f"{per_listing * 1000:8.1f} ms per-listing AVG ({per_listing / vectorized:.0f}x)")
+
+        # Asking prices were drawn on the listing date, so value them as of then
+        modelled = {}
+        for listed_at in {row.listed_at for row in active}:
+            modelled.update(value_listings([r for r in active if r.listed_at == listed_at],
+                                           on=listed_at))
+        snapshot = baselines.snapshot()
+        medians = {row.id: baseline_price(row.variant_id, row.condition, snapshot, "median")
+                   for row in active}
+        print("median abs error vs asking price: "
+              f"model {median_error(modelled, active):.1%}, "
+              f"variant/condition median {median_error(medians, active):.1%}, "
+              f"mean {median_error(legacy, active):.1%}")
+
+
+if __name__ == "__main__":
+    main()
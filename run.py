@@ -1,13 +1,22 @@
 #!/usr/bin/env python3
-"""Run the BMW 02 Tracker application."""
+"""Run the BMW 02 Tracker application.
 
-from app import create_app, db
-from app.seed import seed_database
+``app`` is the WSGI entry point (``gunicorn --preload run:app``). It does no
+database work at import, so ``--preload`` can import once in the master and
+fork workers without sharing a connection. Prepare the database once per deploy with ``flask db init``
+and, for a fresh install, ``flask seed``.
+"""
 
-app = create_app()
+from app import create_app
 
-with app.app_context():
-    seed_database()
+app = create_app()
 
 if __name__ == "__main__":
+    # Development server: make sure there is something to look at
+    from app.schema import init_database
+    from app.seed import seed_database
+
+    with app.app_context():
+        init_database()
+        seed_database()
     app.run(host='0.0.0.0', port=5000, debug=True)
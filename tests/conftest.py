@@ -0,0 +1,87 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app import create_app  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    """A seeded app on a throwaway SQLite database, with no job threads or page cache."""
+    from app import reference
+    from app.deals import baselines
+    from app.schema import init_database
+    from app.seed import seed_database
+
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'test.db'}",
+        "WTF_CSRF_ENABLED": False,
+        "CACHE_BACKEND": "none",
+        "JOBS_WORKERS": 0,
+    })
+    # The reference caches are process-wide; don't let one test's rows leak into the next
+    for cache in reference._caches:
+        cache.invalidate()
+    baselines.invalidate()
+    with app.app_context():
+        init_database()
+        seed_database()
+        yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def derived_tables():
+    """The incrementally maintained aggregates, keyed by row, minus their sketch bytes."""
+    from sqlalchemy import select
+    from app import db
+    from app.models import PriceRollup, PriceSketch, VariantStats
+    from app.sketch import TDigest
+
+    def rows(model, key, fields):
+        out = {}
+        for row in db.session.execute(select(model)).scalars():
+            values = {f: getattr(row, f) for f in fields}
+            if getattr(row, "sketch", None) is not None:
+                values["sketch_weight"] = len(TDigest.from_bytes(row.sketch))
+            out[tuple(getattr(row, k) for k in key)] = values
+        return out
+
+    db.session.expire_all()
+    return {
+        "variant_stats": rows(VariantStats, ["variant_id"],
+                              ["registry_count", "listing_count", "price_count", "price_sum"]),
+        "price_rollups": rows(PriceRollup, ["variant_id", "condition", "month"],
+                              ["count", "total", "min_price", "max_price"]),
+        "price_sketches": rows(PriceSketch, ["variant_id", "condition"], ["count", "total"]),
+    }
+
+
+@pytest.fixture
+def assert_matches_rebuild():
+    """Check the maintained aggregates against a from-scratch rebuild of each."""
+    def check():
+        from app.quantiles import rebuild_price_sketches
+        from app.rollups import rebuild_rollups
+        from app.stats import rebuild_variant_stats
+        maintained = derived_tables()
+        rebuild_variant_stats()
+        rebuild_rollups()
+        rebuild_price_sketches()
+        assert maintained == derived_tables()
+    return check
+
+
+@pytest.fixture
+def materialized_stats(app):
+    """Keep ``variant_stats`` up to date, starting from a rebuild of the seed."""
+    from app.stats import rebuild_variant_stats
+    app.config["VARIANT_STATS_MATERIALIZED"] = True
+    rebuild_variant_stats()
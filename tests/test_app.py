@@ -0,0 +1,20 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_create_app_does_not_import_wtforms():
+    # A fresh interpreter: other tests import the forms into this one
+    code = textwrap.dedent("""
+        import sys
+        from app import create_app
+        create_app({"SQLALCHEMY_DATABASE_URI": "sqlite://"})
+        loaded = sorted(m for m in sys.modules if m.split(".")[0] in ("wtforms", "flask_wtf"))
+        print(",".join(loaded))
+    """)
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True,
+                            text=True, check=True)
+    assert result.stdout.strip() == ""
@@ -0,0 +1,91 @@
+from datetime import date
+
+import pytest
+from app import db
+from app.bulk import bulk_insert
+from app.models import PriceRecord, PriceRollup, PriceSketch
+
+
+@pytest.fixture
+def records(materialized_stats):
+    """Two records sharing a month and condition, plus one with no condition."""
+    rows = [
+        PriceRecord(variant_id=3, price_gbp=12_000, condition="good", sold_date=date(2025, 4, 3)),
+        PriceRecord(variant_id=3, price_gbp=15_000, condition="good", sold_date=date(2025, 4, 20)),
+        PriceRecord(variant_id=3, price_gbp=9_000, condition=None, sold_date=date(2025, 5, 1)),
+    ]
+    db.session.add_all(rows)
+    db.session.commit()
+    return rows
+
+
+def _rollup(variant_id, condition, month):
+    db.session.expire_all()
+    return db.session.get(PriceRollup, (variant_id, condition, month))
+
+
+def test_insert_folds_into_existing_bucket(records, assert_matches_rebuild):
+    bucket = _rollup(3, "good", date(2025, 4, 1))
+    assert (bucket.count, bucket.min_price, bucket.max_price) == (2, 12_000, 15_000)
+    assert_matches_rebuild()
+
+
+def test_edit_price_month_and_condition(records, assert_matches_rebuild):
+    records[0].price_gbp = 30_000
+    db.session.commit()
+    assert _rollup(3, "good", date(2025, 4, 1)).max_price == 30_000
+    assert_matches_rebuild()
+
+    records[1].sold_date = date(2025, 6, 9)
+    records[2].condition = "good"
+    db.session.commit()
+    assert _rollup(3, "good", date(2025, 4, 1)).count == 1
+    assert _rollup(3, "good", date(2025, 6, 1)).count == 1
+    assert _rollup(3, "", date(2025, 5, 1)) is None
+    assert_matches_rebuild()
+
+
+def test_move_to_another_variant(records, assert_matches_rebuild):
+    records[0].variant_id = 5
+    db.session.commit()
+    assert _rollup(5, "good", date(2025, 4, 1)).total == 12_000
+    assert _rollup(3, "good", date(2025, 4, 1)).total == 15_000
+    assert db.session.get(PriceSketch, (5, "good")) is not None
+    assert_matches_rebuild()
+
+
+def test_delete_empties_bucket(records, assert_matches_rebuild):
+    db.session.delete(records[2])
+    db.session.commit()
+    assert _rollup(3, "", date(2025, 5, 1)) is None
+    assert_matches_rebuild()
+
+
+def test_edit_and_insert_in_one_flush(records, assert_matches_rebuild):
+    records[0].price_gbp = 11_000
+    db.session.add(PriceRecord(variant_id=3, price_gbp=13_000, condition="good",
+                               sold_date=date(2025, 4, 9)))
+    db.session.commit()
+    assert _rollup(3, "good", date(2025, 4, 1)).count == 3
+    assert_matches_rebuild()
+
+
+def test_rollback_discards_pending_recompute(records, assert_matches_rebuild):
+    records[0].price_gbp = 99_000
+    db.session.flush()
+    db.session.rollback()
+    assert not any(key.endswith("_recompute") and value
+                   for key, value in db.session.info.items())
+    assert _rollup(3, "good", date(2025, 4, 1)).max_price == 15_000
+    assert_matches_rebuild()
+
+
+def test_bulk_insert_matches_rebuild(records, assert_matches_rebuild):
+    bulk_insert(PriceRecord, [
+        {"variant_id": vid, "price_gbp": 10_000 + i, "condition": cond,
+         "sold_date": date(2025, 4 + i % 3, 1 + i % 20)}
+        for i, (vid, cond) in enumerate([(3, "good"), (3, None), (6, "fair"), (3, "good")] * 25)
+    ])
+    db.session.commit()
+    assert _rollup(3, "good", date(2025, 4, 1)).count > 2
+    assert_matches_rebuild()
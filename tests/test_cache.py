@@ -0,0 +1,97 @@
+import gzip
+
+import pytest
+from app import db
+from app.bulk import bulk_insert
+from app.models import ChangeLogConsumer, RegistryCar
+
+
+@pytest.fixture
+def cached(app):
+    """Serve pages through an in-process cache."""
+    app.config["CACHE_BACKEND"] = "lru"
+    app.extensions.pop("page_cache", None)
+    return app
+
+
+def _get(client, path="/registry", **headers):
+    return client.get(path, headers=headers)
+
+
+def test_second_request_is_a_hit(cached, client):
+    first = _get(client)
+    second = _get(client)
+    assert (first.headers["X-Cache"], second.headers["X-Cache"]) == ("miss", "hit")
+    assert first.get_data() == second.get_data()
+    assert first.headers["ETag"] == second.headers["ETag"]
+    assert second.headers["Cache-Control"] == "no-cache"
+
+
+def test_tracked_write_changes_the_key(cached, client):
+    before = _get(client)
+    db.session.add(ChangeLogConsumer(name="untracked", position=0))
+    db.session.commit()
+    assert _get(client).headers["X-Cache"] == "hit"
+
+    db.session.add(RegistryCar(variant_id=3, year=1973, colour="Fjord CACHE01"))
+    db.session.commit()
+    after = _get(client)
+    assert after.headers["X-Cache"] == "miss"
+    assert after.headers["ETag"] != before.headers["ETag"]
+    assert b"CACHE01" in after.get_data()
+
+
+def test_bulk_write_changes_the_key(cached, client):
+    _get(client)
+    bulk_insert(RegistryCar, [{"variant_id": 3, "year": 1971, "colour": "Colorado"}])
+    db.session.commit()
+    assert _get(client).headers["X-Cache"] == "miss"
+
+
+def test_rolled_back_write_keeps_the_key(cached, client):
+    _get(client)
+    db.session.add(RegistryCar(variant_id=3, year=1973, colour="Inka"))
+    db.session.flush()
+    db.session.rollback()
+    assert _get(client).headers["X-Cache"] == "hit"
+
+
+def test_if_none_match_gets_304(cached, client):
+    etag = _get(client).headers["ETag"]
+    response = _get(client, **{"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.get_data() == b""
+    assert _get(client, **{"If-None-Match": '"stale"'}).status_code == 200
+
+
+def test_weak_etag_after_gzip_revalidates(cached, client):
+    response = _get(client, **{"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["ETag"].startswith('W/"')
+    assert b"<html" in gzip.decompress(response.get_data()).lower()
+
+    revalidated = _get(client, **{"Accept-Encoding": "gzip",
+                                  "If-None-Match": response.headers["ETag"]})
+    assert revalidated.status_code == 304
+    assert "Content-Encoding" not in revalidated.headers
+
+
+def test_no_cache_request_renders_afresh(cached, client):
+    _get(client)
+    reload = _get(client, **{"Cache-Control": "no-cache"})
+    assert reload.headers["X-Cache"] == "miss"
+    assert _get(client).headers["X-Cache"] == "hit"
+
+
+def test_pending_flashes_skip_the_cache(cached, client):
+    _get(client)
+    with client.session_transaction() as session:
+        session["_flashes"] = [("message", "Saved the car")]
+    response = _get(client)
+    assert "X-Cache" not in response.headers
+    assert b"Saved the car" in response.get_data()
+    assert _get(client).headers["X-Cache"] == "hit"
+
+
+def test_no_backend_serves_uncached(app, client):
+    assert "X-Cache" not in _get(client).headers
@@ -0,0 +1,153 @@
+from datetime import date
+
+import pytest
+from app import db
+from app.bulk import bulk_insert
+from app.changelog import (
+    ChangeLogGap, compact, consume, consumer_position, drop_consumer, latest_seq, read_changes,
+    register_consumer,
+)
+from app.models import ChangeLogConsumer, Listing, PriceRecord, ValuationModel
+from app.valuation import CONSUMER, refit
+
+
+def _listing(**values):
+    fields = {"variant_id": 3, "title": "2002 tii", "price_gbp": 20_000, "source_site": "ebay"}
+    return Listing(**{**fields, **values})
+
+
+def _all_changes(position, **kwargs):
+    changes = []
+    while True:
+        batch, position = read_changes(position, **kwargs)
+        changes += batch
+        if not batch:
+            return changes, position
+
+
+def test_changes_come_back_in_seq_order(app):
+    start = latest_seq()
+    listing = _listing()
+    db.session.add(listing)
+    db.session.commit()
+    listing.price_gbp = 21_000
+    db.session.commit()
+    listing.variant_id = 5
+    db.session.commit()
+    db.session.delete(listing)
+    db.session.commit()
+
+    changes, end = _all_changes(start, limit=2)
+    assert end == latest_seq()
+    assert [c.seq for c in changes] == sorted({c.seq for c in changes})
+    assert [(c.op, c.variant_id) for c in changes if c.row_id == listing.id] == \
+        [("I", 3), ("U", 3), ("U", 5), ("U", 3), ("D", 5)]
+    assert {c.table for c in changes} == {"listings"}
+
+
+def test_table_filter_still_advances_position(app):
+    start = latest_seq()
+    db.session.add(_listing())
+    db.session.add(PriceRecord(variant_id=3, price_gbp=9_000, sold_date=date(2025, 1, 1)))
+    db.session.commit()
+    changes, end = read_changes(start, tables=["price_records"])
+    assert [c.table for c in changes] == ["price_records"]
+    assert end == latest_seq()
+    assert read_changes(end) == ([], end)
+
+
+def test_bulk_insert_logs_exactly_its_rows(app):
+    start = latest_seq()
+    ids = bulk_insert(PriceRecord, [
+        {"variant_id": 2 + i % 3, "price_gbp": 10_000 + i, "sold_date": date(2025, 2, 1)}
+        for i in range(1_200)
+    ])
+    db.session.commit()
+    changes, _ = _all_changes(start)
+    assert sorted(c.row_id for c in changes) == sorted(ids)
+    assert {c.op for c in changes} == {"I"}
+    assert [c.row_id for c in changes] == sorted(ids)
+
+
+def test_compaction_keeps_newest_entry_per_row(app):
+    start = latest_seq()
+    listing = _listing()
+    db.session.add(listing)
+    db.session.commit()
+    for price in (21_000, 22_000, 23_000):
+        listing.price_gbp = price
+        db.session.commit()
+    superseded, purged = compact(retain_hours=24)
+    assert superseded >= 3 and purged == 0
+    changes, _ = read_changes(start)
+    assert [(c.row_id, c.op) for c in changes if c.table == "listings"] == [(listing.id, "U")]
+
+
+def test_purge_past_a_position_raises_gap(app):
+    register_consumer("report")
+    behind = latest_seq()
+    db.session.add(_listing())
+    db.session.commit()
+    assert consume("report", lambda changes: None) == 1
+    _, purged = compact(retain_hours=0)
+    assert purged > 0
+    with pytest.raises(ChangeLogGap):
+        read_changes(behind - 1)
+    assert read_changes(consumer_position("report")) == ([], latest_seq())
+
+
+def test_consumer_held_back_compaction(app):
+    register_consumer("slow")
+    position = consumer_position("slow")
+    db.session.add(_listing())
+    db.session.commit()
+    compact(retain_hours=0)
+    changes, _ = read_changes(position)
+    assert len(changes) == 1
+
+
+def test_failed_handler_keeps_consumer_position(app):
+    register_consumer("mirror")
+    position = consumer_position("mirror")
+    db.session.add(_listing())
+    db.session.commit()
+
+    def fail(changes):
+        db.session.add(ChangeLogConsumer(name="written-by-handler", position=0))
+        db.session.flush()
+        raise RuntimeError("handler failed")
+
+    with pytest.raises(RuntimeError):
+        consume("mirror", fail)
+    assert consumer_position("mirror") == position
+    assert consumer_position("written-by-handler") is None
+
+    seen = []
+    assert consume("mirror", seen.extend) == 1
+    assert consumer_position("mirror") == seen[-1].seq == latest_seq()
+
+
+def test_refit_falls_back_to_full_fit_after_gap(app):
+    bulk_insert(PriceRecord, [
+        {"variant_id": 3, "price_gbp": 15_000 + 500 * i, "condition": "good",
+         "year_of_car": 1970 + i % 5, "sold_date": date(2024, 1 + i, 1)}
+        for i in range(12)
+    ])
+    db.session.commit()
+    refit(full=True)
+    fitted = {m.variant_id for m in ValuationModel.query}
+    assert fitted
+
+    drop_consumer(CONSUMER)
+    behind = latest_seq()
+    db.session.add(PriceRecord(variant_id=3, price_gbp=9_000, sold_date=date(2025, 1, 1)))
+    db.session.commit()
+    compact(retain_hours=0)
+    register_consumer(CONSUMER, position=behind - 1)
+    with pytest.raises(ChangeLogGap):
+        read_changes(behind - 1)
+
+    refitted = refit()
+    assert fitted <= set(refitted)
+    assert consumer_position(CONSUMER) == latest_seq()
+    assert refit() == []
@@ -0,0 +1,40 @@
+from datetime import date, timedelta
+from app import db
+from app import charts
+from app.charts import chart_payload
+from app.models import PriceRecord
+
+
+def _add_sales(n, variant_id=1):
+    db.session.add_all(PriceRecord(variant_id=variant_id, price_gbp=15_000 + i,
+                                   sold_date=date(2020, 1, 1) + timedelta(days=i))
+                       for i in range(n))
+    db.session.commit()
+
+
+def test_raw_mode_sends_every_point_under_the_cap(app):
+    with app.app_context():
+        payload = chart_payload(mode="none")
+        assert payload["mode"] == "none"
+        total = sum(s["total"] for s in payload["series"])
+        assert sum(len(s["day"]) for s in payload["series"]) == total > 0
+
+
+def test_raw_mode_falls_back_to_lttb_over_the_cap(app, monkeypatch):
+    monkeypatch.setattr(charts, "RAW_MAX_POINTS", 20)
+    with app.app_context():
+        _add_sales(40)
+        payload = chart_payload(variant_id=1, mode="none", max_points=10)
+        assert payload["mode"] == "lttb"
+        (series,) = payload["series"]
+        assert series["total"] >= 40
+        assert len(series["day"]) == 10
+
+
+def test_chart_data_route_caps_raw_points(client, app, monkeypatch):
+    monkeypatch.setattr(charts, "RAW_MAX_POINTS", 20)
+    with app.app_context():
+        _add_sales(40)
+    payload = client.get("/market/chart-data?variant=1&mode=none&max_points=50").get_json()
+    assert payload["mode"] == "lttb"
+    assert all(len(s["day"]) <= 50 for s in payload["series"])
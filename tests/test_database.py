@@ -0,0 +1,67 @@
+import time
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app import create_app, db
+from app.models import PriceRecord
+from app.schema import init_database
+
+COUNT = text("SELECT count(*) FROM price_records")
+
+
+def _pragma(conn, name):
+    return conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+
+
+def _read_during_write(engine):
+    """Read on one connection while another holds a large uncommitted insert.
+
+    The writer's page cache is tiny, so it spills to the database file
+    mid-transaction: under a rollback journal that takes an exclusive lock.
+    Returns (rows the reader saw before, rows it saw during, seconds the read took).
+    """
+    with engine.connect() as reader, engine.connect() as writer:
+        before = reader.execute(COUNT).scalar()
+        reader.rollback()
+        writer.exec_driver_sql("PRAGMA cache_size=-64")  # autobegins the transaction
+        try:
+            writer.execute(PriceRecord.__table__.insert(), [
+                {"variant_id": 3, "price_gbp": 20_000 + i, "condition": "good",
+                 "sold_date": date(2025, 1, 1), "notes": "x" * 200} for i in range(5000)])
+            started = time.perf_counter()
+            during = reader.execute(COUNT).scalar()
+            return before, during, time.perf_counter() - started
+        finally:
+            writer.rollback()
+
+
+def test_sqlite_pragmas_are_applied_to_every_connection(app):
+    for _ in range(2):
+        with db.engine.connect() as conn:
+            assert _pragma(conn, "journal_mode") == "wal"
+            assert _pragma(conn, "synchronous") == 1  # NORMAL
+            assert _pragma(conn, "busy_timeout") == app.config["SQLITE_BUSY_TIMEOUT_MS"]
+
+
+def test_reader_is_not_blocked_by_open_write_transaction(app):
+    before, during, seconds = _read_during_write(db.engine)
+    # The reader sees the last committed snapshot, without waiting for the writer
+    assert during == before
+    assert seconds * 1000 < app.config["SQLITE_BUSY_TIMEOUT_MS"]
+
+
+def test_rollback_journal_reader_is_locked_out(tmp_path):
+    # The contrast case: the same write without WAL blocks readers
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'journal.db'}",
+        "SQLITE_JOURNAL_MODE": "DELETE",
+        "SQLITE_BUSY_TIMEOUT_MS": 100,
+        "JOBS_WORKERS": 0,
+    })
+    with app.app_context():
+        init_database()
+        with pytest.raises(OperationalError, match="locked"):
+            _read_during_write(db.engine)
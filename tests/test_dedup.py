@@ -0,0 +1,107 @@
+from sqlalchemy import select
+from app import db
+from app.bulk import bulk_insert
+from app.dedup import (
+    collapse_duplicates, duplicate_sites, minhash, rebuild_index, shingles, similarity,
+)
+from app.models import Listing, ListingFingerprint, ListingLshBucket
+
+TITLE = "BMW 2002 Tii 1973 Inka orange, restored, matching numbers"
+DESCRIPTION = ("Full nut and bolt restoration completed 2019. Fresh Kugelfischer pump, "
+               "new interior, history file from new and two keys.")
+
+
+def _listing(**overrides):
+    values = {"variant_id": 3, "title": TITLE, "description": DESCRIPTION, "year": 1973,
+              "colour": "Inka", "price_gbp": 30_000, "source_site": "ebay", "is_sold": False}
+    values.update(overrides)
+    return values
+
+
+def _add(**overrides):
+    listing = Listing(**_listing(**overrides))
+    db.session.add(listing)
+    db.session.commit()
+    return listing.id
+
+
+def _clusters():
+    """{listing id: cluster id} for every indexed listing."""
+    return dict(db.session.execute(
+        select(ListingFingerprint.listing_id, ListingFingerprint.cluster_id)).all())
+
+
+def _shown(since_id):
+    """Active listings from ``since_id`` on, one per cluster, as /listings shows them."""
+    active = Listing.query.filter(Listing.is_sold == False, Listing.id >= since_id)  # noqa: E712
+    return {listing.id for listing in collapse_duplicates(active)}
+
+
+def _signature(title, description=DESCRIPTION):
+    return minhash(shingles(title, description, 1973, "Inka"))
+
+
+def test_minhash_estimates_text_similarity():
+    same = _signature(TITLE)
+    assert similarity(same, _signature(TITLE)) == 1.0
+    assert similarity(same, _signature(TITLE.replace("restored", "restored!"))) >= 0.7
+    unrelated = _signature("Project 1602 needs welding", "Barn find, no MOT, spares or repair.")
+    assert similarity(same, unrelated) < 0.3
+
+
+def test_near_duplicates_cluster_and_collapse(app):
+    first = _add()
+    second = _add(source_site="carandclassic", title=TITLE + "!")
+    other = _add(title="BMW 2002 Touring project", description="Needs sills and floors.")
+
+    clusters = _clusters()
+    assert clusters[first] == clusters[second] == first
+    assert clusters[other] is None
+    assert duplicate_sites([db.session.get(Listing, second)]) == {second: [(first, "ebay")]}
+
+    assert _shown(first) == {first, other}
+    # Selling the original hands the cluster to the next member
+    db.session.get(Listing, first).is_sold = True
+    db.session.commit()
+    assert _shown(first) == {second, other}
+
+
+def test_edit_and_delete_recluster(app):
+    first = _add()
+    second = _add(source_site="pistonheads")
+    third = _add(source_site="autotrader")
+    assert {_clusters()[i] for i in (first, second, third)} == {first}
+
+    # Editing the text away from the others takes it out of the cluster
+    db.session.get(Listing, first).description = "Completely different car: a 1502 in Polaris."
+    db.session.get(Listing, first).title = "1502 Polaris silver daily driver"
+    db.session.commit()
+    clusters = _clusters()
+    assert clusters[first] is None
+    assert clusters[second] == clusters[third] == second
+
+    db.session.delete(db.session.get(Listing, third))
+    db.session.commit()
+    clusters = _clusters()
+    assert third not in clusters
+    assert clusters[second] is None
+    assert not ListingLshBucket.query.filter_by(listing_id=third).count()
+
+
+def test_bulk_insert_indexes_exactly_its_rows(app):
+    ids = bulk_insert(Listing, [_listing(), _listing(source_site="gumtree")])
+    db.session.commit()
+    clusters = _clusters()
+    assert len(ids) == 2
+    assert clusters[ids[0]] == clusters[ids[1]] == min(ids)
+
+
+def test_incremental_index_matches_rebuild(app):
+    _add()
+    _add(source_site="carandclassic")
+    second = _add(source_site="gumtree", title="BMW 2002 Tii 1973 Inka orange")
+    db.session.delete(db.session.get(Listing, second))
+    db.session.commit()
+    maintained = _clusters()
+    rebuild_index()
+    assert _clusters() == maintained
@@ -0,0 +1,37 @@
+import pytest
+from flask import g
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from app import db
+
+
+def _fail(conn):
+    with pytest.raises(OperationalError):
+        conn.execute(text("SELECT * FROM no_such_table"))
+
+
+def test_failed_statements_leave_no_start_times(app):
+    with db.engine.connect() as conn:
+        for _ in range(3):
+            _fail(conn)
+            conn.rollback()
+        conn.execute(text("SELECT 1"))
+        assert conn.info["query_started"] == []
+
+
+def test_failed_statement_is_timed_with_the_request(app):
+    with app.test_request_context("/registry"):
+        g.perf = {"queries": 0, "sql_time": 0.0, "render_time": 0.0, "slowest": []}
+        with db.engine.connect() as conn:
+            _fail(conn)
+            conn.rollback()
+            conn.execute(text("SELECT 1"))
+        assert g.perf["queries"] == 2
+        assert [entry[2] for entry in sorted(g.perf["slowest"], key=lambda e: e[1])] == \
+            ["SELECT * FROM no_such_table", "SELECT 1"]
+
+
+def test_server_timing_counts_queries(client):
+    header = client.get("/registry").headers["Server-Timing"]
+    assert header.startswith("db;dur=")
+    assert int(header.split('desc="')[1].split()[0]) > 0
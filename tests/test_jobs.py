@@ -0,0 +1,71 @@
+from app import db
+from app.jobs import DONE, FAILED, QUEUED, TASKS, enqueue, retry, task, work
+from app.models import Job
+
+
+@task("test.echo")
+def echo(delay=None, connection=None):
+    if delay == "boom":
+        raise RuntimeError("boom")
+    return f"delay={delay} connection={connection}"
+
+
+def _clear_jobs():
+    Job.query.delete()  # the seed queues its own jobs
+    db.session.commit()
+
+
+def test_enqueue_coalesces_queued_key(app):
+    with app.app_context():
+        _clear_jobs()
+        assert enqueue("test.echo", {"delay": 1})
+        assert not enqueue("test.echo", {"delay": 1})
+        assert enqueue("test.echo", {"delay": 2})
+        db.session.commit()
+        assert Job.query.filter_by(name="test.echo", status=QUEUED).count() == 2
+
+
+def test_enqueue_queues_key_again_once_it_has_run(app):
+    with app.app_context():
+        _clear_jobs()
+        enqueue("test.echo")
+        db.session.commit()
+        assert work() == 1
+        assert enqueue("test.echo")
+        db.session.commit()
+        assert [j.status for j in Job.query.order_by(Job.id)] == [DONE, QUEUED]
+
+
+def test_retry_failed_job_keeps_args_named_like_enqueue_parameters(app):
+    app.config["JOBS_MAX_ATTEMPTS"] = 1
+    with app.app_context():
+        _clear_jobs()
+        enqueue("test.echo", {"delay": "boom", "connection": "x"})
+        db.session.commit()
+        work()
+        failed = Job.query.one()
+        assert failed.status == FAILED
+
+        assert retry(failed.id)
+        again = Job.query.filter_by(status=QUEUED).one()
+        assert again.args == {"delay": "boom", "connection": "x"}
+        assert again.key == failed.key
+        assert not retry(again.id)  # only failed jobs
+        assert not retry(failed.id)  # already queued again
+
+
+def test_retry_runs_with_original_args(app):
+    with app.app_context():
+        _clear_jobs()
+        enqueue("test.echo", {"delay": 5})
+        db.session.commit()
+        Job.query.update({"status": FAILED})
+        db.session.commit()
+        assert retry(Job.query.one().id)
+        work()
+        done = Job.query.filter_by(status=DONE).one()
+        assert done.result == "delay=5 connection=None"
+
+
+def teardown_module():
+    TASKS.pop("test.echo", None)
@@ -0,0 +1,134 @@
+import base64
+import html
+import json
+import re
+from datetime import date
+
+import pytest
+from app import db
+from app.models import Listing, RegistryCar
+from app.pagination import encode_cursor, paginate, sort_keys
+from app.projections import listing_rows, registry_rows
+from app.routes import LISTING_SORTS, REGISTRY_SORTS
+
+_NEXT = re.compile(r'<a href="([^"]*cursor=[^"]*)"[^>]*>Next')
+_PREV = re.compile(r'<a href="([^"]*cursor=[^"]*)"[^>]*>&larr; Previous')
+_ROW_IDS = {
+    "/registry": re.compile(r'/registry/(\d+)/edit'),
+    "/listings": re.compile(r'name="listing_id" value="(\d+)"'),
+}
+
+
+@pytest.fixture
+def ties(app):
+    """Extra rows sharing sort values, with NULL years and listing dates."""
+    for i in range(9):
+        db.session.add(RegistryCar(variant_id=3 + i % 2, year=1972, colour=f"Colour {i}"))
+        db.session.add(Listing(
+            variant_id=3 + i % 2, title=f"Tie {i} {'x' * i}", description=f"Listing number {i}",
+            price_gbp=15_000 if i % 3 else 22_000, year=None if i % 4 == 0 else 1972,
+            listed_at=None if i % 3 == 0 else date(2026, 1, 1 + i % 2), source_site="ebay"))
+    db.session.commit()
+
+
+def _walk(query, keys, per_page):
+    """Page forward to the end, then back to the start; return both id sequences."""
+    forward, cursor = [], None
+    while True:
+        page = paginate(query, keys, cursor=cursor, per_page=per_page)
+        forward.append([row.id for row in page.items])
+        if not page.next_cursor:
+            break
+        cursor = page.next_cursor
+    backward = [[row.id for row in page.items]]
+    while page.prev_cursor:
+        page = paginate(query, keys, cursor=page.prev_cursor, per_page=per_page)
+        backward.append([row.id for row in page.items])
+    return forward, backward[::-1]
+
+
+CASES = [(registry_rows, REGISTRY_SORTS, name) for name in REGISTRY_SORTS] + \
+        [(listing_rows, LISTING_SORTS, name) for name in LISTING_SORTS]
+
+
+@pytest.mark.parametrize("rows, sorts, sort", CASES)
+@pytest.mark.parametrize("descending", [False, True])
+@pytest.mark.parametrize("per_page", [1, 2, 4])
+def test_keyset_walk_has_no_repeats_or_gaps(ties, rows, sorts, sort, descending, per_page):
+    keys = sort_keys(sorts[sort][0], descending)
+    expected = [row.id for row in rows().order_by(*[k.order_clause() for k in keys])]
+    forward, backward = _walk(rows(), keys, per_page)
+    assert [i for page in forward for i in page] == expected
+    assert backward == forward
+    assert all(len(page) == per_page for page in forward[:-1])
+
+
+def test_nulls_sort_first_ascending_and_last_descending(ties):
+    for descending, tail in ((False, -1), (True, 0)):
+        keys = sort_keys(LISTING_SORTS["year"][0], descending)
+        forward, _ = _walk(listing_rows(), keys, 3)
+        years = [db.session.get(Listing, i).year for page in forward for i in page]
+        assert years[tail] is not None
+        nulls = [y is None for y in years]
+        assert nulls == sorted(nulls, reverse=not descending)
+
+
+def _page_ids(client, path, url):
+    body = client.get(url).get_data(as_text=True)
+    return [int(i) for i in _ROW_IDS[path].findall(body)], body
+
+
+@pytest.mark.parametrize("path, query", [
+    ("/registry", "per_page=2"),
+    ("/registry", "per_page=3&sort=year&dir=desc"),
+    ("/listings", "per_page=2"),
+    ("/listings", "per_page=2&sort=price"),
+    ("/listings", "per_page=3&sort=year&dir=desc&sold=1"),
+])
+def test_routes_page_forward_and_back(client, ties, path, query):
+    first, body = _page_ids(client, path, f"{path}?{query}")
+    everything = _page_ids(client, path, f"{path}?{query.replace('per_page=', 'x=')}"
+                                         "&per_page=500")[0]
+    pages = [first]
+    while (link := _NEXT.search(body)):
+        ids, body = _page_ids(client, path, html.unescape(link.group(1)))
+        pages.append(ids)
+    assert [i for page in pages for i in page] == everything
+    back = [pages[-1]]
+    while (link := _PREV.search(body)):
+        ids, body = _page_ids(client, path, html.unescape(link.group(1)))
+        back.append(ids)
+    assert back[::-1] == pages
+
+
+def _cursor(payload):
+    raw = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("cursor", [
+    "not-a-cursor",
+    "%%%",
+    _cursor(b"\xff\xfe"),
+    _cursor([1, 2]),
+    _cursor({"k": [1]}),
+    _cursor({"k": [{"x": 1}, 2], "b": 0}),
+    _cursor({"k": ["not-a-date", 3], "b": 0}),
+    _cursor({"k": ["2026-01-01", "three"], "b": 0}),
+    _cursor({"k": [1972, [1]], "b": 1}),
+])
+@pytest.mark.parametrize("path", ["/listings", "/registry"])
+def test_bad_cursor_gives_first_page(client, ties, path, cursor):
+    first = client.get(f"{path}?per_page=2")
+    response = client.get(f"{path}?per_page=2&cursor={cursor}")
+    assert response.status_code in (200, 400)
+    if response.status_code == 200:
+        assert _ROW_IDS[path].findall(response.get_data(as_text=True)) == \
+            _ROW_IDS[path].findall(first.get_data(as_text=True))
+
+
+def test_cursor_round_trips_dates_and_nulls(ties):
+    keys = sort_keys(LISTING_SORTS["listed"][0], True)
+    row = listing_rows().filter(Listing.listed_at.is_(None)).first()
+    page = paginate(listing_rows(), keys, cursor=encode_cursor(keys, row), per_page=50)
+    assert row.id not in [r.id for r in page.items]
@@ -0,0 +1,23 @@
+from app.queryplan import CHECKED_URLS, PAGINATED_URLS, check_routes, plan_problems
+
+
+def test_read_routes_and_their_next_pages_have_clean_plans(app):
+    with app.app_context():
+        assert check_routes(app) == []
+
+
+def test_paginated_routes_are_checked():
+    assert set(PAGINATED_URLS) <= set(CHECKED_URLS)
+    assert any(url.startswith("/registry") and "sort=" not in url for url in PAGINATED_URLS)
+
+
+def test_page_sorted_in_temp_btree_is_flagged(app):
+    statement = "SELECT * FROM listings ORDER BY price_gbp LIMIT ?"
+    plan = ["SCAN listings", "USE TEMP B-TREE FOR ORDER BY"]
+    with app.app_context():
+        assert plan_problems(statement, plan, paginated=True) == [
+            "full scan of listings", "page sorted in a temp B-tree"]
+        assert plan_problems(statement, plan[1:], paginated=False) == []
+        # A bounded table may be sorted
+        assert plan_problems(statement, ["SEARCH registry_cars USING INDEX ix (condition=?)",
+                                         "USE TEMP B-TREE FOR ORDER BY"], paginated=True) == []
@@ -0,0 +1,92 @@
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app import db
+from app.listing_parsers import PARSERS, _price
+from app.models import Listing, ListingCheck
+from app.refresh import MAX_BODY, refresh_listings
+
+
+def _page(price):
+    offer = {"@type": "Offer", "price": price, "priceCurrency": "GBP",
+             "availability": "https://schema.org/InStock"}
+    document = json.dumps({"@context": "https://schema.org", "@type": "Car", "offers": offer})
+    return f'<html><script type="application/ld+json">{document}</script></html>'.encode()
+
+
+PAGES = {
+    "/ok": (_page(21000), None),
+    "/corrupt-gzip": (b"\x1f\x8b\x08\x00not really gzip at all", "gzip"),
+    "/gzip-bomb": (gzip.compress(b" " * (MAX_BODY * 2)), "gzip"),
+    "/huge-price": (_page("1e400"), None),
+    "/parser-crash": (_page(22000), None),
+}
+
+
+class StubSite(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body, encoding = PAGES[self.path]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def stub_site():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubSite)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_one_broken_page_does_not_abort_the_run(app, stub_site, monkeypatch):
+    def crash(html):
+        raise RuntimeError("parser bug")
+
+    monkeypatch.setitem(PARSERS, "crashy", crash)
+    app.config["REFRESH_RATE"] = 0
+    for listing in Listing.query.filter(Listing.source_url.is_not(None)):
+        db.session.delete(listing)  # only the stub's pages are due
+    ids = {}
+    for path in PAGES:
+        listing = Listing(variant_id=1, title=path, price_gbp=10000, listed_at=None,
+                          source_site="crashy" if path == "/parser-crash" else "dealer",
+                          source_url=stub_site + path)
+        db.session.add(listing)
+        db.session.flush()
+        ids[path] = listing.id
+    db.session.commit()
+
+    report = refresh_listings(min_age_hours=0)
+
+    assert report.checked == len(PAGES)
+    assert report.statuses == {"updated": 1, "unchanged": 1, "failed": 3}
+    assert db.session.get(Listing, ids["/ok"]).price_gbp == 21000
+    assert db.session.get(Listing, ids["/huge-price"]).price_gbp == 10000
+    checks = {c.listing_id: c for c in ListingCheck.query}
+    assert "corrupt gzip" in checks[ids["/corrupt-gzip"]].error
+    assert "too large" in checks[ids["/gzip-bomb"]].error
+    assert "parser bug" in checks[ids["/parser-crash"]].error
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("£21,500", 21500), (21500.4, 21500), ("1e400", None), ("inf", None), ("nan", None),
+    ("-5", None), ("1e12", None), ("n/a", None), (None, None),
+])
+def test_price_rejects_nonsense(value, expected):
+    assert _price(value) == expected
@@ -0,0 +1,52 @@
+from sqlalchemy import func, select
+from app import db
+from app.models import Listing, PriceRecord
+from app.sales import mark_sold
+
+
+def _active_ids(n):
+    return [l.id for l in Listing.query.filter_by(is_sold=False).order_by(Listing.id).limit(n)]
+
+
+def test_mark_sold_skips_missing_and_sold_ids_and_keeps_aggregates(app, materialized_stats,
+                                                                   assert_matches_rebuild):
+    first, second, sold_id = _active_ids(3)
+    mark_sold([sold_id])
+    records_before = db.session.scalar(select(func.count()).select_from(PriceRecord))
+
+    report = mark_sold([first, second, sold_id, 999_999, first], prices={second: 9_500})
+
+    assert sorted(report.sold) == [first, second]
+    assert sorted(report.skipped) == sorted([sold_id, 999_999])
+    assert db.session.scalar(select(func.count()).select_from(PriceRecord)) == records_before + 2
+    asking = db.session.get(Listing, first).price_gbp
+    notes = {r.notes: r.price_gbp
+             for r in PriceRecord.query.filter(PriceRecord.notes.like("Listing #%"))}
+    assert notes == {f"Listing #{sold_id} marked sold": db.session.get(Listing, sold_id).price_gbp,
+                     f"Listing #{first} marked sold": asking,
+                     f"Listing #{second} marked sold": 9_500}
+    assert all(db.session.get(Listing, i).is_sold for i in (first, second))
+    assert_matches_rebuild()
+
+
+def test_mark_sold_json_rejects_non_positive_prices(client, app):
+    (listing_id,) = _active_ids(1)
+    for price in (0, -5_000):
+        response = client.post("/listings/mark-sold.json",
+                               json={"listings": [{"id": listing_id, "price_gbp": price}]})
+        assert response.status_code == 400
+    assert not db.session.get(Listing, listing_id).is_sold
+
+
+def test_mark_sold_json_records_given_price(client, app, materialized_stats,
+                                             assert_matches_rebuild):
+    listing_id, other = _active_ids(2)
+    response = client.post("/listings/mark-sold.json", json={
+        "listings": [{"id": listing_id, "price_gbp": 12_345}, other, 999_999],
+        "sold_at": "2026-03-01",
+    })
+    result = response.get_json()
+    assert (sorted(result["sold"]), result["skipped"]) == (sorted([listing_id, other]), [999_999])
+    record = PriceRecord.query.filter_by(notes=f"Listing #{listing_id} marked sold").one()
+    assert (record.price_gbp, record.sold_date.isoformat()) == (12_345, "2026-03-01")
+    assert_matches_rebuild()
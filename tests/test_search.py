@@ -0,0 +1,76 @@
+import pytest
+from app import db, search as search_module
+from app.models import Listing
+from app.search import fts5_query, search
+
+
+def _ids(hits, kind):
+    return [hit.id for hit in hits if hit.kind == kind]
+
+
+@pytest.fixture
+def like_backend(app, monkeypatch):
+    """Search as if SQLite had no FTS5 tables."""
+    monkeypatch.setitem(search_module._backends, db.engine.url, "like")
+
+
+def test_fts5_query_quotes_user_input():
+    assert fts5_query("kugelfischer") == '"kugelfischer"'
+    assert fts5_query('tii "round tail" -rust') == '"tii" "round tail" NOT "rust"'
+    assert fts5_query("restor*") == '"restor"*'
+    assert fts5_query('AND ( ) "') == '"AND"'
+    assert fts5_query('( ) " *') is None
+    assert fts5_query("-rust") is None
+
+
+def test_fts5_search_ranks_and_highlights(app):
+    hits = search("kugelfischer")
+    assert {hit.kind for hit in hits} == {"registry", "listings"}
+    assert [hit.score for hit in hits] == sorted((hit.score for hit in hits), reverse=True)
+    assert all("<mark>" in hit.snippet for hit in hits)
+    assert [hit.kind for hit in search("recommissioning")] == ["registry"]
+    assert search("round tail", kinds=("listings",))
+    assert search('NEAR( "x" OR ) *') == []
+
+
+def test_fts5_index_follows_writes(app):
+    listing = Listing(variant_id=3, title="Zinnoberrot tii", description="Fresh import",
+                      price_gbp=30_000, source_site="ebay")
+    db.session.add(listing)
+    db.session.commit()
+    assert _ids(search("zinnoberrot"), "listings") == [listing.id]
+    listing.title = "Polaris tii"
+    db.session.commit()
+    assert search("zinnoberrot") == []
+    db.session.delete(listing)
+    db.session.commit()
+    assert search("polaris") == []
+
+
+def test_backend_is_probed_once_per_engine(app, monkeypatch):
+    probes = []
+    present = search_module._fts_tables_present
+    monkeypatch.setattr(search_module, "_fts_tables_present",
+                        lambda engine: probes.append(engine) or present(engine))
+    monkeypatch.delitem(search_module._backends, db.engine.url)
+    for _ in range(3):
+        search("recommissioning")
+    assert len(probes) == 1
+    assert search_module._backends[db.engine.url] == "fts5"
+
+
+def test_like_fallback_matches_every_word(like_backend):
+    hits = search("kugelfischer rebuilt")
+    assert hits and all(hit.score == 0.0 for hit in hits)
+    assert all("rebuilt" in hit.snippet.lower() for hit in hits)
+    assert [hit.kind for hit in search("recommissioning")] == ["registry"]
+    assert search("kugelfischer nonexistentword") == []
+    assert search("100%") == []
+    assert _ids(search("round tail", kinds=("listings",)), "listings")
+
+
+def test_search_json_route(client):
+    body = client.get("/search.json?q=kugelfischer&kind=registry").get_json()
+    assert body["query"] == "kugelfischer" and body["results"]
+    assert {hit["kind"] for hit in body["results"]} == {"registry"}
+    assert client.get("/search?q=%22").status_code == 200
@@ -0,0 +1,65 @@
+import random
+from bisect import bisect_left, bisect_right
+
+import pytest
+from app.sketch import TDigest, merge_all
+
+QUANTILES = (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99)
+
+
+def _prices(n, seed=2):
+    rng = random.Random(seed)
+    return [round(rng.lognormvariate(9.6, 0.5)) for _ in range(n)]
+
+
+def _rank_error(ordered, value, q):
+    """Distance between ``q`` and the nearest rank ``value`` holds in ``ordered``."""
+    lo = bisect_left(ordered, value) / len(ordered)
+    hi = bisect_right(ordered, value) / len(ordered)
+    return 0.0 if lo <= q <= hi else min(abs(q - lo), abs(q - hi))
+
+
+@pytest.mark.parametrize("compression", [50, 100])
+def test_quantiles_are_within_a_percent_of_rank(compression):
+    prices = _prices(20_000)
+    ordered = sorted(prices)
+    digest = TDigest(compression).update(prices)
+    assert len(digest) == len(prices)
+    assert (digest.min, digest.max) == (ordered[0], ordered[-1])
+    for q in QUANTILES:
+        assert _rank_error(ordered, digest.quantile(q), q) < 0.01, q
+    assert len(digest.to_bytes()) < 4096
+
+
+def test_merged_parts_match_one_digest():
+    prices = _prices(20_000, seed=7)
+    ordered = sorted(prices)
+    parts = [TDigest(50).update(prices[i::12]) for i in range(12)]
+    merged = merge_all(parts, 50)
+    assert len(merged) == len(prices)
+    assert (merged.min, merged.max) == (ordered[0], ordered[-1])
+    for q in QUANTILES:
+        assert _rank_error(ordered, merged.quantile(q), q) < 0.01, q
+
+    folded = TDigest(50)
+    for part in parts:
+        folded.merge(part)
+    assert len(folded) == len(prices)
+    assert abs(folded.median() - merged.median()) / merged.median() < 0.01
+    assert all(len(part) == len(prices[i::12]) for i, part in enumerate(parts))
+
+
+def test_round_trips_through_bytes():
+    digest = TDigest(100).update(_prices(5_000))
+    restored = TDigest.from_bytes(digest.to_bytes())
+    assert restored.compression == 100
+    assert len(restored) == len(digest)
+    assert [restored.quantile(q) for q in QUANTILES] == [digest.quantile(q) for q in QUANTILES]
+
+
+def test_small_and_empty_digests():
+    assert TDigest().median() is None
+    assert TDigest.from_bytes(b"").median() is None
+    assert TDigest().update([12_000]).median() == 12_000
+    assert TDigest().update([10_000, 20_000]).quantile(0) == 10_000
+    assert TDigest().update([10_000, 20_000]).quantile(1) == 20_000